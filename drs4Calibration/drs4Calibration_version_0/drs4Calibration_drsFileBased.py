@@ -10,11 +10,13 @@ import tempfile
 import shutil
 
 from joblib import Parallel, delayed
-from scipy.stats import linregress
 from tqdm import tqdm
 from astropy.io import fits
 from fact.credentials import create_factdb_engine
 
+from drs4Calibration.linearFit import calculate_linear_fit_values
+from drs4Calibration.h5pyTools import H5pyTableAppender, read_h5py_rows
+from drs4Calibration.temperatureArchive import open_temperature_archive
 import drs4Calibration.drs4Calibration_version_0.config as config
 from drs4Calibration.drs4Calibration_version_0.constants import NRCHID, NRTEMPSENSOR, DACfactor
 
@@ -84,9 +86,13 @@ def search_drs_files(drs_file_list_doc_path: str):
                 default=('/net/big-tank/POOL/' +
                          'projects/fact/drs4_calibration_data/'),
                 type=click.Path(exists=True))
+@click.option('--temperature_archive_path', '-t',
+              default=None,
+              type=click.Path(exists=True),
+              help='Temperature archive used instead of the nightly temperature files')
 ###############################################################################
 def store_drs_attributes(drs_file_list_doc_path: str, store_file_path: str,
-                         source_folder_path: str):
+                         source_folder_path: str, temperature_archive_path: str):
     '''
         Save Baseline, Gain and TriggerOffset from all drsfiles
         of the given drsFileList together with the Temperature and
@@ -100,6 +106,9 @@ def store_drs_attributes(drs_file_list_doc_path: str, store_file_path: str,
             source_folder_path (str):
                 Path to the raw- and aux-folder containing
                 the drs- and temperature-files
+            temperature_archive_path (str):
+                Optional full path to a with 'store_temperature_archive'
+                created '.h5' file, which replace the nightly temperature files
     '''
     print('store')
     logging.basicConfig(
@@ -142,41 +151,47 @@ def store_drs_attributes(drs_file_list_doc_path: str, store_file_path: str,
     # in the case it is impossible to to collect all needed attributes
     # we will continue with the next drsFile
 
-    drs_file_list = open(drs_file_list_doc_path).read().splitlines()
-    for drs_file_path in tqdm(drs_file_list):
-
-        date_path_part = drs_file_path.split('_')[0]
-
-        drs_file_path = (source_folder_path+'raw/' +
-                         drs_file_path.strip('\n'))
-        temp_file_path = (source_folder_path+'aux/' +
-                          date_path_part+'.FAD_CONTROL_TEMPERATURE.fits')
-
-        if(os.path.isfile(drs_file_path) and os.path.isfile(temp_file_path)):
-            try:
-                save_tuple_of_attribute_if_possible(
-                    temp_file_path, drs_file_path,
-                    store_file_path)
-            except Exception as exc:
+    # the store-file stays open and the rows are written chunkwise,
+    # the appender trims the datasets to the written rows also after an exception
+    with h5py.File(store_file_path, 'r+') as store, \
+            H5pyTableAppender(store, list(store.keys())) as table_appender:
+
+        drs_file_list = open(drs_file_list_doc_path).read().splitlines()
+        for drs_file_path in tqdm(drs_file_list):
+
+            date_path_part = drs_file_path.split('_')[0]
+
+            drs_file_path = (source_folder_path+'raw/' +
+                             drs_file_path.strip('\n'))
+            temp_file_path = (source_folder_path+'aux/' +
+                              date_path_part+'.FAD_CONTROL_TEMPERATURE.fits')
+
+            if(os.path.isfile(drs_file_path) and
+               (temperature_archive_path is not None or os.path.isfile(temp_file_path))):
+                try:
+                    save_tuple_of_attribute_if_possible(
+                        temp_file_path, drs_file_path,
+                        table_appender, temperature_archive_path)
+                except Exception as exc:
+                    drs_filename = drs_file_path.split('/')[-1]
+                    temp_filename = temp_file_path.split('/')[-1]
+                    logging.info('In drs file ''+drs_filename+''' +
+                                 ' or temp file ''+temp_filename+'': '+str(exc))
+            else:
                 drs_filename = drs_file_path.split('/')[-1]
                 temp_filename = temp_file_path.split('/')[-1]
-                logging.info('In drs file ''+drs_filename+''' +
-                             ' or temp file ''+temp_filename+'': '+str(exc))
-        else:
-            drs_filename = drs_file_path.split('/')[-1]
-            temp_filename = temp_file_path.split('/')[-1]
-            logging.info(" Pair of drs file '"+drs_filename+"'" +
-                         " and temp file '"+temp_filename+"' does not exist")
+                logging.info(" Pair of drs file '"+drs_filename+"'" +
+                             " and temp file '"+temp_filename+"' does not exist")
 
     # add creationDate to h5 file
-    creation_date_str = pd.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with h5py.File(store_file_path) as store:
+    creation_date_str = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    with h5py.File(store_file_path, 'r+') as store:
         store.attrs['CreationDate'] = creation_date_str
 
 
 ###############################################################################
 def save_tuple_of_attribute_if_possible(temp_file_path, drs_file_path,
-                                        store_file_path):
+                                        table_appender, temperature_archive_path=None):
     drs_value_types = config.drsValueTypes
     renamed_drs_value_types = config.renamedDrsValueTypes
     with fits.open(drs_file_path,
@@ -195,9 +210,14 @@ def save_tuple_of_attribute_if_possible(temp_file_path, drs_file_path,
                                pd.to_datetime(header['RUN'+str(i)+'-END'])
                               ))
 
-    temp_and_time_pairs = get_temp_and_time_pairs_per_drs_value_type(
-                            temp_file_path,
-                            run_times_list)
+    if temperature_archive_path is None:
+        temp_and_time_pairs = get_temp_and_time_pairs_per_drs_value_type(
+                                temp_file_path,
+                                run_times_list)
+    else:
+        temp_and_time_pairs = get_temp_and_time_pairs_from_archive(
+                                temperature_archive_path,
+                                run_times_list)
 
     drs_value_mean = []
     drs_value_mean_var = []
@@ -205,31 +225,14 @@ def save_tuple_of_attribute_if_possible(temp_file_path, drs_file_path,
         drs_value_mean.append(bintable[drs_value_type+'Mean'][0])
         drs_value_mean_var.append(bintable[drs_value_type+'Rms'][0])
 
-    with h5py.File(store_file_path) as h5pyTable:
-        for i in range(len(renamed_drs_value_types)):
-            add_value_to_h5py_table(
-                h5pyTable,
-                'Time'+renamed_drs_value_types[i],
-                temp_and_time_pairs[i]['time_mean'])
-            add_value_to_h5py_table(
-                h5pyTable,
-                'Temp'+renamed_drs_value_types[i],
-                temp_and_time_pairs[i]['temp_mean'])
-            add_value_to_h5py_table(
-                h5pyTable,
-                renamed_drs_value_types[i],
-                drs_value_mean[i])
-            add_value_to_h5py_table(
-                h5pyTable,
-                renamed_drs_value_types[i]+'Var',
-                drs_value_mean_var[i])
-
-
-###############################################################################
-def add_value_to_h5py_table(h5pyTable, columnName, value):
-    data = h5pyTable[columnName]
-    data.resize((len(data)+1, data.maxshape[1]))
-    data[len(data)-1, :] = value
+    # all values of the drs file are added at once
+    row = {}
+    for i in range(len(renamed_drs_value_types)):
+        row['Time'+renamed_drs_value_types[i]] = temp_and_time_pairs[i]['time_mean']
+        row['Temp'+renamed_drs_value_types[i]] = temp_and_time_pairs[i]['temp_mean']
+        row[renamed_drs_value_types[i]] = drs_value_mean[i]
+        row[renamed_drs_value_types[i]+'Var'] = drs_value_mean_var[i]
+    table_appender.append(row)
 
 
 ###############################################################################
@@ -302,6 +305,24 @@ def get_temp_and_time_pairs_per_drs_value_type(temp_path, run_times_list):
     return results
 
 
+###############################################################################
+def get_temp_and_time_pairs_from_archive(temperature_archive_path, run_times_list):
+    '''
+    Like 'get_temp_and_time_pairs_per_drs_value_type', but take the
+    mean of 'time' and 'temp' from the temperature archive.
+    '''
+
+    temperature_archive = open_temperature_archive(temperature_archive_path)
+    time_means, temp_means = temperature_archive.get_window_means(run_times_list)
+
+    results = []
+    for time_mean, temp_mean in zip(time_means, temp_means):
+        results.append(dict(time_mean=np.array([time_mean], dtype='float32'),
+                            temp_mean=temp_mean))
+
+    return results
+
+
 ###############################################################################
 @click.command()
 @click.argument('source_file_path',
@@ -438,7 +459,7 @@ def getIndiceMask(source_file_path, drs_value_type,
                   interval_indices, cut_off_error_factor):
 
     with h5py.File(source_file_path, 'r') as data_source:
-        drs_value_var_array = data_source[drs_value_type+'Var'][interval_indices, :]
+        drs_value_var_array = read_h5py_rows(data_source[drs_value_type+'Var'], interval_indices)
 
     NRCELLSPERCHID = config.nrCellsPerChid[drs_value_type]
     indiceMask = np.full(
@@ -572,8 +593,10 @@ def calculate_fit_values(source_file_path: str, interval_file_path: str,
             with h5py.File(source_file_path, 'r') as data_source:
                 pool(delayed(fit)(
                      chunk,
-                     data_source['Temp'+drs_value_type][interval_indices, int(pice_nr)],
-                     data_source[drs_value_type][interval_indices, pice_nr*chunk:(pice_nr+1)*chunk],
+                     read_h5py_rows(data_source['Temp'+drs_value_type],
+                                    interval_indices, int(pice_nr)),
+                     read_h5py_rows(data_source[drs_value_type], interval_indices,
+                                    slice(pice_nr*chunk, (pice_nr+1)*chunk)),
                      mask[:, pice_nr*chunk:(pice_nr+1)*chunk],
                      np.memmap(memmap_paths_slope, mode='r+',
                                shape=chunk, dtype='float32',
@@ -690,33 +713,19 @@ def check_dependency(source_file_path: str, interval_file_path: str):
 ###############################################################################
 def fit(indice_range, temperature, drs_value_array, mask,
         slope_array, offset_array, residual_mean_array):
-    for index in range(indice_range):
-        sub_mask = mask[:, index]
-        temp = temperature[sub_mask]
-        value = drs_value_array[:, index][sub_mask]
-
-        # catch RuntimeWarning: invalid value encountered in double_scalars
-        with np.errstate(invalid='raise'):
-            try:
-                slope, offset, r_value, p_value, var_err = linregress(temp, value)
-
-                slope_array[index] = slope
-                offset_array[index] = offset
-
-                model_value = slope*temp + offset
-                residual = value - model_value
+    slope, offset, residual_mean = calculate_linear_fit_values(
+                                        temperature, drs_value_array, mask)
 
-                residual_mean_array[index] = np.mean(abs(residual))
-            except Exception as err_infos:
-                error_str = str(err_infos)
-                logging.error(index, drs_value_array[:, index], error_str)
+    slope_array[:indice_range] = slope
+    offset_array[:indice_range] = offset
+    residual_mean_array[:indice_range] = residual_mean
 
-            finally:
-                # dont trust the Garbage Collector, so force to free memory
-                del sub_mask
-                del temp
-                del value
+    nr_of_failed_fits = np.count_nonzero(np.isnan(slope))
+    if(nr_of_failed_fits > 0):
+        logging.error(' No fit possible for {} of {} cells'.format(
+                        nr_of_failed_fits, indice_range))
 
+    # dont trust the Garbage Collector, so force to free memory
     del temperature
     del drs_value_array
     del mask
@@ -21,6 +21,8 @@ from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.colors as colors
 from matplotlib.cm import hot, seismic
 
+from drs4Calibration.h5pyTools import read_h5py_rows
+
 import config as config
 from constants import NRCHID, NRCELL, PEAFACTOR, DACfactor
 
@@ -153,9 +155,9 @@ def general_drs_value_cell_(data_collection_file_path, store_file_path,
     time = time[indices]
     datetime = datetime[indices]
     with h5py.File(data_collection_file_path, 'r') as store:
-        temp = np.array(store['Temp'+drs_value_type][indices, int(chid/9)])
-        drs_value = np.array(store[drs_value_type][indices, value_index])
-        drs_value_std = np.sqrt(np.array(store[drs_value_type+'Var'][indices, value_index]))
+        temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], indices, int(chid/9)))
+        drs_value = np.array(read_h5py_rows(store[drs_value_type], indices, value_index))
+        drs_value_std = np.sqrt(np.array(read_h5py_rows(store[drs_value_type+'Var'], indices, value_index)))
 
     if(drs_value_type == 'Gain'):
         drs_value /= DACfactor
@@ -274,8 +276,8 @@ def general_drs_value_cell_residual_(data_collection_file_path, store_file_path,
     datetime = datetime[indices]
 
     with h5py.File(data_collection_file_path, 'r') as store:
-        temp = np.array(store['Temp'+drs_value_type][indices, int(chid/9)])
-        drs_value = np.array(store[drs_value_type][indices, value_index])
+        temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], indices, int(chid/9)))
+        drs_value = np.array(read_h5py_rows(store[drs_value_type], indices, value_index))
 
     ylabel_str = drs_value_type+r'residuen / $\mathrm{mV}$'
     if(drs_value_type == 'ROIOffset'):
@@ -362,7 +364,7 @@ def drs_value_std_hist_(data_collection_path, interval_file_path,
             interval_indices = np.array(data['IntervalIndices'])
         print('loading')
         with h5py.File(data_collection_path, 'r') as store:
-            drs_value_var = store[drs_value_type+'Var'][interval_indices, :]
+            drs_value_var = read_h5py_rows(store[drs_value_type+'Var'], interval_indices)
 
         useful_chids = get_useful_chids(interval_nr)  # , np.arange(8, 1439+1, 9))
         drs_value_var = drs_value_var.reshape(-1, NRCHID, NRCELLSPERCHID)[:, useful_chids, :].flatten()
@@ -481,7 +483,7 @@ def drs_value_std_hist_per_chid_cell_(data_collection_path, interval_file_path,
             interval_indices = np.array(data['IntervalIndices'])
         print('loading')
         with h5py.File(data_collection_path, 'r') as store:
-            drs_value_var = store[drs_value_type+'Var'][interval_indices, value_index]
+            drs_value_var = read_h5py_rows(store[drs_value_type+'Var'], interval_indices, value_index)
             drs_value_std = np.sqrt(drs_value_var)
 
         if(drs_value_type == 'Gain'):
@@ -616,8 +618,8 @@ def drs_value_cell_(data_collection_path, interval_file_path, fit_file_path_arra
                 mask = np.array(data[drs_value_type+'Mask'])
                 mask_collection.append(mask)
         with h5py.File(data_collection_path, 'r') as store:
-            temp = np.array(store['Temp'+drs_value_type][interval_indices, int(chid/9)])
-            drs_value = np.array(store[drs_value_type][interval_indices, value_index])
+            temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9)))
+            drs_value = np.array(read_h5py_rows(store[drs_value_type], interval_indices, value_index))
 
         with fits.open(fit_file_path_array[np.where(np.array(interval_array) == interval_nr)[0][0]], ignoremissing=True, ignore_missing_end=True) as fit_value_tab:
             data = fit_value_tab['FitParameter'].data
@@ -1133,9 +1135,9 @@ def worst_cell_collection_selected_by_residual_(
             #print('Chid: ', chid, 'Cell: ', cell, 'Residual: ', residual)
             mask = np.array(interval_source[drs_value_type+'Mask'][:, value_index])
             with h5py.File(data_collection_path, 'r') as store:
-                time = np.array(store['Time'+drs_value_type][interval_indices, :]).flatten()
-                temp = store['Temp'+drs_value_type][interval_indices, int(chid/9)]
-                drs_value = store[drs_value_type][interval_indices, value_index]
+                time = np.array(read_h5py_rows(store['Time'+drs_value_type], interval_indices)).flatten()
+                temp = read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9))
+                drs_value = read_h5py_rows(store[drs_value_type], interval_indices, value_index)
 
             if(drs_value_type == 'Gain'):
                 drs_value /= DACfactor
@@ -1495,9 +1497,9 @@ def chid_cell_drs_values_time(data_collection_path, interval_file_path,
                 mask = np.array(data[drs_value_type+'Mask'][:, value_index])
                 mask_collection.append(mask)
         with h5py.File(data_collection_path, 'r') as store:
-            temp = np.array(store['Temp'+drs_value_type][interval_indices, int(chid/9)])
-            drs_value = np.array(store[drs_value_type][interval_indices, value_index])
-            drs_value_var = np.array(store[drs_value_type+'Std'][interval_indices, value_index])
+            temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9)))
+            drs_value = np.array(read_h5py_rows(store[drs_value_type], interval_indices, value_index))
+            drs_value_var = np.array(read_h5py_rows(store[drs_value_type+'Std'], interval_indices, value_index))
 
         time_interval = pd.to_datetime(time[interval_indices] * 24 * 3600 * 1e9)
         time_collection.append(time_interval)
@@ -4,12 +4,13 @@ from drs4Calibration.drs4Calibration_version_1.constants import NRCHID, NRCELL,
 # data_collection .h5 stuff
 class data_collection_config:
 
-    column_names = ['TimeBaseline', 'TempBaseline', 'Baseline',
+    column_names = ['TimeBaseline', 'TempBaseline', 'Baseline', 'BaselineStd',
                     'TimeGain', 'TempGain', 'Gain', 'GainStd']
 
     column_dtype = {'TimeBaseline': 'float32',
                     'TempBaseline': 'float32',
                     'Baseline': 'float32',
+                    'BaselineStd': 'float16',
                     'TimeGain': 'float32',
                     'TempGain': 'float32',
                     'Gain': 'float32',
@@ -18,11 +19,23 @@ class data_collection_config:
     column_length = {'TimeBaseline': 1,
                      'TempBaseline': NRTEMPSENSOR,
                      'Baseline': NRCHID*NRCELL*ROI,
+                     'BaselineStd': NRCHID*NRCELL,
                      'TimeGain': 1,
                      'TempGain': NRTEMPSENSOR,
                      'Gain': NRCHID*NRCELL,
                      'GainStd': NRCHID*NRCELL}
 
+    # Optional compact encoding of the stored values, the values are decoded
+    # on read (see 'h5pyTools.encode_values'). None: stored with the column_dtype
+    #   ('float16',): max relative error of 2^-11
+    #   ('scaled_int16', scale): int16 offsets from the mean of the cell,
+    #       max error scale/2 (just for columns with values per cell)
+    #   ('quantized', max_error): rounded to a power of two step,
+    #       max error of at most max_error, better compression
+    # for example {'Baseline': ('scaled_int16', 1/64), 'Gain': ('quantized', 0.01)}
+    column_encoding = {'Baseline': None,
+                       'Gain': None}
+
 
 class fit_value_config:
 
@@ -39,14 +52,13 @@ class fit_value_config:
         hardware_boundaries = (['2014-05-20 12',
                                 '2015-05-26 12'])
 
-        # There are two reasons for calculate no mask for Baseline values.
-        # 1. No sufficient standard deviation of the Baseline mean exist.
-        # 2. Baseline mask does not fit in ram.
-
-        # All Gain-values with a larger error (std dev of the mean)
+        # All Baseline- and Gain-values with a larger error (std dev of the mean)
         # than the 'CutOffErrorFactor' multiplied with the mean of the error
-        # from all collected Gain-values for one capacitor will not used for the fit
-        cut_off_error_factor = {'Gain': 2}
+        # from all collected values for one capacitor will not used for the fit.
+        # Baseline-values without error (less than two events of the
+        # start cell) are always used.
+        cut_off_error_factor = {'Baseline': 2,
+                                'Gain': 2}
 
     drs_values_per_cell = {'Baseline': ROI,
                            'Gain': 1}
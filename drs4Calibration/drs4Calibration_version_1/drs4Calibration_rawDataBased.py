@@ -5,24 +5,36 @@ import h5py
 import os
 import logging
 import gc
-from zfits import FactFits
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, parallel_backend
 
 from tqdm import tqdm
 
-from scipy.stats import linregress
 import multiprocessing
 
 from astropy.io import fits
-from fact.credentials import create_factdb_engine
+from drs4Calibration.linearFit import calculate_linear_fit_values, calculate_linear_fit_values_from_sums
+from drs4Calibration.h5pyTools import (
+    H5pyTableAppender, get_nr_of_rows, trim_h5py_dataset, read_h5py_rows,
+    create_bit_packed_mask, write_bit_packed_mask, read_bit_packed_mask,
+    CompressedRow, get_chunk_encoding, compress_h5py_row, compress_h5py_row_pieces,
+    write_compressed_row, get_encoded_dtype, set_encoding_attrs, encode_values)
+from drs4Calibration.sharedArray import SharedArray, ScratchArray
+from drs4Calibration.fitsTools import StreamingBinTableWriter, verify_checksums
+from drs4Calibration.temperatureArchive import open_temperature_archive
 from drs4Calibration.drs4Calibration_version_1.config import data_collection_config, fit_value_config
 from drs4Calibration.drs4Calibration_version_1.constants import NRCHID, NRCELL, ROI, NRTEMPSENSOR, DACfactor
+from drs4Calibration.drs4Calibration_version_1.eventAccumulator import (
+    iterate_event_blocks, StartCellSumAccumulator, RolledMeanVarAccumulator)
+from drs4Calibration.drs4Calibration_version_1.fitParameterMap import export_fit_parameter_map
+from drs4Calibration.drs4Calibration_version_1.fitScheduler import get_fit_task_plan, FitCheckpoint
+from drs4Calibration.drs4Calibration_version_1.fitStatistics import (
+    update_fit_statistics_file, read_fit_statistics,
+    store_cumulative_fit_sums, get_cumulative_fit_sums_bytes, read_window_fit_sums)
 
-import tempfile
-import shutil
-
-import sys
 
+# the chunks of the interval sorted copy divide the drs values
+# of every temperature sensor into this number of column pieces
+nr_of_fit_pieces_per_temp_sensor = 12
 
 ###############################################################################
 ###############################################################################
@@ -43,6 +55,8 @@ def search_drs_run_files(list_of_needed_files_doc_path: str):
                 Full path to the storeFile
                 with the extension '.txt'
     '''
+    # just needed here, the other stages run without the fact package
+    from fact.credentials import create_factdb_engine
 
     db_table = pd.read_sql(
                    'RunInfo',
@@ -142,11 +156,29 @@ def search_drs_run_files(list_of_needed_files_doc_path: str):
                 type=click.Path(exists=False))
 @click.argument('jobs',
                 default=15)
+@click.option('--queue_size', '-q',
+              default=2,
+              help='Max number of decoded run series waiting for the writer')
+@click.option('--temperature_archive_path', '-t',
+              default=None,
+              type=click.Path(exists=True),
+              help='Temperature archive used instead of the nightly temperature files')
+@click.option('--incremental', '-i',
+              is_flag=True,
+              help='Just add new or changed run series to an existing store-file')
+@click.option('--fit_statistics_path', '-s',
+              default=None,
+              type=click.Path(exists=False),
+              help='Statistics file of the linear fits, updated with the new rows')
 ###############################################################################
 def store_drs_attributes(list_of_needed_files_doc_path: str,
                          store_file_path: str,
                          source_folder_path: str,
-                         jobs: int):
+                         jobs: int,
+                         queue_size: int,
+                         temperature_archive_path: str,
+                         incremental: bool,
+                         fit_statistics_path: str):
     '''
         Calculate and store Baseline and Gain from all drs pedestal runs
         of the given 'list_of_needed_files' together with the Temperature and
@@ -157,6 +189,10 @@ def store_drs_attributes(list_of_needed_files_doc_path: str,
         Given by the used 16 Bit DAC with 2.5V range, and the
         input of 50000 DAC-counts and the 12 Bit ADC with 2.0V range.
         Note: The value Pairs are not stored ordered in time.
+        Every handled run serie is recorded in the 'RunSerieManifest' group
+        of the store-file together with the mtime and size of its files.
+        In the incremental mode just the run series missing in this record
+        or with changed files are handled, so an interrupted run can be resumed.
 
 
         Args:
@@ -168,72 +204,431 @@ def store_drs_attributes(list_of_needed_files_doc_path: str,
                 Path to the raw- and aux-folder containing
                 the drs pedestal- and temperature-files
             jobs (int):
-                Number of processes
+                Number of worker processes decoding the run series.
+                With more than one job a single writer process appends
+                the results to the store-file
+            queue_size (int):
+                Max number of decoded run series waiting for the writer.
+                A full queue blocks the workers, so at most
+                jobs+queue_size run series (each up to 1.7 GB) are in memory
+            temperature_archive_path (str):
+                Optional full path to a with 'store_temperature_archive'
+                created '.h5' file, which replace the nightly temperature files
+            incremental (bool):
+                Keep an existing store-file and just add the new and
+                changed run series
+            fit_statistics_path (str):
+                Optional full path to the statistics file of the linear fits
+                (see 'update_fit_statistics'), which is created or updated
+                with the new rows of the store-file
     '''
 
-    column_names = data_collection_config.column_names
+    column_names = get_stored_column_names()
     column_dtype = data_collection_config.column_dtype
     column_length = data_collection_config.column_length
+    column_encoding = data_collection_config.column_encoding
 
-    # unable to give callback args like store_file_path
-    # therefore define method here
-    ############################################################
-    def store_result(result):
-        if len(result) == 0:
-            return
-
-        with h5py.File(store_file_path) as h5py_table:
-            for column_name in column_names:
-                add_value_to_h5py_table(
-                    h5py_table,
-                    column_name,
-                    result[column_name])
-    ############################################################
-
-    def raise_exception(error):
-        print(str(error))
-        raise Exception(str(error))
-    ############################################################
-    ############################################################
-
+    # an incremental run continues the log of the earlier runs
     logging.basicConfig(
-        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        filename=store_file_path.split('.')[0]+".log",
+        filemode='a' if incremental else 'w',
         format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
-    init_empty_h5_table(store_file_path, column_names, column_dtype, column_length)
-    pool = multiprocessing.Pool(processes=jobs)
+    if(incremental and os.path.isfile(store_file_path)):
+        check_column_encoding(store_file_path, column_encoding)
+        check_column_length(store_file_path, column_length)
+        run_serie_manifest = load_run_serie_manifest(store_file_path, column_names)
+    else:
+        init_empty_h5_table(store_file_path, data_collection_config.column_names,
+                            column_dtype, column_length, column_encoding)
+        run_serie_manifest = {}
 
     calibration_file_list = open(list_of_needed_files_doc_path).read().splitlines()
-    # main loop: tqdm dosen work with pool.apply_async
-    print(calibration_file_list[1100:][0])
-    for file_collection_of_the_day in calibration_file_list[1100:]:
+    run_serie_tasks = []
+    for file_collection_of_the_day in calibration_file_list:
         file_collection_of_the_day = file_collection_of_the_day.split('|')
 
         temperature_file_path = source_folder_path+file_collection_of_the_day[0]
 
-        if not os.path.isfile(temperature_file_path):
+        if(temperature_archive_path is None and
+           not os.path.isfile(temperature_file_path)):
             logging.info(' Temperature file not found: '+file_collection_of_the_day[0])
             continue
 
         for run_serie in file_collection_of_the_day[1:]:
             run_serie = run_serie.split(',')
-            handle_run_serie(run_serie, temperature_file_path, source_folder_path)
-
-            # pool.apply_async(handle_run_serie,
-            #                  args=(run_serie, temperature_file_path, source_folder_path),
-            #                  callback=store_result, error_callback=raise_exception)
-
-    pool.close()
-    pool.join()
+            signature = get_run_serie_signature(run_serie, source_folder_path)
+            # row -1: append the result as new row
+            row, stored_signature = run_serie_manifest.get(','.join(run_serie), (-1, None))
+            if(stored_signature is not None and np.array_equal(stored_signature, signature)):
+                continue
+            run_serie_tasks.append((run_serie, temperature_file_path, signature, row))
+
+    logging.info(' {} run series to handle'.format(len(run_serie_tasks)))
+
+    if(jobs > 1):
+        store_run_series_parallel(run_serie_tasks, store_file_path,
+                                  source_folder_path, jobs, queue_size,
+                                  temperature_archive_path)
+    else:
+        with h5py.File(store_file_path, 'r+') as h5py_table:
+            table_appender, manifest_appender = get_run_serie_appenders(h5py_table, column_names)
+            chunk_encodings = get_chunk_encodings(h5py_table, column_names)
+            for run_serie, temperature_file_path, signature, row in tqdm(run_serie_tasks):
+                result = handle_run_serie(run_serie, temperature_file_path,
+                                          source_folder_path, temperature_archive_path,
+                                          chunk_encodings)
+                store_run_serie_result(table_appender, manifest_appender, column_names,
+                                       run_serie, signature, row, result)
+            manifest_appender.close()
+            table_appender.close()
 
     # add creationDate to h5 file
-    creation_date_str = pd.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with h5py.File(store_file_path) as store:
+    creation_date_str = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    with h5py.File(store_file_path, 'r+') as store:
         store.attrs['CreationDate'] = creation_date_str
 
+    if fit_statistics_path is not None:
+        store_fit_statistics(store_file_path, fit_statistics_path)
+
+
+# ########################################################################### #
+def store_run_series_parallel(run_serie_tasks, store_file_path,
+                              source_folder_path, jobs, queue_size,
+                              temperature_archive_path=None):
+    '''
+        Decode the run series with 'jobs' worker processes and let
+        one writer process append the results to the store-file,
+        so there are never concurrent h5py writes.
+        The bounded result queue blocks the workers as long as the writer
+        is busy, this keeps the number of run series in memory bounded.
+        Rows of columns with one row per chunk are compressed by the workers
+        with the filters of the dataset, the writer stores them
+        with 'write_direct_chunk'.
+    '''
+
+    column_names = get_stored_column_names()
+    # the workers compress the rows of the columns with one row per chunk
+    # (Baseline and BaselineStd) themselves, the writer just stores the chunks
+    with h5py.File(store_file_path, 'r') as store:
+        chunk_encodings = get_chunk_encodings(store, column_names)
+
+    task_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue(maxsize=queue_size)
+    for task in run_serie_tasks:
+        task_queue.put(task)
+    for worker_nr in range(jobs):
+        task_queue.put(None)  # one stop signal per worker
+
+    writer = multiprocessing.Process(
+                target=write_run_serie_results,
+                args=(result_queue, store_file_path, column_names, jobs))
+    writer.start()
+    workers = [multiprocessing.Process(
+                target=handle_run_serie_tasks,
+                args=(task_queue, result_queue, source_folder_path,
+                      temperature_archive_path, chunk_encodings))
+               for worker_nr in range(jobs)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        # a dead writer would block the workers forever on the full queue
+        while writer.is_alive():
+            writer.join(timeout=10)
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                raise Exception('A run serie worker died unexpectedly')
+        if(writer.exitcode != 0):
+            raise Exception('The h5py writer process failed, exitcode: {}'.format(writer.exitcode))
+        for worker in workers:
+            worker.join()
+    finally:
+        for process in workers+[writer]:
+            if process.is_alive():
+                process.terminate()
+
+
+# ########################################################################### #
+def get_chunk_encodings(store, column_names):
+    '''
+        Return the chunk encodings (see 'get_chunk_encoding') of all columns
+        of the store with one row per chunk
+    '''
+    chunk_encodings = {column_name: get_chunk_encoding(store[column_name])
+                       for column_name in column_names}
+    return {column_name: chunk_encoding
+            for column_name, chunk_encoding in chunk_encodings.items()
+            if chunk_encoding is not None}
+
+
+# ########################################################################### #
+def handle_run_serie_tasks(task_queue, result_queue, source_folder_path,
+                           temperature_archive_path=None, chunk_encodings=None):
+    for run_serie, temperature_file_path, signature, row in iter(task_queue.get, None):
+        result = handle_run_serie(run_serie, temperature_file_path,
+                                  source_folder_path, temperature_archive_path,
+                                  chunk_encodings)
+        if(result and chunk_encodings is not None):
+            for column_name, chunk_encoding in chunk_encodings.items():
+                # the Baseline is already compressed piecewise
+                if not isinstance(result[column_name], CompressedRow):
+                    result[column_name] = compress_h5py_row(result[column_name], chunk_encoding)
+        # blocks while the queue is full
+        result_queue.put((run_serie, signature, row, result))
+    result_queue.put(None)
+
+
+# ########################################################################### #
+def write_run_serie_results(result_queue, store_file_path, column_names, nr_of_workers):
+    nr_of_finished_workers = 0
+    with h5py.File(store_file_path, 'r+') as h5py_table:
+        table_appender, manifest_appender = get_run_serie_appenders(h5py_table, column_names)
+        while nr_of_finished_workers < nr_of_workers:
+            run_serie_result = result_queue.get()
+            if run_serie_result is None:
+                nr_of_finished_workers += 1
+                continue
+            store_run_serie_result(table_appender, manifest_appender,
+                                   column_names, *run_serie_result)
+        manifest_appender.close()
+        table_appender.close()
+
+
+# ########################################################################### #
+def get_run_serie_appenders(h5py_table, column_names, max_nr_of_buffered_records=8):
+    '''
+        Return the appender of the drs value columns and of the manifest.
+        The manifest records are written at the latest after
+        'max_nr_of_buffered_records' run series and always after
+        the corresponding rows, so an interruption costs
+        at most this number of run series.
+    '''
+    table_appender = H5pyTableAppender(h5py_table, column_names)
+    manifest_appender = H5pyTableAppender(
+        h5py_table,
+        ['RunSerieManifest/RunSerie', 'RunSerieManifest/Signature', 'RunSerieManifest/Row'],
+        max_nr_of_buffered_rows=max_nr_of_buffered_records,
+        flush_before=table_appender)
+    return (table_appender, manifest_appender)
+
+
+# ########################################################################### #
+def store_run_serie_result(table_appender, manifest_appender, column_names,
+                           run_serie, signature, row, result):
+    '''
+        Append the result (or overwrite the given row of a changed run serie)
+        and record the run serie in the manifest afterwards.
+        Run series without result are recorded with the row -1,
+        so they are just handled again if their files change.
+        The stored row of a changed run serie without result is invalidated
+        with nan times (it is in no interval) and stays recorded,
+        so a later result overwrites it again.
+    '''
+    if(not result and row >= 0):
+        h5py_table = table_appender.h5py_table
+        for column_name in ['TimeBaseline', 'TimeGain']:
+            h5py_table[column_name][row, :] = np.nan
+        logging.info(' Invalidate the row {} of the run serie {}'.format(row, ','.join(run_serie)))
+    elif not result:
+        row = -1
+    elif(row < 0):
+        table_appender.append({column_name: result[column_name]
+                               for column_name in column_names})
+        row = table_appender.get_nr_of_rows(column_names[0])-1
+    else:
+        # rows of an earlier run, which are already stored
+        h5py_table = table_appender.h5py_table
+        for column_name in column_names:
+            if isinstance(result[column_name], CompressedRow):
+                write_compressed_row(h5py_table[column_name], row, result[column_name])
+            else:
+                h5py_table[column_name][row, :] = result[column_name]
+
+    manifest_appender.append({'RunSerieManifest/RunSerie': ','.join(run_serie),
+                              'RunSerieManifest/Signature': signature,
+                              'RunSerieManifest/Row': row})
+
+
+# ########################################################################### #
+def get_run_serie_signature(run_serie, source_folder_path):
+    '''mtime and size of every file of the run serie, (0, -1) for missing files'''
+    signature = []
+    for run_file in run_serie:
+        try:
+            file_stat = os.stat(source_folder_path+run_file)
+            signature += [file_stat.st_mtime, file_stat.st_size]
+        except OSError:
+            signature += [0., -1.]
+    return np.array(signature, dtype='float64')
+
+
+# ########################################################################### #
+def load_run_serie_manifest(store_file_path, column_names):
+    '''
+        Return the manifest of the store-file as dict
+        'run serie' -> (row, signature), later records overwrite earlier ones.
+        Rows written after the last manifest record (interrupted write)
+        are removed.
+    '''
+    with h5py.File(store_file_path, 'r+') as store:
+        manifest = store['RunSerieManifest']
+        nr_of_manifest_records = min(get_nr_of_rows(manifest[name])
+                                     for name in ['RunSerie', 'Signature', 'Row'])
+        for name in ['RunSerie', 'Signature', 'Row']:
+            trim_h5py_dataset(manifest[name], nr_of_manifest_records)
+        run_series = manifest['RunSerie'][:, 0]
+        signatures = manifest['Signature'][:]
+        rows = manifest['Row'][:, 0]
+
+        nr_of_rows = int(max(rows, default=-1))+1
+        for column_name in column_names:
+            nr_of_column_rows = get_nr_of_rows(store[column_name])
+            if(nr_of_column_rows > nr_of_rows):
+                logging.info(' Remove {} uncompleted rows of {}'.format(
+                                nr_of_column_rows-nr_of_rows, column_name))
+            trim_h5py_dataset(store[column_name], min(nr_of_column_rows, nr_of_rows))
+
+    run_serie_manifest = {}
+    for run_serie, signature, row in zip(run_series, signatures, rows):
+        if isinstance(run_serie, bytes):
+            run_serie = run_serie.decode()
+        run_serie_manifest[run_serie] = (int(row), signature)
+
+    return run_serie_manifest
+
+
+# ########################################################################### #
+def get_stored_column_names():
+    '''
+        Column names of the data collection together with
+        the reference columns of the 'scaled_int16' encoded columns
+    '''
+    column_names = list(data_collection_config.column_names)
+    for column_name in data_collection_config.column_names:
+        encoding = data_collection_config.column_encoding.get(column_name)
+        if(encoding is not None and encoding[0] == 'scaled_int16'):
+            column_names.append(column_name+'Reference')
+    return column_names
+
+
+# ########################################################################### #
+def get_values_per_cell(column_name, column_length):
+    length = column_length[column_name]
+    if(length % (NRCHID*NRCELL) != 0):
+        error_str = ("The column '"+column_name+"' has no values per cell " +
+                     "and can not be encoded with a cell reference")
+        raise Exception(error_str)
+    return length//(NRCHID*NRCELL)
+
+
+# ########################################################################### #
+def encode_run_serie_result(run_serie_result, encoded_column_names=()):
+    '''
+        Replace the values of all columns with an encoding of the
+        data_collection_config by their stored values (and references),
+        except the already encoded_column_names
+    '''
+    column_length = data_collection_config.column_length
+    for column_name, encoding in data_collection_config.column_encoding.items():
+        if(encoding is None or column_name in encoded_column_names):
+            continue
+        values_per_reference = 1
+        if(encoding[0] == 'scaled_int16'):
+            values_per_reference = get_values_per_cell(column_name, column_length)
+        stored_values, reference = encode_values(run_serie_result[column_name],
+                                                 encoding, values_per_reference)
+        run_serie_result[column_name] = stored_values
+        if reference is not None:
+            run_serie_result[column_name+'Reference'] = reference
+    return run_serie_result
+
+
+# ########################################################################### #
+def store_column_pieces(run_serie_result, column_name, column_pieces, chunk_encodings=None):
+    '''
+        Encode the consecutive pieces of the column like
+        'encode_run_serie_result' and store them into the run_serie_result.
+        With a chunk encoding of the column the pieces are compressed
+        one after the other (see 'compress_h5py_row_pieces'),
+        so the full row of the column is never in memory.
+    '''
+    encoding = data_collection_config.column_encoding.get(column_name)
+    values_per_reference = 1
+    if(encoding is not None and encoding[0] == 'scaled_int16'):
+        values_per_reference = get_values_per_cell(column_name,
+                                                   data_collection_config.column_length)
+    references = []
+    stored_pieces = iterate_encoded_pieces(column_pieces, encoding,
+                                           values_per_reference, references)
+    if(chunk_encodings is not None and column_name in chunk_encodings):
+        run_serie_result[column_name] = compress_h5py_row_pieces(
+                                            stored_pieces, chunk_encodings[column_name])
+    else:
+        run_serie_result[column_name] = np.concatenate(list(stored_pieces))
+    if references:
+        run_serie_result[column_name+'Reference'] = np.concatenate(references)
+
+
+# ########################################################################### #
+def iterate_encoded_pieces(column_pieces, encoding, values_per_reference, references):
+    '''
+        Yield the stored values of the pieces (see 'encode_values')
+        and collect their references into the references list
+    '''
+    for column_piece in column_pieces:
+        if encoding is None:
+            yield column_piece
+            continue
+        stored_values, reference = encode_values(column_piece, encoding, values_per_reference)
+        if reference is not None:
+            references.append(reference)
+        yield stored_values
+
+
+# ########################################################################### #
+def check_column_encoding(store_file_path, column_encoding):
+    '''
+        Raise an exception if the columns of the existing store-file
+        are not stored with the given encodings
+    '''
+    with h5py.File(store_file_path, 'r') as store:
+        for column_name in data_collection_config.column_names:
+            encoding = column_encoding.get(column_name)
+            attrs = store[column_name].attrs
+            stored_encoding = None
+            if 'Encoding' in attrs:
+                stored_encoding = (attrs['Encoding'], attrs['EncodingParameter'])
+            if(encoding is None and stored_encoding is None):
+                continue
+            if(encoding is None or stored_encoding is None or
+               encoding[0] != stored_encoding[0] or
+               (len(encoding) > 1 and encoding[1] != stored_encoding[1])):
+                error_str = ("The column '"+column_name+"' of the store-file " +
+                             "is stored with the encoding "+str(stored_encoding) +
+                             " instead of "+str(encoding))
+                raise Exception(error_str)
+
+
+# ########################################################################### #
+def check_column_length(store_file_path, column_length):
+    '''
+        Raise an exception if the columns of the existing store-file
+        have not the given lengths
+        (older store-files have a BaselineStd per ROI-sample)
+    '''
+    with h5py.File(store_file_path, 'r') as store:
+        for column_name in data_collection_config.column_names:
+            stored_length = store[column_name].shape[1]
+            if(stored_length != column_length[column_name]):
+                error_str = ("The column '"+column_name+"' of the store-file " +
+                             "has the length "+str(stored_length) +
+                             " instead of "+str(column_length[column_name]))
+                raise Exception(error_str)
+
 
 # ########################################################################### #
-def init_empty_h5_table(store_file_path, column_names, column_dtype, column_length):
+def init_empty_h5_table(store_file_path, column_names, column_dtype, column_length,
+                        column_encoding=None):
     with h5py.File(store_file_path, 'w') as store:
         comment_str = ("The stored gain is the unnormed difference " +
                        "between 'baseline' and 'headline' in ADC-counts " +
@@ -249,22 +644,45 @@ def init_empty_h5_table(store_file_path, column_names, column_dtype, column_leng
         for column_name in column_names:
             dtype = column_dtype[column_name]
             length = column_length[column_name]
-            store.create_dataset(
-                name=column_name, dtype=dtype,
+            encoding = None
+            if column_encoding is not None:
+                encoding = column_encoding.get(column_name)
+            dataset = store.create_dataset(
+                name=column_name, dtype=get_encoded_dtype(dtype, encoding),
                 shape=(0, length), maxshape=(None, length),
                 compression='gzip', compression_opts=5,
                 fletcher32=True)
+            if encoding is None:
+                continue
+
+            reference_name = None
+            values_per_reference = 1
+            if(encoding[0] == 'scaled_int16'):
+                reference_name = column_name+'Reference'
+                values_per_reference = get_values_per_cell(column_name, column_length)
+                store.create_dataset(
+                    name=reference_name, dtype='float32',
+                    shape=(0, length//values_per_reference),
+                    maxshape=(None, length//values_per_reference),
+                    compression='gzip', compression_opts=5,
+                    fletcher32=True)
+            set_encoding_attrs(dataset, encoding, dtype, reference_name, values_per_reference)
+
+        manifest = store.create_group('RunSerieManifest')
+        manifest.create_dataset(
+            name='RunSerie', dtype=h5py.special_dtype(vlen=str),
+            shape=(0, 1), maxshape=(None, 1))
+        manifest.create_dataset(
+            name='Signature', dtype='float64',
+            shape=(0, 6), maxshape=(None, 6))
+        manifest.create_dataset(
+            name='Row', dtype='int64',
+            shape=(0, 1), maxshape=(None, 1))
 
 
 # ########################################################################### #
-def add_value_to_h5py_table(h5py_table, column_name, value):
-    data = h5py_table[column_name]
-    data.resize((len(data)+1, data.maxshape[1]))
-    data[len(data)-1, :] = value
-
-
-# ########################################################################### #
-def handle_run_serie(run_serie, temperature_file_path, source_folder_path):
+def handle_run_serie(run_serie, temperature_file_path, source_folder_path,
+                     temperature_archive_path=None, chunk_encodings=None):
     try:
         run_serie_result = {}
         pedestal_run0_path = source_folder_path+run_serie[0]
@@ -280,8 +698,14 @@ def handle_run_serie(run_serie, temperature_file_path, source_folder_path):
             logging.info(info_str)
             return run_serie_result
 
-        print('GO ', temperature_file_path.split('/')[-1].split('.')[0])
+        logging.info(' Run serie of files [' +
+                     run_serie[0]+', ' +
+                     run_serie[1]+', ' +
+                     run_serie[2]+'] with temperatures of ' +
+                     temperature_file_path.split('/')[-1].split('.')[0])
 
+        # just needed here, the other stages run without zfits
+        from zfits import FactFits
         fits_stream_run0 = FactFits(pedestal_run0_path)
         fits_stream_run1 = FactFits(pedestal_run1_path)
         fits_stream_run2 = FactFits(pedestal_run2_path)
@@ -305,16 +729,24 @@ def handle_run_serie(run_serie, temperature_file_path, source_folder_path):
         run_beg_baseline1024 = pd.to_datetime(fits_stream_run0.header()['DATE-OBS'])
         run_end_headline1024 = pd.to_datetime(fits_stream_run1.header()['DATE-END'])
 
-        temp_time_collection = get_mean_of_temp_and_time(
-                                    temperature_file_path,
-                                    [[run_beg_baseline300, run_end_baseline300],
-                                     [run_beg_baseline1024, run_end_headline1024]]
-                                )
+        run_duration = [[run_beg_baseline300, run_end_baseline300],
+                        [run_beg_baseline1024, run_end_headline1024]]
+        if temperature_archive_path is None:
+            temp_time_collection = get_mean_of_temp_and_time(
+                                        temperature_file_path, run_duration)
+        else:
+            temp_time_collection = get_mean_of_temp_and_time_from_archive(
+                                        temperature_archive_path, run_duration)
 
         run_serie_result['TimeBaseline'] = temp_time_collection['run_0']['time']
         run_serie_result['TempBaseline'] = temp_time_collection['run_0']['temperature']
 
-        run_serie_result['Baseline'] = get_mean_for_ROI_300(fits_stream_run2)
+        baseline300_mean_per_chid, baseline300_std = get_mean_and_std_for_ROI_300(fits_stream_run2)
+        # chidwise, with a chunk encoding the full Baseline row is never in memory
+        store_column_pieces(run_serie_result, 'Baseline', baseline300_mean_per_chid,
+                            chunk_encodings)
+        # already float16, so without a copy
+        run_serie_result['BaselineStd'] = baseline300_std
 
         run_serie_result['TimeGain'] = temp_time_collection['run_1']['time']
         run_serie_result['TempGain'] = temp_time_collection['run_1']['temperature']
@@ -324,12 +756,8 @@ def handle_run_serie(run_serie, temperature_file_path, source_folder_path):
 
         run_serie_result['Gain'] = np.subtract(headline1024_mean, baseline1024_mean)
         # error propagation f = a-b
-        print('baseline1024_mean: ', baseline1024_mean)
-        print(np.mean(headline1024_std), np.mean(baseline1024_std))
-        print(np.mean(np.sqrt(pow(headline1024_std, 2) + pow(baseline1024_std, 2))))
         run_serie_result['GainStd'] = np.sqrt(pow(headline1024_std, 2) + pow(baseline1024_std, 2)).astype('float16')
-        sys.quit()
-        return run_serie_result
+        return encode_run_serie_result(run_serie_result, encoded_column_names=['Baseline'])
 
     except Exception as error:
         logging.error(str(error))
@@ -402,74 +830,40 @@ def get_mean_of_temp_and_time(temperature_file_path, run_duration):
     return temp_time_collection
 
 
-# TODO check int faster than uint
 # ########################################################################### #
-def get_mean_for_ROI_300(fits_stream):
+def get_mean_of_temp_and_time_from_archive(temperature_archive_path, run_duration):
+    temperature_archive = open_temperature_archive(temperature_archive_path)
+    time_mean, temperature_mean = temperature_archive.get_window_means(run_duration)
+
+    temp_time_collection = {}
+    for run_nr in range(len(run_duration)):
+        temp_time_collection['run_'+str(run_nr)] = {
+            'temperature': temperature_mean[run_nr],
+            'time': np.float32(time_mean[run_nr])}
+
+    return temp_time_collection
+
+
+# ########################################################################### #
+def get_mean_and_std_for_ROI_300(fits_stream, nr_of_events_per_block=32):
     # sum up for ints is faster than building the running-mean
-    value_sum = np.zeros((NRCHID*NRCELL, ROI), dtype='int32')
-    chid_array_offset = np.linspace(0, (NRCHID-1)*NRCELL, NRCHID, dtype='int32')
-    start_cell_index = np.zeros((NRCHID), dtype='int32')
-    count = np.zeros((NRCHID*NRCELL), dtype='int32')
-    for event in fits_stream:
-        start_cell = event['StartCellData'].astype('int32')
-        data = event['Data'].astype('int32')
-
-        np.add(start_cell, chid_array_offset, out=start_cell_index, dtype='int32')
-        count[start_cell_index] += 1
-        value_sum[start_cell_index] = np.add(value_sum[start_cell_index], data, dtype='int32')
-
-    # np.seterr: ignore divide by 0 (count=0)
-    # mean_values[count==0] will automatic set to nan from divide
-    np.seterr(invalid='ignore')
-    mean_values = np.divide(value_sum.astype('float64'), count[:, None].astype('float64'), dtype='float64')
-
-    return mean_values.reshape(-1)
-
-
-# ########################################################################### #
-def get_mean_and_std_for_ROI_1024(fits_stream):
-    dtype_data = 'float64'  # float64 will return the exact values
-    mean_values = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-    var_values = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-
-    delta = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-    delta_new = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-    diff = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-    prod = np.zeros((NRCHID, NRCELL), dtype=dtype_data)
-
-    indices = np.zeros((NRCHID, NRCELL), dtype='int16')
-
-    cell_indices = np.arange(NRCELL, dtype='int16')
-    chid_indices = np.arange(NRCHID, dtype='int16')[:, None]
-
-    count = 0
-    for event in fits_stream:
-        all_ = []
-        start_cell = event['StartCellData'][:, None].astype('int16')
-        # subtract because we have to go the StartCell back
-        np.subtract(cell_indices, start_cell, out=indices, dtype='int16')
-        np.mod(indices, NRCELL, out=indices, dtype='int16')
-        # rolle values for every row about the start_cell offset
-        data = event['Data'][chid_indices, indices]
-        all_.append(data)
-        count += 1
-        # calculate running mean
-        np.subtract(data, mean_values, out=delta, dtype=dtype_data)
-        np.divide(delta, count, out=diff, dtype=dtype_data)
-        np.add(mean_values, diff, out=mean_values, dtype=dtype_data)
-        #print(np.mean(diff))
-        # calculate running var
-        #print("var: ",var_values[0][0])
-        np.subtract(data, mean_values, out=delta_new, dtype=dtype_data)
-        np.multiply(delta, delta_new, out=prod, dtype=dtype_data)
-        #print(delta[0][0], delta_new[0][0], "\n delta: ", delta[0][0]*delta_new[0][0], prod[0][0])
-        np.add(var_values, prod, out=var_values, dtype=dtype_data)
-
-    var_values = var_values/(count-1)
-    print(np.mean(np.array(all_).flatten()), np.mean(mean_values.reshape(-1)))
-    print(np.var(np.array(all_).flatten()), np.mean(var_values.flatten()))
-    print(np.std(np.array(all_).flatten()), np.mean(np.sqrt(var_values/(count-1)).flatten()))
-    return (mean_values.reshape(-1), np.sqrt(var_values/(count-1)).reshape(-1))
+    accumulator = StartCellSumAccumulator(ROI, with_std=True)
+    for start_cells, data in iterate_event_blocks(fits_stream, nr_of_events_per_block):
+        accumulator.add_events(start_cells, data)
+
+    # mean_values[count==0] will automatic set to nan from divide,
+    # the means are yielded chidwise (see 'StartCellSumAccumulator.iterate_mean')
+    return (accumulator.iterate_mean(), accumulator.get_std())
+
+
+# ########################################################################### #
+def get_mean_and_std_for_ROI_1024(fits_stream, nr_of_events_per_block=8):
+    # float64 will return the exact values
+    accumulator = RolledMeanVarAccumulator()
+    for start_cells, data in iterate_event_blocks(fits_stream, nr_of_events_per_block):
+        accumulator.add_events(start_cells, data)
+
+    return accumulator.get_mean_and_std()
 
 
 ###############################################################################
@@ -495,12 +889,11 @@ def store_source_based_interval_indices(source_file_path: str,
     The result for every drs_value_type should be the same.
     H5py cant shuffle data with unsorted(not increasing number) indices,
     therfore the interval-indices will not sort the drs-value data.
-    Also save for the drs_value_type Gain per interval a mask,
+    Also save for the drs_value_types Baseline and Gain per interval a mask,
     based of the with the 'config.py' given 'CutOffErrorFactor'
-    drsValue selection.
-    There are two reasons for calculate no mask for Baseline values.
-    1. No sufficient standard deviation of the Baseline mean exist.
-    2. The Baseline mask does not fit in ram.
+    drsValue selection. The mask is calculated blockwise over the cells
+    and stored bit-packed (see 'create_bit_packed_mask'),
+    so also the Baseline mask never has to fit in ram.
 
     Args:
         source_file_path (str):
@@ -515,8 +908,11 @@ def store_source_based_interval_indices(source_file_path: str,
 
     with h5py.File(source_file_path, 'r') as data_source:
         source_creation_date = data_source.attrs['CreationDate']
+        # older sources have no BaselineStd
+        masked_drs_value_types = [drs_value_type for drs_value_type in cut_off_error_factor
+                                  if drs_value_type+'Std' in data_source]
 
-    with h5py.File(store_file_path) as store:
+    with h5py.File(store_file_path, 'w') as store:
         store.clear()
         store.attrs['SCDate'] = source_creation_date
 
@@ -531,7 +927,7 @@ def store_source_based_interval_indices(source_file_path: str,
         upp_limit = interval_limits[interval_nr].strftime('%Y-%m-%d %H')
 
         groupname = 'Interval'+str(interval_nr)
-        with h5py.File(store_file_path) as store:
+        with h5py.File(store_file_path, 'r+') as store:
             drs_group = store.create_group(groupname)
             drs_group.attrs['LowLimit'] = low_limit
             drs_group.attrs['UppLimit'] = upp_limit
@@ -547,24 +943,16 @@ def store_source_based_interval_indices(source_file_path: str,
         if len(interval_indices) == 0:
             continue
 
-        drs_value_type = 'Gain'
-        print('Loading ...', drs_value_type, ' : ', interval_nr)
-        indiceMask = get_indice_mask(source_file_path,
-                                     drs_value_type,
-                                     interval_indices,
-                                     cut_off_error_factor[drs_value_type])
-        print(indiceMask.shape)
-        with h5py.File(store_file_path) as store:
-            drs_group = store[groupname]
-            drs_group.attrs['CutOff'+drs_value_type] = cut_off_error_factor[drs_value_type]
-            drs_group.create_dataset(drs_value_type+'Mask',
-                                     data=indiceMask,
-                                     dtype='bool',
-                                     maxshape=(indiceMask.shape),
-                                     compression='gzip',
-                                     compression_opts=4,
-                                     fletcher32=True
-                                     )
+        for drs_value_type in masked_drs_value_types:
+            print('Loading ...', drs_value_type, ' : ', interval_nr)
+            with h5py.File(store_file_path, 'r+') as store:
+                drs_group = store[groupname]
+                drs_group.attrs['CutOff'+drs_value_type] = cut_off_error_factor[drs_value_type]
+                store_indice_mask(source_file_path,
+                                  drs_value_type,
+                                  interval_indices,
+                                  cut_off_error_factor[drs_value_type],
+                                  drs_group)
 
 
 # ########################################################################### #
@@ -581,11 +969,14 @@ def get_source_and_boundarie_based_interval_limits_and_indices(
     # interval indices(based on the source array)
     for drs_value_type in drs_value_types:
         with h5py.File(source_file_path, 'r') as data_source:
-            time = np.array(data_source['Time'+drs_value_type]).flatten()
+            # without the padding rows of a not closed appender
+            time_dataset = data_source['Time'+drs_value_type]
+            time = np.array(time_dataset[:get_nr_of_rows(time_dataset)]).flatten()
 
         datetime = pd.to_datetime(time * 24 * 3600 * 1e9)
 
-        lower_boundarie = min(datetime).date() + pd.DateOffset(hours=12)
+        # invalidated rows (nan time) are in no interval
+        lower_boundarie = datetime.min().date() + pd.DateOffset(hours=12)
         if(lower_boundarie > hardware_boundaries[0]):
             lower_boundarie = hardware_boundaries[0]
         interval_limits = [lower_boundarie]
@@ -598,7 +989,7 @@ def get_source_and_boundarie_based_interval_limits_and_indices(
             lower_boundarie = boundarie
             interval_limits.append(boundarie)
         list_of_interval_indices.append(np.where(datetime >= lower_boundarie)[0])
-        upper_boundarie = max(datetime).date() + pd.DateOffset(hours=12)
+        upper_boundarie = datetime.max().date() + pd.DateOffset(hours=12)
         if(upper_boundarie < hardware_boundaries[-1]):
             upper_boundarie = hardware_boundaries[-1]
         interval_limits.append(upper_boundarie)
@@ -619,21 +1010,210 @@ def get_source_and_boundarie_based_interval_limits_and_indices(
 
 
 # ########################################################################### #
-def get_indice_mask(source_file_path, drs_value_type,
-                    interval_indices, cut_off_error_factor):
-
+def store_indice_mask(source_file_path, drs_value_type, interval_indices,
+                      cut_off_error_factor, drs_group, max_block_bytes=pow(2, 28)):
+    '''
+        Calculate the mask of the interval blockwise over the cells
+        and store it bit-packed into the drs_group,
+        so never more than a block of the std values is in memory
+    '''
     with h5py.File(source_file_path, 'r') as data_source:
-        drs_value_std_array = data_source[drs_value_type+'Std'][interval_indices, :]
+        drs_value = data_source[drs_value_type]
+        drs_value_std = data_source[drs_value_type+'Std']
+        nr_of_cells = drs_value.shape[1]
+        # one std value per start cell of the ROI-samples (Baseline)
+        values_per_std = nr_of_cells//drs_value_std.shape[1]
+        mask = create_bit_packed_mask(drs_group, drs_value_type+'Mask',
+                                      len(interval_indices), nr_of_cells)
+
+        # blocks of whole source chunks and whole std cells
+        chunk_width = drs_value.chunks[1] if drs_value.chunks else 1
+        chunk_width = int(np.lcm(chunk_width, values_per_std))
+        column_bytes = len(interval_indices)*(drs_value.dtype.itemsize +
+                                              drs_value_std.dtype.itemsize)
+        block_width = max(1, max_block_bytes//(column_bytes*chunk_width))*chunk_width
+        for block_start in tqdm(range(0, nr_of_cells, block_width)):
+            block = slice(block_start, min(block_start+block_width, nr_of_cells))
+            std_block = slice(block.start//values_per_std, block.stop//values_per_std)
+            drs_value_array = read_h5py_rows(drs_value, interval_indices, block)
+            drs_value_std_array = read_h5py_rows(drs_value_std, interval_indices, std_block)
+            write_bit_packed_mask(mask,
+                                  get_indice_mask(drs_value_array, drs_value_std_array,
+                                                  cut_off_error_factor),
+                                  block)
+
 
-    drs_value_std_mean_per_cell = np.mean(drs_value_std_array, axis=0)
+# ########################################################################### #
+def get_indice_mask(drs_value_array, drs_value_std_array, cut_off_error_factor):
+    '''
+        Mask of all values with a smaller std than the
+        cut_off_error_factor multiplied with the mean std of the cell (column).
+        Values without std (Baseline cells with one event)
+        are not masked out, as long as the value itself is finite
+        (Baseline cells without any event have neither mean nor std).
+        The std array can have one column per start cell of the
+        ROI-samples (Baseline), the mask of the start cell
+        is used for all its samples.
+    '''
+    values_per_std = drs_value_array.shape[1]//drs_value_std_array.shape[1]
+    without_std = np.isnan(drs_value_std_array)
+    # float64 sums, the float16 std values of long intervals would overflow
+    drs_value_std_mean_per_cell = np.mean(drs_value_std_array, axis=0, dtype='float64')
+    if(without_std.any()):
+        drs_value_std_mean_per_cell = np.nanmean(drs_value_std_array, axis=0, dtype='float64')
     drs_value_std_limit = np.multiply(drs_value_std_mean_per_cell,
                                       cut_off_error_factor)
 
     mask_limit = np.array(drs_value_std_array < drs_value_std_limit[None, :])
+    if(values_per_std > 1):
+        mask_limit = np.repeat(mask_limit, values_per_std, axis=1)
+        without_std = np.repeat(without_std, values_per_std, axis=1)
+    mask_limit |= without_std & np.isfinite(drs_value_array)
 
     return mask_limit
 
 
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('source_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/dataCollection.h5',
+                type=click.Path(exists=True))
+@click.argument('interval_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/intervalIndices.h5',
+                type=click.Path(exists=True))
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/dataCollectionSorted.h5',
+                type=click.Path(exists=False))
+@click.option('--chunk_size', '-c',
+              default=16,
+              help='Max size of the column chunks in MB')
+###############################################################################
+def store_interval_sorted_data_collection(source_file_path: str,
+                                          interval_file_path: str,
+                                          store_file_path: str,
+                                          chunk_size: int):
+    '''
+        Save a copy of the '.h5-file' source, partitioned into
+        the intervals of the given interval file and sorted by time.
+        Every interval group contains all columns of the source just
+        with the rows of the interval and the 'IntervalIndices'
+        (the source rows in the new order).
+        The columns are chunked over all rows of the interval,
+        the chunk borders are aligned with the column pieces of
+        'calculate_fit_values', so every fit piece is one contiguous read
+        and every chunk gets decompressed just once.
+        'calculate_fit_values' accept this file instead of the source.
+
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file with the extension '.h5'
+            interval_file_path (str):
+                Full path to the sourceParameter based intervalndices file
+                with the extension '.h5'
+            store_file_path (str):
+                Full path to the storeFile with the extension '.h5'
+            chunk_size (int):
+                Max size of the column chunks in MB
+    '''
+
+    drs_value_types = fit_value_config.drs_value_types
+
+    with h5py.File(source_file_path, 'r') as data_source, \
+         h5py.File(interval_file_path, 'r') as interval_source, \
+         h5py.File(store_file_path, 'w') as store:
+
+        source_creation_date = data_source.attrs['CreationDate']
+        if(interval_source.attrs['SCDate'] != source_creation_date):
+            error_str = ('The interval file is not based on the given source file')
+            raise Exception(error_str)
+        for attribute_name in data_source.attrs:
+            store.attrs[attribute_name] = data_source.attrs[attribute_name]
+
+        time_dataset = data_source['Time'+drs_value_types[0]]
+        time = np.array(time_dataset[:get_nr_of_rows(time_dataset), 0])
+        # the columns are copied with their encoding
+        column_names = list(data_collection_config.column_names)
+        for column_name in data_collection_config.column_names:
+            if 'Reference' in data_source[column_name].attrs:
+                column_names.append(data_source[column_name].attrs['Reference'])
+
+        groupnames = sorted(interval_source.keys(), key=lambda name: int(name[len('Interval'):]))
+        for groupname in groupnames:
+            print('Store ...', groupname)
+            interval_group = interval_source[groupname]
+            interval_indices = np.array(interval_group['IntervalIndices'])
+            order = np.argsort(time[interval_indices], kind='stable')
+
+            drs_group = store.create_group(groupname)
+            drs_group.attrs['LowLimit'] = interval_group.attrs['LowLimit']
+            drs_group.attrs['UppLimit'] = interval_group.attrs['UppLimit']
+            drs_group.create_dataset('IntervalIndices',
+                                     data=interval_indices[order],
+                                     dtype='uint32')
+            if len(interval_indices) == 0:
+                continue
+
+            for column_name in tqdm(column_names):
+                store_sorted_column(data_source[column_name], interval_indices, order,
+                                    drs_group, column_name, chunk_size*pow(2, 20))
+
+
+# ########################################################################### #
+def store_sorted_column(source_dataset, interval_indices, order,
+                        store_group, column_name, max_chunk_bytes,
+                        max_block_bytes=pow(2, 30)):
+    '''
+        Copy the interval rows of the source_dataset in the given order,
+        blockwise over the columns to keep the used memory bounded.
+        Encoded values are copied as stored.
+    '''
+    nr_of_rows = len(interval_indices)
+    nr_of_columns = source_dataset.shape[1]
+    column_bytes = nr_of_rows*source_dataset.dtype.itemsize
+    chunk_width = get_column_chunk_width(nr_of_columns, column_bytes, max_chunk_bytes)
+
+    dataset = store_group.create_dataset(
+                name=column_name, dtype=source_dataset.dtype,
+                shape=(nr_of_rows, nr_of_columns),
+                chunks=(nr_of_rows, chunk_width),
+                compression='gzip', compression_opts=5,
+                fletcher32=True)
+    for attribute_name in source_dataset.attrs:
+        dataset.attrs[attribute_name] = source_dataset.attrs[attribute_name]
+
+    block_width = max(1, max_block_bytes//(column_bytes*chunk_width))*chunk_width
+    for block_start in range(0, nr_of_columns, block_width):
+        block = slice(block_start, min(block_start+block_width, nr_of_columns))
+        dataset[:, block] = read_h5py_rows(source_dataset, interval_indices[order], block,
+                                           decode=False)
+
+
+# ########################################################################### #
+def get_column_chunk_width(nr_of_columns, column_bytes, max_chunk_bytes):
+    '''
+        Largest width (not smaller than 1) with a chunk of at most
+        max_chunk_bytes, which divides the width of the column pieces
+        of 'calculate_fit_values' (or all columns for other shapes)
+    '''
+    nr_of_pieces = NRTEMPSENSOR*nr_of_fit_pieces_per_temp_sensor
+    piece_width = nr_of_columns
+    if(nr_of_columns % nr_of_pieces == 0):
+        piece_width = nr_of_columns//nr_of_pieces
+
+    max_width = max(1, max_chunk_bytes//column_bytes)
+    if(piece_width <= max_width):
+        return piece_width
+    return max(width for width in range(1, max_width+1)
+               if piece_width % width == 0)
+
+
 ###############################################################################
 ###############################################################################
 @click.command()
@@ -654,19 +1234,38 @@ def get_indice_mask(source_file_path, drs_value_type,
                         'projects/fact/drs4_calibration_data/' +
                         'calibration/calculation/version_1/drsFitParameter_interval3.fits',
                 type=click.Path(exists=False))
+@click.option('--jobs', '-j',
+              default=multiprocessing.cpu_count(),
+              help='Max number of worker processes')
+@click.option('--memory_budget', '-m',
+              default=32.,
+              help='Memory in GB for all fit tasks together')
+@click.option('--blas_threads', '-b',
+              default=1,
+              help='Number of BLAS threads per worker process')
+@click.option('--worker_reads/--parent_reads',
+              default=True,
+              help='Read the drs values in the worker processes or in the main process')
+@click.option('--scratch_folder', '-s',
+              default=None,
+              type=click.Path(exists=True),
+              help='Folder for the fit results and the checkpoint of a resumable run')
 ###############################################################################
 def calculate_fit_values(source_file_path: str, interval_file_path: str,
-                         interval_nr: int, store_file_path: str):
+                         interval_nr: int, store_file_path: str,
+                         jobs: int, memory_budget: float, blas_threads: int,
+                         worker_reads: bool, scratch_folder: str):
     '''
         Calculate the linear fitvalues of Baseline and Gain
         based on the .h5 source data for the by the hardware boundaries
         given itervals and store them into a .fits File.
-        All Gain-values with a larger error (std dev of the mean)
+        All Baseline- and Gain-values with a larger error (std dev of the mean)
         than the 'CutOffErrorFactor' multiplied with the mean of the error
-        from all collected Gain-values for one capacitor will not used for the fit
+        from all collected values for one capacitor will not used for the fit
         Args:
             source_file_path (str):
                 Full path to the sourceParameter file
+                (or its 'store_interval_sorted_data_collection' copy)
                 with the extension '.h5'
             interval_file_path (str):
                 Full path to the sourceParameter based intervalndices file
@@ -676,138 +1275,428 @@ def calculate_fit_values(source_file_path: str, interval_file_path: str,
             store_file_path (str):
                 Full path to the storeFile
                 with the extension '.fits'
+            jobs (int):
+                Max number of worker processes,
+                less if their tasks dont fit into the memory_budget
+            memory_budget (float):
+                Memory in GB for all fit tasks together,
+                the size of the tasks is planned with it (see 'get_fit_task_plan')
+            blas_threads (int):
+                Number of BLAS threads per worker process
+            worker_reads (bool):
+                Every task reads its columns of the drs values and the mask
+                in the worker process (see 'calculate_fit_values_of_columns'),
+                otherwise they are read by the main process and
+                send to the workers
+            scratch_folder (str):
+                Path to a folder on a durable disk. If given,
+                the fit results are stored there (instead of the shared memory)
+                together with a checkpoint of the finished fit tasks.
+                A restarted run with the same arguments skips these tasks.
+                Results and checkpoint are removed after the .fits File is written
     '''
 
     logging.basicConfig(
         filename=store_file_path.split('.')[0]+".log", filemode='w',
         format='%(levelname)s:%(message)s', level=logging.DEBUG)
 
-    jobs = 20
+    fit_intervals(source_file_path, interval_file_path, [interval_nr], [store_file_path],
+                  jobs, memory_budget, blas_threads, worker_reads,
+                  scratch_folder_path=scratch_folder)
+
+
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('source_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/dataCollection.h5',
+                type=click.Path(exists=True))
+@click.argument('interval_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/intervalIndices.h5',
+                type=click.Path(exists=True))
+@click.argument('store_folder_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/',
+                type=click.Path(exists=True))
+@click.option('--interval_nr', '-i',
+              multiple=True,
+              default=[1, 2, 3],
+              help='Number of an interval to fit (can be given several times)')
+@click.option('--jobs', '-j',
+              default=multiprocessing.cpu_count(),
+              help='Max number of worker processes')
+@click.option('--memory_budget', '-m',
+              default=32.,
+              help='Memory in GB for all fit tasks together')
+@click.option('--blas_threads', '-b',
+              default=1,
+              help='Number of BLAS threads per worker process')
+@click.option('--worker_reads/--parent_reads',
+              default=True,
+              help='Read the drs values in the worker processes or in the main process')
+@click.option('--scratch_folder', '-s',
+              default=None,
+              type=click.Path(exists=True),
+              help='Folder for the fit results and the checkpoint of a resumable run')
+###############################################################################
+def calculate_fit_values_of_intervals(source_file_path: str, interval_file_path: str,
+                                      store_folder_path: str, interval_nr: list,
+                                      jobs: int, memory_budget: float, blas_threads: int,
+                                      worker_reads: bool, scratch_folder: str):
+    '''
+        Same as 'calculate_fit_values', but for several intervals at once.
+        Every column block of the source is read just once for all intervals,
+        its rows are routed to the fits of their intervals.
+        The fitvalues of every interval are stored into the .fits File
+        'drsFitParameter_interval<nr>.fits' of the store folder.
+
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file
+                (or its 'store_interval_sorted_data_collection' copy)
+                with the extension '.h5'
+            interval_file_path (str):
+                Full path to the sourceParameter based intervalndices file
+                with the extension '.h5'
+            store_folder_path (str):
+                Path to the folder of the storeFiles
+            interval_nr (list):
+                numbers of the selected intervals
+            jobs (int):
+                Max number of worker processes
+            memory_budget (float):
+                Memory in GB for all fit tasks together
+            blas_threads (int):
+                Number of BLAS threads per worker process
+            worker_reads (bool):
+                Read the drs values in the worker processes
+            scratch_folder (str):
+                Path to a folder for the results and the checkpoint
+                of a resumable run (see 'calculate_fit_values')
+    '''
+
+    log_file_path = os.path.join(store_folder_path, 'drsFitParameter_intervals.log')
+    logging.basicConfig(
+        filename=log_file_path, filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    interval_nrs = list(dict.fromkeys(interval_nr))
+    store_file_paths = [os.path.join(store_folder_path,
+                                     'drsFitParameter_interval{}.fits'.format(nr))
+                        for nr in interval_nrs]
+    fit_intervals(source_file_path, interval_file_path, interval_nrs, store_file_paths,
+                  jobs, memory_budget, blas_threads, worker_reads, log_file_path,
+                  scratch_folder)
+
+
+# ########################################################################### #
+def fit_intervals(source_file_path, interval_file_path, interval_nrs, store_file_paths,
+                  jobs, memory_budget, blas_threads, worker_reads, log_file_path=None,
+                  scratch_folder_path=None):
+    '''
+        Calculate the linear fitvalues of Baseline and Gain of the given
+        intervals and store them into one .fits File per interval
+        (see 'calculate_fit_values' and 'calculate_fit_values_of_intervals').
+        Every fit task fits the same columns of all intervals,
+        the columns are read once for all intervals (see 'get_interval_reads').
+        With a scratch_folder_path the results are kept in files
+        and the finished tasks in a 'FitCheckpoint' to resume the run.
+    '''
     verbosity = 10
-    pool = Parallel(n_jobs=jobs, verbose=verbosity, max_nbytes="50G")  # batch_size=1,
 
-    groupname = 'Interval'+str(interval_nr)
     drs_value_types = fit_value_config.drs_value_types
     drs_values_per_cell = fit_value_config.drs_values_per_cell
-    value_units = fit_value_config.value_units
 
-    column_collection = fits.ColDefs([])
-    for drs_value_type in drs_value_types:
-        print('Loading ...', drs_value_type)
+    list_of_interval_indices = []
+    interval_limits = []
+    with h5py.File(interval_file_path, 'r') as interval_source:
+        for interval_nr in interval_nrs:
+            data = interval_source['Interval'+str(interval_nr)]
+            list_of_interval_indices.append(np.array(data['IntervalIndices']))
+            interval_limits.append((data.attrs['LowLimit'], data.attrs['UppLimit'],
+                                    data.attrs['CutOffGain']))
 
-        drs_value_per_cell = drs_values_per_cell[drs_value_type]
-        drs_value_shape = NRCHID*NRCELL*drs_value_per_cell
+    with h5py.File(source_file_path, 'r') as data_source:
+        source_creation_date = data_source.attrs['CreationDate']
 
-        temp_folder = tempfile.mkdtemp()
+    checkpoint = None
+    if scratch_folder_path is not None:
+        run_key = ' '.join([os.path.abspath(source_file_path), str(source_creation_date),
+                            os.path.abspath(interval_file_path),
+                            ','.join(str(interval_nr) for interval_nr in interval_nrs),
+                            ','.join(drs_value_types), str(NRCHID), str(NRCELL)])
+        checkpoint = FitCheckpoint(scratch_folder_path, run_key)
+
+    # the fit results of all drs value types and intervals stay
+    # in shared memory (or the scratch files) until they are written into the .fits files
+    shared_results = []
+    finished = False
+    column_collections = [fits.ColDefs([]) for interval_nr in interval_nrs]
+    try:
+        for drs_value_type in drs_value_types:
+            print('Loading ...', drs_value_type)
+
+            drs_value_per_cell = drs_values_per_cell[drs_value_type]
+            drs_value_shape = NRCHID*NRCELL*drs_value_per_cell
+
+            # slope, offset and residual mean of every interval
+            interval_results = []
+            for interval_nr in interval_nrs:
+                if checkpoint is None:
+                    results = [SharedArray(drs_value_shape, 'float32', np.nan)
+                               for result_name in ['Slope', 'Offset', 'ResidualMean']]
+                else:
+                    results = [ScratchArray(os.path.join(scratch_folder_path,
+                                                         'Interval{}_{}{}.map'.format(
+                                                            interval_nr, drs_value_type,
+                                                            result_name)),
+                                            drs_value_shape, 'float32', np.nan,
+                                            resume=checkpoint.resumed)
+                               for result_name in ['Slope', 'Offset', 'ResidualMean']]
+                shared_results += results
+                interval_results.append(results)
+                if(checkpoint is not None and checkpoint.resumed and
+                   not all(result.resumed for result in results)):
+                    error_str = ('Missing fit results of the checkpoint in: ' +
+                                 str(scratch_folder_path))
+                    raise Exception(error_str)
+
+            with h5py.File(source_file_path, 'r') as data_source, \
+                 h5py.File(interval_file_path, 'r') as interval_source:
+                reads, interval_reads, temperatures = get_interval_reads(
+                    data_source, interval_source, drs_value_type,
+                    interval_nrs, list_of_interval_indices)
+
+                # the largest read together with the rows of one interval
+                nr_of_rows = max(len(rows) for drs_value_path, rows in reads)
+                nr_of_rows += max([len(positions) for read_nr, positions, mask_path, row_order
+                                   in interval_reads if positions is not None] + [0])
+                drs_value_source = data_source[reads[0][0]]
+                value_bytes = drs_value_source.dtype.itemsize
+                if 'DecodedDtype' in drs_value_source.attrs:
+                    value_bytes += np.dtype(drs_value_source.attrs['DecodedDtype']).itemsize
+                chunk_width = max(data_source[drs_value_path].chunks[1]
+                                  if data_source[drs_value_path].chunks else 1
+                                  for drs_value_path, rows in reads)
+                plan = get_fit_task_plan(nr_of_rows, drs_value_shape, chunk_width,
+                                         value_bytes, memory_budget*pow(2, 30),
+                                         jobs, blas_threads, worker_reads)
+                plan.report(drs_value_type)
+
+                # keys of the intervals of every dispatched task (for the checkpoint)
+                dispatched_task_keys = []
+
+                def get_fit_tasks(sensor, start, stop):
+                    # the workers write their results directly into the shared memory
+                    interval_tasks = []
+                    task_keys = []
+                    for interval_nr, (read_nr, positions, mask_path, row_order), \
+                        temperature, results in zip(interval_nrs, interval_reads,
+                                                    temperatures, interval_results):
+                        task_key = FitCheckpoint.get_task_key(drs_value_type, interval_nr,
+                                                              start, stop)
+                        if(checkpoint is not None and checkpoint.is_finished(task_key)):
+                            continue
+                        task_keys.append(task_key)
+                        interval_tasks.append(
+                            (read_nr, positions, mask_path, row_order, temperature[:, sensor],
+                             [result.get_slice(start, stop) for result in results]))
+                    if(len(interval_tasks) == 0):
+                        return
+                    if worker_reads:
+                        dispatched_task_keys.append(task_keys)
+                        yield delayed(calculate_fit_values_of_columns)(
+                            source_file_path, interval_file_path, (start, stop),
+                            reads, interval_tasks)
+                        return
+
+                    column_slice = slice(start, stop)
+                    for read_nr, (drs_value_path, rows) in enumerate(reads):
+                        if(read_nr not in [interval_task[0] for interval_task in interval_tasks]):
+                            continue
+                        drs_value_array = read_h5py_rows(data_source[drs_value_path],
+                                                         rows, column_slice)
+                        for task_key, (task_read_nr, positions, mask_path, row_order,
+                                       temperature, result_slices) in zip(task_keys,
+                                                                          interval_tasks):
+                            if(task_read_nr != read_nr):
+                                continue
+                            mask_source = None
+                            if mask_path is not None:
+                                mask_source = interval_source[mask_path]
+                            dispatched_task_keys.append([task_key])
+                            yield delayed(calculate_fit_values_and_more)(
+                                stop-start,
+                                temperature,
+                                drs_value_array[positions] if positions is not None
+                                else drs_value_array,
+                                read_mask_piece(mask_source, column_slice, row_order),
+                                result_slices)
+
+                # the BLAS threads of the workers are limited by joblib
+                with parallel_backend('loky', inner_max_num_threads=blas_threads):
+                    pool = Parallel(n_jobs=plan.jobs, verbose=verbosity,
+                                    max_nbytes=None, pre_dispatch='n_jobs',
+                                    return_as='generator' if checkpoint is not None
+                                    else 'list')
+                    fit_results = pool(fit_task for sensor, start, stop in tqdm(plan.tasks)
+                                       for fit_task in get_fit_tasks(sensor, start, stop))
+                    if checkpoint is not None:
+                        # the results come in the order of the dispatched tasks
+                        for task_nr, fit_result in enumerate(fit_results):
+                            checkpoint.set_finished(dispatched_task_keys[task_nr])
 
-        memmap_paths_slope = os.path.join(temp_folder, 'slope.map')
-        memmap_paths_offset = os.path.join(temp_folder, 'offset.map')
-        memmap_paths_residual_mean = os.path.join(temp_folder, 'residual_mean.map')
+            print('Done')
+            for interval_index, results in enumerate(interval_results):
+                column_collections[interval_index] = (
+                    column_collections[interval_index] +
+                    get_fit_value_columns(drs_value_type,
+                                          *[result.array for result in results]))
+
+        for interval_nr, store_file_path, column_collection, limits in zip(
+                interval_nrs, store_file_paths, column_collections, interval_limits):
+            low_limit, upp_limit, cut_off_error_factor = limits
+            write_fit_value_table(store_file_path, column_collection, interval_nr,
+                                  low_limit, upp_limit, cut_off_error_factor,
+                                  source_creation_date, log_file_path=log_file_path)
+        finished = True
+    finally:
+        del column_collections
+        for shared_result in shared_results:
+            if checkpoint is None:
+                shared_result.release()
+            else:
+                # the scratch files are kept to resume the run
+                shared_result.release(remove=finished)
+        if(checkpoint is not None and finished):
+            checkpoint.remove()
 
-        try:
-            mask = np.array([[]])
-            with h5py.File(interval_file_path, 'r') as interval_source:
-                data = interval_source[groupname]
-                low_limit = data.attrs['LowLimit']
-                upp_limit = data.attrs['UppLimit']
-                interval_indices = np.array(data['IntervalIndices'])
-                if (drs_value_type == 'Gain'):
-                    cut_off_error_factor = data.attrs['CutOff'+drs_value_type]
-                    mask = np.array(data[drs_value_type+'Mask'])
-
-            slope = np.memmap(memmap_paths_slope, mode='w+',
-                              shape=drs_value_shape, dtype='float32')
-            offset = np.memmap(memmap_paths_offset, mode='w+',
-                               shape=drs_value_shape, dtype='float32')
-            residual_mean = np.memmap(memmap_paths_residual_mean, mode='w+',
-                                      shape=drs_value_shape, dtype='float32')
-            slope[:] = np.nan
-            offset[:] = np.nan
-            residual_mean[:] = np.nan
-            del slope
-            del offset
-            del residual_mean
-
-            split_factor = 12  # split data in smaller pices to avoid run out of memory
-            if drs_value_shape % (NRTEMPSENSOR*split_factor) != 0:
-                raise Exception('Bad split factor: remaining cells')
-
-            chunk = int(drs_value_shape/NRTEMPSENSOR/split_factor)
-            with h5py.File(source_file_path, 'r') as data_source:
-                pool(delayed(calculate_fit_values_and_more)(
-                     chunk,
-                     data_source['Temp'+drs_value_type][interval_indices, int(pice_nr/split_factor)],
-                     data_source[drs_value_type][interval_indices, pice_nr*chunk:(pice_nr+1)*chunk],
-                     mask[:, pice_nr*chunk:(pice_nr+1)*chunk],
-                     np.memmap(memmap_paths_slope, mode='r+',
-                               shape=chunk, dtype='float32',
-                               offset=int((pice_nr*chunk)*32/8)),
-                     np.memmap(memmap_paths_offset, mode='r+',
-                               shape=chunk, dtype='float32',
-                               offset=int((pice_nr*chunk)*32/8)),
-                     np.memmap(memmap_paths_residual_mean, mode='r+',
-                               shape=chunk, dtype='float32',
-                               offset=int((pice_nr*chunk)*32/8))
-                     ) for pice_nr in tqdm(range(NRTEMPSENSOR*split_factor)))
 
-            print('Done')
-            # reload fit results
-            drs_value_slope = np.memmap(memmap_paths_slope, mode='r+',
-                                        shape=drs_value_shape, dtype='float32')
-            drs_value_offset = np.memmap(memmap_paths_offset, mode='r+',
-                                         shape=drs_value_shape, dtype='float32')
-            drs_value_residual_mean = np.memmap(memmap_paths_residual_mean, mode='r+',
-                                                shape=drs_value_shape, dtype='float32')
-
-            # catch up gain standardization to 1
-            # (The stored gain is the unnormed difference
-            # between 'baseline' and 'headline' in ADC-counts
-            # so the stored gain values still needs
-            # to get normend by divide with the DAC/ADC-factor
-            # of 3906.25 ADC-counts)
-            if(drs_value_type == 'Gain'):
-                drs_value_slope /= DACfactor
-                drs_value_offset /= DACfactor
-                drs_value_residual_mean /= DACfactor
-
-            drs_value_slope = drs_value_slope.reshape(-1, drs_value_per_cell)
-            drs_value_offset = drs_value_offset.reshape(-1, drs_value_per_cell)
-            drs_value_residual_mean = drs_value_residual_mean.reshape(-1, drs_value_per_cell)
-
-            value_unit = value_units[drs_value_type]
-            drs_value_format = '{}E'.format(drs_value_per_cell)
-            drs_value_format_str = '{}*[{}]'.format(NRCHID*NRCELL, drs_value_per_cell)
-
-            new_columns = fits.ColDefs(
-                [fits.Column(
-                    name=drs_value_type+'Slope',
-                    format=drs_value_format,
-                    unit=value_unit+'/celsius',
-                    dim=drs_value_format_str,
-                    array=drs_value_slope),
-                 fits.Column(
-                    name=drs_value_type+'Offset',
-                    format=drs_value_format,
-                    unit=value_unit,
-                    dim=drs_value_format_str,
-                    array=drs_value_offset),
-                 fits.Column(
-                    name=drs_value_type+'Residual',
-                    format=drs_value_format,
-                    unit=value_unit,
-                    dim=drs_value_format_str,
-                    array=drs_value_residual_mean)])
-            column_collection = column_collection + new_columns
-
-        finally:
-            try:
-                shutil.rmtree(temp_folder)
-            except:
-                print("Failed to delete: " + temp_folder)
-
-    print('write Data to Table')
-    hdu = fits.BinTableHDU.from_columns(column_collection)
-    hdu.header.insert('TFIELDS', ('EXTNAME', 'FitParameter'), after=True)
+# ########################################################################### #
+def get_interval_reads(data_source, interval_source, drs_value_type,
+                       interval_nrs, list_of_interval_indices):
+    '''
+        Plan the reads of the drs values of the given intervals.
+        All intervals of the source are read together (the union of their rows),
+        intervals of an interval sorted copy from their own group.
+
+        Returns:
+            reads (list):
+                (drs value dataset path, rows) of every read
+            interval_reads (list):
+                (read number, positions of the interval rows in the read
+                 (None for all rows), mask path (or None), mask row order (or None))
+                of every interval
+            temperatures (list):
+                Temperatures of the rows of every interval
+    '''
+    reads = []
+    interval_reads = []
+    temperatures = []
+    for interval_nr, interval_indices in zip(interval_nrs, list_of_interval_indices):
+        groupname = 'Interval'+str(interval_nr)
+        # the mask is read piecewise, older interval files have no Baseline mask
+        mask_source = interval_source[groupname].get(drs_value_type+'Mask')
+        mask_path = mask_source.name if mask_source is not None else None
+        if groupname in data_source:
+            # interval sorted copy of the source
+            drs_group = data_source[groupname]
+            row_order = get_interval_row_order(interval_indices,
+                                               np.array(drs_group['IntervalIndices']))
+            rows = np.arange(len(interval_indices))
+            interval_reads.append((len(reads), None, mask_path, row_order))
+            temperatures.append(read_h5py_rows(drs_group['Temp'+drs_value_type], rows))
+            reads.append((drs_group[drs_value_type].name, rows))
+        else:
+            interval_reads.append((None, interval_indices, mask_path, None))
+            temperatures.append(None)
+
+    source_intervals = [interval_index for interval_index, interval_read
+                        in enumerate(interval_reads) if interval_read[0] is None]
+    if(len(source_intervals) > 0):
+        rows = np.unique(np.concatenate([list_of_interval_indices[interval_index]
+                                         for interval_index in source_intervals]))
+        rows = rows.astype('int64')
+        # the temperature of all sensors is read once for all tasks
+        temperature = read_h5py_rows(data_source['Temp'+drs_value_type], rows)
+        for interval_index in source_intervals:
+            read_nr, interval_indices, mask_path, row_order = interval_reads[interval_index]
+            positions = np.searchsorted(rows, interval_indices)
+            interval_reads[interval_index] = (len(reads), positions, mask_path, None)
+            temperatures[interval_index] = temperature[positions]
+        reads.append((data_source[drs_value_type].name, rows))
+
+    return (reads, interval_reads, temperatures)
+
+
+# ########################################################################### #
+def get_fit_value_columns(drs_value_type, drs_value_slope, drs_value_offset,
+                          drs_value_residual):
+    '''
+        Return the fits columns of the slope, offset and residual
+        of the drs_value_type, the gain values are normed in place
+    '''
+    drs_value_per_cell = fit_value_config.drs_values_per_cell[drs_value_type]
+
+    # catch up gain standardization to 1
+    # (The stored gain is the unnormed difference
+    # between 'baseline' and 'headline' in ADC-counts
+    # so the stored gain values still needs
+    # to get normend by divide with the DAC/ADC-factor
+    # of 3906.25 ADC-counts)
+    if(drs_value_type == 'Gain'):
+        drs_value_slope /= DACfactor
+        drs_value_offset /= DACfactor
+        drs_value_residual /= DACfactor
+
+    drs_value_slope = drs_value_slope.reshape(-1, drs_value_per_cell)
+    drs_value_offset = drs_value_offset.reshape(-1, drs_value_per_cell)
+    drs_value_residual = drs_value_residual.reshape(-1, drs_value_per_cell)
+
+    value_unit = fit_value_config.value_units[drs_value_type]
+    drs_value_format = '{}E'.format(drs_value_per_cell)
+    drs_value_format_str = '{}*[{}]'.format(NRCHID*NRCELL, drs_value_per_cell)
+
+    return fits.ColDefs(
+        [fits.Column(
+            name=drs_value_type+'Slope',
+            format=drs_value_format,
+            unit=value_unit+'/celsius',
+            dim=drs_value_format_str,
+            array=drs_value_slope),
+         fits.Column(
+            name=drs_value_type+'Offset',
+            format=drs_value_format,
+            unit=value_unit,
+            dim=drs_value_format_str,
+            array=drs_value_offset),
+         fits.Column(
+            name=drs_value_type+'Residual',
+            format=drs_value_format,
+            unit=value_unit,
+            dim=drs_value_format_str,
+            array=drs_value_residual)])
+
+
+# ########################################################################### #
+def write_fit_value_table(store_file_path, column_collection, interval_nr,
+                          low_limit, upp_limit, cut_off_error_factor,
+                          source_creation_date, header_cards=(), log_file_path=None):
+    '''
+        Write the fit value columns together with the interval informations
+        (and the optional (keyword, value, comment) header_cards)
+        into the .fits store file and verify its checksum.
+        The table is written in blocks of rows (see 'StreamingBinTableWriter'),
+        so it is not copied completely into the memory.
+        The log_file_path defaults to the store_file_path with '.log'
+    '''
+    if log_file_path is None:
+        log_file_path = store_file_path.split('.')[0]+'.log'
 
     primary = fits.PrimaryHDU()
     comment_str = "Number of the interval"
@@ -819,22 +1708,32 @@ def calculate_fit_values(source_file_path: str, interval_file_path: str,
     comment_str = "'CutOff-ErrorFactor' for the Gain values"
     primary.header.insert("UppLimit", ("CutOff", cut_off_error_factor, comment_str), after=True)
 
-    with h5py.File(source_file_path, 'r') as data_source:
-        source_creation_date = data_source.attrs['CreationDate']
-
     comment_str = "Datetime-String of the source .h5 creation."  # in the format 'yyyy-mm-dd HH:MM:SS'
     primary.header.insert('UppLimit', ('SCDate', source_creation_date, comment_str), after=True)
+    for header_card in header_cards:
+        primary.header.append(header_card)
 
     print('Save Table')
-    thdulist = fits.HDUList([primary, hdu])
-    thdulist.writeto(store_file_path, overwrite=True, checksum=True)
+    nr_of_rows = len(column_collection.columns[0].array)
+    with StreamingBinTableWriter(store_file_path, primary.header, column_collection.columns,
+                                 nr_of_rows, extname='FitParameter') as table_writer:
+        nr_of_rows_per_block = max(1, pow(2, 26)//table_writer.row_dtype.itemsize)
+        for block_start in range(0, nr_of_rows, nr_of_rows_per_block):
+            block_stop = min(block_start+nr_of_rows_per_block, nr_of_rows)
+            rows = table_writer.get_empty_rows(block_stop-block_start)
+            for column in column_collection.columns:
+                rows[column.name] = column.array[block_start:block_stop].reshape(
+                                        rows[column.name].shape)
+            table_writer.write_rows(rows)
+
     print('Verify Checksum')
-    # Open the File verifying the checksum values for all HDUs
+    # Verify the checksum values for all HDUs
     try:
-        hdul = fits.open(store_file_path, checksum=True)
-        print(hdul[0].header)
-        print(hdul[1].header)
-        with open(store_file_path.split('.')[0]+'.log', 'r') as logFile:
+        verify_checksums(store_file_path)
+        with fits.open(store_file_path) as hdul:
+            print(hdul[0].header)
+            print(hdul[1].header)
+        with open(log_file_path, 'r') as logFile:
             logging.info(' Passed verifying Checksum')
             if(logFile.readlines() == [' Passed verifying Checksum']):
                 logging.info(' No errors occurred during the Fit-Value calculation.')
@@ -844,59 +1743,532 @@ def calculate_fit_values(source_file_path: str, interval_file_path: str,
         logging.warning(error_str)
 
 
+# ########################################################################### #
+def read_mask_piece(mask_source, column_slice, row_order=None):
+    '''
+        Read the columns of the (bit-packed) interval mask,
+        in the row order of an interval sorted source.
+        Without mask_source an empty mask is returned.
+    '''
+    if mask_source is None:
+        return np.array([[]])
+
+    mask = read_bit_packed_mask(mask_source, column_slice)
+    if row_order is not None:
+        mask = mask[row_order]
+    return mask
+
+
+# ########################################################################### #
+def get_interval_row_order(interval_indices, sorted_interval_indices):
+    '''
+        Return the positions of the sorted_interval_indices
+        (rows of an interval sorted copy) in the interval_indices
+    '''
+    row_order = np.searchsorted(interval_indices, sorted_interval_indices)
+    row_order = np.minimum(row_order, len(interval_indices)-1)
+    if(len(sorted_interval_indices) != len(interval_indices) or
+       not np.array_equal(interval_indices[row_order], sorted_interval_indices)):
+        error_str = ('The interval sorted source does not fit to the interval file')
+        raise Exception(error_str)
+    return row_order
+
+
+# ########################################################################### #
+def calculate_fit_values_of_columns(source_file_path, interval_file_path,
+                                    column_range, reads, interval_tasks):
+    '''
+        Fit task of 'fit_intervals', which reads its columns
+        of the drs values and of the masks in the worker process.
+        Both files are opened read-only, every read (see 'get_interval_reads')
+        is fitted for all of its intervals before the next one is read.
+
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file (or its sorted copy)
+            interval_file_path (str):
+                Full path to the sourceParameter based intervalndices file
+            column_range (tuple):
+                First and behind last column (start, stop)
+            reads (list):
+                (drs value dataset path, rows) of every read
+            interval_tasks (list):
+                (read number, positions of the interval rows in the read or None,
+                 mask path or None, mask row order or None,
+                 temperature of the interval rows,
+                 'SharedArraySlice' of the slope, offset and residual mean)
+                of every interval
+    '''
+    column_slice = slice(*column_range)
+    for read_nr, (drs_value_path, rows) in enumerate(reads):
+        if(read_nr not in [interval_task[0] for interval_task in interval_tasks]):
+            continue
+        with h5py.File(source_file_path, 'r') as data_source:
+            drs_value_array = read_h5py_rows(data_source[drs_value_path],
+                                             rows, column_slice)
+
+        for (task_read_nr, positions, mask_path, row_order,
+             temperature, result_slices) in interval_tasks:
+            if(task_read_nr != read_nr):
+                continue
+
+            mask_source = None
+            with h5py.File(interval_file_path, 'r') as interval_source:
+                if mask_path is not None:
+                    mask_source = interval_source[mask_path]
+                mask = read_mask_piece(mask_source, column_slice, row_order)
+
+            calculate_fit_values_and_more(column_range[1]-column_range[0], temperature,
+                                          drs_value_array[positions] if positions is not None
+                                          else drs_value_array,
+                                          mask, result_slices)
+        del drs_value_array
+
+
 # ########################################################################### #
 def calculate_fit_values_and_more(indice_range, temperature, drs_value_array,
-                                  mask, slope_array, offset_array,
-                                  residual_mean_array):
+                                  mask, result_slices):
 
-    # tryed to avoide if in for-loop
     if(mask.shape[1] == 0):
-        # for Baseline no mask exist jet
-        for index in range(indice_range):
-            value = drs_value_array[:, index]
-            nan_mask = (value != 0)
-            value = value[nan_mask]
-            temp = temperature[nan_mask]
-            apply_calculation(index, temp, value,
-                              slope_array, offset_array, residual_mean_array)
-            del nan_mask
-    else:
-        for index in range(indice_range):
-            sub_mask = mask[:, index]
-            temp = temperature[sub_mask]
-            value = drs_value_array[:, index][sub_mask]
-            apply_calculation(index, temp, value,
-                              slope_array, offset_array, residual_mean_array)
-            del sub_mask
+        # interval file without mask, just ignore the zero values
+        mask = (drs_value_array != 0)
+
+    slope, offset, residual_mean = calculate_linear_fit_values(
+                                        temperature, drs_value_array, mask)
+
+    slope_slice, offset_slice, residual_mean_slice = result_slices
+    slope_slice.write(slope)
+    offset_slice.write(offset)
+    residual_mean_slice.write(residual_mean)
+
+    nr_of_failed_fits = np.count_nonzero(np.isnan(slope))
+    if(nr_of_failed_fits > 0):
+        logging.error(' No fit possible for {} of {} cells'.format(
+                        nr_of_failed_fits, indice_range))
 
     # dont trust the Garbage Collector, so force to free memory
     del temperature
     del drs_value_array
-    del slope_array
-    del offset_array
-    del residual_mean_array
+    del mask
     gc.collect()
 
 
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('source_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/dataCollection.h5',
+                type=click.Path(exists=True))
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/fitStatistics.h5',
+                type=click.Path(exists=False))
+###############################################################################
+def update_fit_statistics(source_file_path: str, store_file_path: str):
+    '''
+        Create or update the statistics file of the linear fits:
+        per interval (given by the hardware boundaries) and per cell
+        the number of used values and the sums of t, t*t, v, t*v and v*v,
+        with the 'CutOffErrorFactor' drsValue selection.
+        Just the rows of the source, which are new since the last update,
+        are read, so after the ingest of new nights the fit values
+        are available with 'calculate_fit_values_from_statistics'
+        without reading the whole source again.
+
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file with the extension '.h5'
+            store_file_path (str):
+                Full path to the statistics file with the extension '.h5'
+    '''
+
+    logging.basicConfig(
+        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    store_fit_statistics(source_file_path, store_file_path)
+
+
 # ########################################################################### #
-def apply_calculation(index, temp, value, slope_array, offset_array, residual_mean_array):
-    # catch RuntimeWarning: invalid value encountered in double_scalars
-    with np.errstate(invalid='raise'):
-        try:
-            slope, offset, r_value, p_value, var_err = linregress(temp, value)
+def store_fit_statistics(source_file_path, statistics_file_path):
+    drs_value_types = fit_value_config.drs_value_types
+    hardware_boundaries = fit_value_config.interval_indice_config.hardware_boundaries
+    cut_off_error_factor = fit_value_config.interval_indice_config.cut_off_error_factor
+
+    interval_limits, list_of_interval_indices = get_source_and_boundarie_based_interval_limits_and_indices(
+            source_file_path, drs_value_types, hardware_boundaries)
+    update_fit_statistics_file(source_file_path, statistics_file_path,
+                               interval_limits, list_of_interval_indices,
+                               drs_value_types, cut_off_error_factor)
+
+
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('statistics_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/fitStatistics.h5',
+                type=click.Path(exists=True))
+@click.argument('interval_nr',
+                default=3)
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/drsFitParameter_interval3.fits',
+                type=click.Path(exists=False))
+###############################################################################
+def calculate_fit_values_from_statistics(statistics_file_path: str, interval_nr: int,
+                                         store_file_path: str):
+    '''
+        Calculate the linear fitvalues of Baseline and Gain
+        of the given interval from the with 'update_fit_statistics'
+        created statistics file and store them like 'calculate_fit_values'
+        into a .fits File. The 'Residual' columns contain the root mean square
+        of the residuals instead of the mean of the absolute residuals
+        (header keyword 'ResType').
 
-            slope_array[index] = slope
-            offset_array[index] = offset
+        Args:
+            statistics_file_path (str):
+                Full path to the statistics file with the extension '.h5'
+            interval_nr (int):
+                number of the selected interval
+            store_file_path (str):
+                Full path to the storeFile
+                with the extension '.fits'
+    '''
+
+    logging.basicConfig(
+        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    groupname = 'Interval'+str(interval_nr)
+    drs_value_types = fit_value_config.drs_value_types
+    nr_of_cells_per_block = pow(2, 22)
+
+    column_collection = fits.ColDefs([])
+    with h5py.File(statistics_file_path, 'r') as statistics:
+        if not statistics.attrs.get('Complete', False):
+            error_str = ('The statistics file is not complete')
+            raise Exception(error_str)
+        source_creation_date = statistics.attrs['SCDate']
+
+        statistics_group = statistics[groupname]
+        low_limit = statistics_group.attrs['LowLimit']
+        upp_limit = statistics_group.attrs['UppLimit']
+        cut_off_error_factor = statistics_group.attrs.get('CutOffGain', np.nan)
+
+        for drs_value_type in drs_value_types:
+            print('Loading ...', drs_value_type)
+            nr_of_cells = statistics_group[drs_value_type+'Count'].shape[0]
+            drs_value_slope = np.full(nr_of_cells, np.nan, dtype='float32')
+            drs_value_offset = np.full(nr_of_cells, np.nan, dtype='float32')
+            drs_value_residual = np.full(nr_of_cells, np.nan, dtype='float32')
+            for block_start in tqdm(range(0, nr_of_cells, nr_of_cells_per_block)):
+                block = slice(block_start, min(block_start+nr_of_cells_per_block, nr_of_cells))
+                slope, offset, residual = calculate_linear_fit_values_from_sums(
+                    read_fit_statistics(statistics_group, drs_value_type, block))
+                drs_value_slope[block] = slope
+                drs_value_offset[block] = offset
+                drs_value_residual[block] = residual
+
+            nr_of_failed_fits = np.count_nonzero(np.isnan(drs_value_slope))
+            if(nr_of_failed_fits > 0):
+                logging.error(' No fit possible for {} of {} cells'.format(
+                                nr_of_failed_fits, nr_of_cells))
+
+            column_collection = column_collection + get_fit_value_columns(
+                drs_value_type, drs_value_slope, drs_value_offset, drs_value_residual)
+
+    comment_str = "Residual: root mean square of the residuals"
+    write_fit_value_table(store_file_path, column_collection, interval_nr,
+                          low_limit, upp_limit, cut_off_error_factor,
+                          source_creation_date,
+                          header_cards=[('ResType', 'RMS', comment_str)])
+
+
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('source_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/dataCollection.h5',
+                type=click.Path(exists=True))
+@click.argument('interval_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/intervalIndices.h5',
+                type=click.Path(exists=True))
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/cumulativeFitSums.h5',
+                type=click.Path(exists=False))
+@click.option('--runs_per_step', '-r',
+              default=1,
+              help='Number of time ordered run series summed up in one step')
+@click.option('--drs_value_type', '-t',
+              default='Gain',
+              type=click.Choice(fit_value_config.drs_value_types))
+@click.option('--size_budget', '-m',
+              default=64.,
+              help='Max size in GB of the (uncompressed) cumulative sums')
+###############################################################################
+def store_cumulative_fit_sums_of_intervals(source_file_path: str,
+                                           interval_file_path: str,
+                                           store_file_path: str,
+                                           runs_per_step: int,
+                                           drs_value_type: str,
+                                           size_budget: float):
+    '''
+        Save per interval the cumulative sums over time of the sums
+        of the linear fit (see 'calculate_linear_fit_sums') for every cell.
+        The time ordered rows of the interval are grouped into steps of
+        runs_per_step rows, the sums of any range of steps are just the
+        difference of two rows of the cumulative sums, so the fit values
+        of any time window are available with 'calculate_rolling_fit_values'.
+        The values are selected with the masks of the interval file,
+        like in 'calculate_fit_values'.
+        The cumulative sums of the Baseline (ROI-based) need about 20 GB
+        per step, therefore just the sums of the drs_value_type
+        (by default the Gain) are stored and nothing is stored,
+        if their estimated size exceeds the size_budget.
 
-            model_value = slope*temp + offset
-            residual = value - model_value
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file with the extension '.h5'
+            interval_file_path (str):
+                Full path to the sourceParameter based intervalndices file
+                with the extension '.h5'
+            store_file_path (str):
+                Full path to the storeFile with the extension '.h5'
+            runs_per_step (int):
+                Number of time ordered run series summed up in one step
+            drs_value_type (str):
+                Name of the drs values
+            size_budget (float):
+                Max size in GB of the (uncompressed) cumulative sums
+    '''
+
+    logging.basicConfig(
+        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    with h5py.File(source_file_path, 'r') as data_source, \
+         h5py.File(interval_file_path, 'r') as interval_source:
+        nr_of_cells = data_source[drs_value_type].shape[1]
+        store_bytes = sum(get_cumulative_fit_sums_bytes(
+                            len(interval_source[groupname]['IntervalIndices']),
+                            runs_per_step, nr_of_cells)
+                          for groupname in interval_source)
+    if(store_bytes > size_budget*pow(2, 30)):
+        error_str = ('The cumulative sums of the {} need {:.2f} GB, ' +
+                     'more than the size budget of {:.2f} GB').format(
+                        drs_value_type, store_bytes/pow(2, 30), size_budget)
+        raise Exception(error_str)
+
+    with h5py.File(source_file_path, 'r') as data_source, \
+         h5py.File(interval_file_path, 'r') as interval_source, \
+         h5py.File(store_file_path, 'w') as store:
+
+        source_creation_date = data_source.attrs['CreationDate']
+        if(interval_source.attrs['SCDate'] != source_creation_date):
+            error_str = ('The interval file is not based on the given source file')
+            raise Exception(error_str)
+        store.attrs['SCDate'] = source_creation_date
+        store.attrs['DrsValueType'] = drs_value_type
+
+        time_dataset = data_source['Time'+drs_value_type]
+        time = np.array(time_dataset[:get_nr_of_rows(time_dataset), 0])
+
+        groupnames = sorted(interval_source.keys(), key=lambda name: int(name[len('Interval'):]))
+        for groupname in groupnames:
+            interval_group = interval_source[groupname]
+            interval_indices = np.array(interval_group['IntervalIndices'])
+            order = np.argsort(time[interval_indices], kind='stable')
+            row_indices = interval_indices[order]
+            step_starts = np.arange(0, len(row_indices), runs_per_step)
+            step_ends = np.append(step_starts[1:], len(row_indices))[:len(step_starts)]-1
+
+            statistics_group = store.create_group(groupname)
+            statistics_group.attrs['LowLimit'] = interval_group.attrs['LowLimit']
+            statistics_group.attrs['UppLimit'] = interval_group.attrs['UppLimit']
+            statistics_group.attrs['RunsPerStep'] = runs_per_step
+            statistics_group.create_dataset('StepBegin', data=time[row_indices[step_starts]])
+            statistics_group.create_dataset('StepEnd', data=time[row_indices[step_ends]])
+            if len(interval_indices) == 0:
+                continue
+
+            print('Loading ...', drs_value_type, ' : ', groupname)
+            store_cumulative_fit_sums(statistics_group, data_source, drs_value_type,
+                                      row_indices, step_starts,
+                                      interval_group.get(drs_value_type+'Mask'), order)
 
-            residual_mean_array[index] = np.mean(abs(residual))
-        except Exception as err_infos:
-            error_str = str(err_infos)
-            logging.error(index, value, error_str)
 
-        finally:
-            # dont trust the Garbage Collector, so force to free memory
-            del temp
-            del value
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('cumulative_sums_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/cumulativeFitSums.h5',
+                type=click.Path(exists=True))
+@click.argument('interval_nr',
+                default=3)
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/rollingFitValues_interval3.h5',
+                type=click.Path(exists=False))
+@click.option('--drs_value_type', '-t',
+              default='Gain',
+              type=click.Choice(fit_value_config.drs_value_types))
+@click.option('--window_size', '-w',
+              default=30.,
+              help='Length of the windows in days or steps')
+@click.option('--window_shift', '-s',
+              default=7.,
+              help='Shift of neighbouring windows in days or steps')
+@click.option('--unit', '-u',
+              default='days',
+              type=click.Choice(['days', 'steps']),
+              help="Unit of the window size and shift, 'steps' of the cumulative sums")
+###############################################################################
+def calculate_rolling_fit_values(cumulative_sums_file_path: str, interval_nr: int,
+                                 store_file_path: str, drs_value_type: str,
+                                 window_size: float, window_shift: float, unit: str):
+    '''
+        Calculate the linear fitvalues of the drs_value_type for every cell
+        in sliding time windows of the given interval, from the with
+        'store_cumulative_fit_sums_of_intervals' created cumulative sums.
+        The sums of a window are the difference of two rows of the
+        cumulative sums, so every window costs the same, independent
+        of its number of runs. A window contains all steps beginning in it.
+        The time series of the slope and offset maps is stored together with
+        the begin and end of the windows (in days since 1970)
+        and their number of steps into a .h5 File.
+
+        Args:
+            cumulative_sums_file_path (str):
+                Full path to the cumulative sums file with the extension '.h5'
+            interval_nr (int):
+                number of the selected interval
+            store_file_path (str):
+                Full path to the storeFile with the extension '.h5'
+            drs_value_type (str):
+                Name of the drs values
+            window_size (float):
+                Length of the windows in days or steps
+            window_shift (float):
+                Shift of neighbouring windows in days or steps
+            unit (str):
+                'days' or 'steps' (of the cumulative sums)
+    '''
+
+    logging.basicConfig(
+        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    groupname = 'Interval'+str(interval_nr)
+    max_block_bytes = pow(2, 27)
+
+    with h5py.File(cumulative_sums_file_path, 'r') as cumulative_sums, \
+         h5py.File(store_file_path, 'w') as store:
+        statistics_group = cumulative_sums[groupname]
+        if(drs_value_type+'CumSumCount' not in statistics_group):
+            error_str = ("The cumulative sums file contains no sums of the '" +
+                         drs_value_type+"' in "+groupname +
+                         " (see 'store_cumulative_fit_sums_of_intervals --drs_value_type')")
+            raise Exception(error_str)
+        step_begin = np.array(statistics_group['StepBegin'])
+        step_end = np.array(statistics_group['StepEnd'])
+        nr_of_steps = len(step_begin)
+        if(nr_of_steps == 0):
+            error_str = ('No runs in '+groupname)
+            raise Exception(error_str)
+
+        if(unit == 'days'):
+            window_begin = np.arange(step_begin[0], step_begin[-1]+window_shift, window_shift)
+            window_end = window_begin+window_size
+            first_steps = np.searchsorted(step_begin, window_begin, side='left')
+            last_steps = np.searchsorted(step_begin, window_end, side='left')
+        else:
+            first_steps = np.arange(0, nr_of_steps, int(window_shift))
+            last_steps = np.minimum(first_steps+int(window_size), nr_of_steps)
+            window_begin = step_begin[first_steps]
+            window_end = step_end[last_steps-1]
+        nr_of_windows = len(first_steps)
+        print('Windows:', nr_of_windows)
+
+        store.attrs['SCDate'] = cumulative_sums.attrs['SCDate']
+        store.attrs['IntNR'] = interval_nr
+        store.attrs['LowLimit'] = statistics_group.attrs['LowLimit']
+        store.attrs['UppLimit'] = statistics_group.attrs['UppLimit']
+        store.attrs['WindowSize'] = window_size
+        store.attrs['WindowShift'] = window_shift
+        store.attrs['Unit'] = unit
+        store.create_dataset('WindowBegin', data=window_begin)
+        store.create_dataset('WindowEnd', data=window_end)
+        store.create_dataset('NrOfSteps', data=last_steps-first_steps, dtype='uint32')
+
+        nr_of_cells = statistics_group[drs_value_type+'CumSumCount'].shape[1]
+        fit_value_unit = fit_value_config.value_units[drs_value_type]
+        fit_value_datasets = {}
+        for fit_value_name, unit_str in [('Slope', fit_value_unit+'/celsius'),
+                                         ('Offset', fit_value_unit)]:
+            dataset = store.create_dataset(
+                name=drs_value_type+fit_value_name, dtype='float32',
+                shape=(nr_of_windows, nr_of_cells),
+                chunks=(nr_of_windows, max(1, min(nr_of_cells, pow(2, 18)//nr_of_windows))),
+                compression='gzip', compression_opts=4,
+                fletcher32=True)
+            dataset.attrs['Unit'] = unit_str
+            fit_value_datasets[fit_value_name] = dataset
+
+        block_width = max(1, max_block_bytes//((nr_of_steps+1+2*nr_of_windows)*8))
+        for block_start in tqdm(range(0, nr_of_cells, block_width)):
+            block = slice(block_start, min(block_start+block_width, nr_of_cells))
+            window_sums = read_window_fit_sums(statistics_group, drs_value_type,
+                                               first_steps, last_steps, block)
+            slope, offset, residual = calculate_linear_fit_values_from_sums(window_sums)
+            # catch up gain standardization to 1 (see 'calculate_fit_values')
+            if(drs_value_type == 'Gain'):
+                slope /= DACfactor
+                offset /= DACfactor
+            fit_value_datasets['Slope'][:, block] = slope
+            fit_value_datasets['Offset'][:, block] = offset
+
+
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('fit_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/drsFitParameter_interval3.fits',
+                type=click.Path(exists=True))
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/version_1/drsFitParameter_interval3.map',
+                type=click.Path(exists=False))
+###############################################################################
+def store_fit_parameter_map(fit_file_path: str, store_file_path: str):
+    '''
+        Export the fit values of a .fits File into a memory-mappable file
+        (see 'export_fit_parameter_map'), which can be read
+        value by value with 'FitParameterMap'
+
+        Args:
+            fit_file_path (str):
+                Full path to the fit value file
+                with the extension '.fits'
+            store_file_path (str):
+                Full path to the storeFile
+                with the extension '.map'
+    '''
+    export_fit_parameter_map(fit_file_path, store_file_path, NRCELL)
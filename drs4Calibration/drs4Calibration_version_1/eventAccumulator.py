@@ -0,0 +1,266 @@
+import numpy as np
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRCHID, NRCELL, ROI
+
+
+# ########################################################################### #
+def iterate_event_blocks(fits_stream, nr_of_events_per_block):
+    '''
+        Collect the events of the given fits_stream into blocks.
+        Yields tuples of (start_cells, data) with the shapes
+        (nr_of_events, NRCHID) and (nr_of_events, NRCHID, roi),
+        the last block can contain less events.
+    '''
+
+    start_cell_block = None
+    data_block = None
+    nr_of_events = 0
+    for event in fits_stream:
+        if data_block is None:
+            # the event arrays can be reused by the stream, therefore copy them
+            start_cell_block = np.empty((nr_of_events_per_block,)+event['StartCellData'].shape,
+                                        dtype=event['StartCellData'].dtype)
+            data_block = np.empty((nr_of_events_per_block,)+event['Data'].shape,
+                                  dtype=event['Data'].dtype)
+
+        start_cell_block[nr_of_events] = event['StartCellData']
+        data_block[nr_of_events] = event['Data']
+        nr_of_events += 1
+        if(nr_of_events == nr_of_events_per_block):
+            yield (start_cell_block, data_block)
+            nr_of_events = 0
+
+    if(nr_of_events > 0):
+        yield (start_cell_block[:nr_of_events], data_block[:nr_of_events])
+
+
+# ########################################################################### #
+class StartCellSumAccumulator:
+    '''
+        Sum up the ROI-samples of every event per chid and start cell.
+        The events are added blockwise, all (chid, start_cell) keys of a block
+        are sorted once and the samples are summed with one 'reduceat'
+        instead of a read-modify-write of all chids per event.
+        The sums are kept in one shard per chid as int16 offsets from
+        a reference value of the chid (the rounded mean of its first events),
+        exact for the 12 Bit ADC values, a shard is promoted to int32
+        as soon as one of its sums would leave the int16 range.
+        The counts are kept as uint16.
+        With_std the sum of squared deviations (M2) is accumulated too,
+        every block is merged like in the 'RolledMeanVarAccumulator'.
+        M2 is summed up over the samples, so just one float64 value
+        per chid and start cell is kept (see 'get_std').
+    '''
+
+    max_nr_of_events = np.iinfo('uint16').max
+
+    def __init__(self, roi=ROI, with_std=False):
+        self.roi = roi
+        self.value_sum = [np.zeros((NRCELL, roi), dtype='int16') for chid in range(NRCHID)]
+        self.reference = None
+        self.count = np.zeros(NRCHID*NRCELL, dtype='uint16')
+        self.m2 = None
+        if with_std:
+            self.m2 = np.zeros(NRCHID*NRCELL, dtype='float64')
+        self.nr_of_events = 0
+        self.chid_array_offset = np.arange(NRCHID, dtype='int64')*NRCELL
+
+    def add_events(self, start_cells, data):
+        '''
+            start_cells (array): shape (nr_of_events, NRCHID)
+            data (array): shape (nr_of_events, NRCHID, roi)
+        '''
+        nr_of_events = data.shape[0]
+        if(self.nr_of_events+nr_of_events > self.max_nr_of_events):
+            raise Exception('More than {} events per run are not supported'.format(
+                                self.max_nr_of_events))
+        if self.value_sum is None:
+            raise Exception('The mean of the accumulator was already taken')
+        self.nr_of_events += nr_of_events
+        if self.reference is None:
+            self.reference = np.round(np.mean(data, axis=(0, 2))).astype('int32')
+
+        keys = (start_cells.astype('int64')+self.chid_array_offset).reshape(-1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        unique_keys, first_indices = np.unique(sorted_keys, return_index=True)
+
+        sorted_data = data.reshape(-1, self.roi)[order]
+        block_sum = np.add.reduceat(sorted_data, first_indices, axis=0, dtype='int32')
+        block_count = np.diff(np.append(first_indices, len(keys)))
+
+        # the offset sums of the keys, gathered from the shards
+        key_chids = unique_keys//NRCELL
+        chid_bounds = np.searchsorted(key_chids, np.arange(NRCHID+1))
+        value_sum = np.empty(block_sum.shape, dtype='int32')
+        for chid in range(NRCHID):
+            rows = slice(chid_bounds[chid], chid_bounds[chid+1])
+            value_sum[rows] = self.value_sum[chid][unique_keys[rows]-chid*NRCELL]
+
+        if self.m2 is not None:
+            self.merge_m2(unique_keys, first_indices, sorted_data, block_sum,
+                          block_count, value_sum, self.reference[key_chids])
+
+        block_sum -= (block_count*self.reference[key_chids])[:, None].astype('int32')
+        value_sum += block_sum
+        for chid in range(NRCHID):
+            rows = slice(chid_bounds[chid], chid_bounds[chid+1])
+            shard = self.value_sum[chid]
+            if(shard.dtype == 'int16' and
+               (value_sum[rows].min(initial=0) < np.iinfo('int16').min or
+                value_sum[rows].max(initial=0) > np.iinfo('int16').max)):
+                shard = self.value_sum[chid] = shard.astype('int32')
+            shard[unique_keys[rows]-chid*NRCELL] = value_sum[rows]
+        self.count[unique_keys] += block_count.astype('uint16')
+
+    def merge_m2(self, unique_keys, first_indices, sorted_data, block_sum,
+                 block_count, value_sum, reference):
+        '''
+            Merge the M2 (summed up over the samples) of the block
+            into the M2 of the keys with the pairwise update of Chan et al.,
+            in float32 and in place, so the block needs little memory
+        '''
+        block_mean = np.divide(block_sum, block_count[:, None], dtype='float32')
+        deviation = np.repeat(block_mean, block_count, axis=0)
+        np.subtract(sorted_data, deviation, out=deviation)
+        np.multiply(deviation, deviation, out=deviation)
+        block_m2 = np.add.reduceat(np.sum(deviation, axis=1, dtype='float64'), first_indices)
+        del deviation
+
+        count = self.count[unique_keys].astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.divide(value_sum, count[:, None], dtype='float32')
+        delta += reference[:, None]
+        np.subtract(block_mean, delta, out=delta)
+        delta[count == 0] = 0.
+        np.multiply(delta, delta, out=delta)
+        block_m2 += np.sum(delta, axis=1, dtype='float64')*(count*block_count/(count+block_count))
+        del delta
+        self.m2[unique_keys] += block_m2
+
+    def get_mean(self, chid):
+        '''
+            Return the float32 mean per start cell and sample of the chid
+            as flat array of the length NRCELL*roi.
+            Cells without any value are set to nan.
+        '''
+        rows = slice(chid*NRCELL, (chid+1)*NRCELL)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_values = np.divide(self.value_sum[chid], self.count[rows, None],
+                                    dtype='float32')
+        if self.reference is not None:
+            mean_values += self.reference[chid]
+        return mean_values.reshape(-1)
+
+    def iterate_mean(self):
+        '''
+            Yield the mean of every chid (see 'get_mean') and release
+            the sums of the chid, so the memory of the sums shrinks
+            while the means are stored.
+            The accumulator can not be used anymore afterwards.
+        '''
+        for chid in range(NRCHID):
+            yield self.get_mean(chid)
+            self.value_sum[chid] = None
+        self.value_sum = None
+
+    def get_std(self):
+        '''
+            Return the float16 standard deviation of the mean per chid
+            and start cell, the root mean square over the samples of the
+            sqrt(M2)/(count-1) of every sample (like the GainStd),
+            as flat array of the length NRCHID*NRCELL.
+            Start cells with less than two events are set to nan.
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_values = np.sqrt(self.m2/self.roi)/(self.count.astype('float64')-1)
+        std_values[self.count < 2] = np.nan
+        return std_values.astype('float16')
+
+
+# ########################################################################### #
+roll_index_tables = {}
+
+
+def get_roll_index_table(nr_of_cells=NRCELL):
+    '''
+        Cached table of the shape (nr_of_cells, nr_of_cells),
+        row 'start_cell' contains the sample indices, which roll the samples
+        of a chid read out from 'start_cell' on into the cell order:
+        rolled[cell] = data[(cell - start_cell) % nr_of_cells]
+    '''
+    if nr_of_cells not in roll_index_tables:
+        cell_indices = np.arange(nr_of_cells, dtype='int32')
+        roll_index_tables[nr_of_cells] = np.mod(
+            cell_indices[None, :] - cell_indices[:, None], nr_of_cells).astype('int16')
+    return roll_index_tables[nr_of_cells]
+
+
+# ########################################################################### #
+class RolledMeanVarAccumulator:
+    '''
+        Mean and variance per chid and cell of full (ROI 1024) events.
+        The events are rolled into the cell order and accumulated blockwise:
+        every block gets its own mean and sum of squared deviations (M2),
+        which are merged into the running state with the pairwise update
+        of Chan et al.. The same merge combines partial states (count, mean, M2)
+        of separate event ranges or processes exactly.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros((NRCHID, NRCELL), dtype='float64')
+        self.m2 = np.zeros((NRCHID, NRCELL), dtype='float64')
+
+    def add_events(self, start_cells, data):
+        '''
+            start_cells (array): shape (nr_of_events, NRCHID)
+            data (array): shape (nr_of_events, NRCHID, NRCELL)
+        '''
+        nr_of_events = data.shape[0]
+        roll_indices = get_roll_index_table(data.shape[2])[start_cells]
+        rolled_data = np.take_along_axis(data, roll_indices, axis=2)
+        del roll_indices
+
+        block_mean = np.sum(rolled_data, axis=0, dtype='float64')
+        block_mean /= nr_of_events
+        deviation = np.subtract(rolled_data, block_mean, dtype='float64')
+        del rolled_data
+        np.multiply(deviation, deviation, out=deviation)
+        block_m2 = np.sum(deviation, axis=0)
+
+        self.merge(nr_of_events, block_mean, block_m2)
+
+    def merge(self, count, mean, m2):
+        '''
+            Combine the given partial state (count, mean, M2)
+            with the state of this accumulator
+        '''
+        if(count == 0):
+            return
+        if(self.count == 0):
+            self.count = count
+            self.mean = np.array(mean, dtype='float64')
+            self.m2 = np.array(m2, dtype='float64')
+            return
+
+        total_count = self.count+count
+        delta = np.subtract(mean, self.mean, dtype='float64')
+        self.m2 += m2
+        self.m2 += delta*delta*(self.count*count/total_count)
+        delta *= count/total_count
+        self.mean += delta
+        self.count = total_count
+
+    def get_state(self):
+        return (self.count, self.mean, self.m2)
+
+    def get_mean_and_std(self):
+        '''
+            Return the mean and the standard deviation of the mean
+            sqrt(var/(count-1)) with var = M2/(count-1),
+            both as flat float64 arrays of the length NRCHID*NRCELL.
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_values = np.sqrt(self.m2)/(self.count-1)
+        return (self.mean.reshape(-1), std_values.reshape(-1))
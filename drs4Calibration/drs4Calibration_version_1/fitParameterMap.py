@@ -0,0 +1,155 @@
+import json
+import numpy as np
+
+from astropy.io import fits
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRCELL
+
+
+# the file starts with this marker and the byte length of the json header,
+# the header and every array are aligned to pages of this size
+fit_parameter_map_marker = b'DRSFPMAP'
+fit_parameter_map_alignment = 4096
+fit_parameter_map_version = 1
+
+# keywords of the primary header of the fit value table, copied into the header
+fit_parameter_map_keywords = ['IntNR', 'LowLimit', 'UppLimit', 'SCDate', 'CutOff', 'ResType']
+
+
+# ########################################################################### #
+def get_aligned_offset(offset):
+    return offset+(-offset % fit_parameter_map_alignment)
+
+
+# ########################################################################### #
+def export_fit_parameter_map(fit_file_path, store_file_path,
+                             nr_of_cells=NRCELL, max_block_bytes=pow(2, 26)):
+    '''
+        Export the fit values of a .fits File
+        (see 'write_fit_value_table') to a flat file with a small json header,
+        every column as little-endian float32 array of the shape
+        (nr_of_chids, nr_of_cells, nr_of_values_per_cell) aligned to a page.
+        The file can be memory-mapped (see 'FitParameterMap'),
+        so every value is read with O(1) page reads.
+        The fits table is copied in blocks of at most max_block_bytes.
+
+        Args:
+            fit_file_path (str):
+                Full path to the fit value file
+                with the extension '.fits'
+            store_file_path (str):
+                Full path to the storeFile
+            nr_of_cells (int):
+                Number of cells per chid
+            max_block_bytes (int):
+                Max bytes of the table rows copied at once
+    '''
+    with fits.open(fit_file_path, memmap=True) as hdu_list:
+        primary_header = hdu_list[0].header
+        table = hdu_list['FitParameter']
+        nr_of_rows = table.header['NAXIS2']
+        if(nr_of_rows % nr_of_cells != 0):
+            error_str = ('The {} rows of the fit values '.format(nr_of_rows) +
+                         'are no multiple of {} cells'.format(nr_of_cells))
+            raise Exception(error_str)
+
+        header = {'Format': 'drsFitParameterMap',
+                  'Version': fit_parameter_map_version,
+                  'Alignment': fit_parameter_map_alignment,
+                  'NrOfChids': nr_of_rows//nr_of_cells,
+                  'NrOfCells': nr_of_cells,
+                  'Source': str(fit_file_path),
+                  'Arrays': []}
+        for keyword in fit_parameter_map_keywords:
+            if keyword in primary_header:
+                header[keyword] = primary_header[keyword]
+
+        columns = table.columns
+        for column in columns:
+            if(column.format.format != 'E'):
+                error_str = ('Only float32 (E) columns are supported, not ' +
+                             str(column.format))
+                raise Exception(error_str)
+            header['Arrays'].append({'Name': column.name,
+                                     'Unit': column.unit,
+                                     'Dtype': '<f4',
+                                     'Shape': [nr_of_rows//nr_of_cells, nr_of_cells,
+                                               column.format.repeat]})
+
+        # the header has to fit in front of the first array, which depends on its size
+        data_offset = fit_parameter_map_alignment
+        while True:
+            offset = data_offset
+            for array_info in header['Arrays']:
+                array_info['Offset'] = offset
+                offset = get_aligned_offset(offset+int(np.prod(array_info['Shape']))*4)
+            header_bytes = json.dumps(header).encode('ascii')
+            if(16+len(header_bytes) <= data_offset):
+                break
+            data_offset = get_aligned_offset(16+len(header_bytes))
+
+        with open(store_file_path, 'wb') as store_file:
+            store_file.write(fit_parameter_map_marker)
+            store_file.write(len(header_bytes).to_bytes(8, 'little'))
+            store_file.write(header_bytes)
+            store_file.truncate(offset)
+
+            table_data = table.data
+            row_bytes = table.header['NAXIS1']
+            nr_of_rows_per_block = max(1, max_block_bytes//row_bytes)
+            for array_info in header['Arrays']:
+                values_per_row = array_info['Shape'][2]
+                for block_start in range(0, nr_of_rows, nr_of_rows_per_block):
+                    block_stop = min(block_start+nr_of_rows_per_block, nr_of_rows)
+                    values = np.asarray(table_data[array_info['Name']][block_start:block_stop],
+                                        dtype='<f4')
+                    store_file.seek(array_info['Offset']+block_start*values_per_row*4)
+                    store_file.write(values.tobytes())
+
+
+# ########################################################################### #
+class FitParameterMap:
+    '''
+        Read-only memory map of an 'export_fit_parameter_map' file.
+        The arrays are np.memmap of the shape (chid, cell, value of the cell),
+        so only the pages of the used values are read and all processes
+        share one copy in the page cache.
+
+        Example:
+            fit_map = FitParameterMap(file_path)
+            slope = fit_map['BaselineSlope'][chid, cell, sample]
+    '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as map_file:
+            if(map_file.read(len(fit_parameter_map_marker)) != fit_parameter_map_marker):
+                raise Exception('No fit parameter map: '+str(file_path))
+            header_length = int.from_bytes(map_file.read(8), 'little')
+            self.header = json.loads(map_file.read(header_length).decode('ascii'))
+        if(self.header['Version'] > fit_parameter_map_version):
+            error_str = ('Unknown version {} of the fit parameter map').format(
+                            self.header['Version'])
+            raise Exception(error_str)
+
+        self.arrays = {}
+        for array_info in self.header['Arrays']:
+            self.arrays[array_info['Name']] = np.memmap(
+                file_path, mode='r', dtype=array_info['Dtype'],
+                shape=tuple(array_info['Shape']), offset=array_info['Offset'])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def get_values(self, name, chid, cell, value_nr=0):
+        '''
+            Values of the column name for the (arrays of) chid, cell and
+            value_nr (sample of the baseline), only their pages are read
+        '''
+        return self.arrays[name][chid, cell, value_nr]
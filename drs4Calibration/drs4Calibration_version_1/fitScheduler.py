@@ -0,0 +1,183 @@
+import os
+import logging
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+
+
+# the linear fit works on blocks of this number of cells (see 'calculate_linear_fit_values')
+# with about this number of float64 temporary arrays
+nr_of_cells_per_fit_block = 512
+nr_of_fit_block_arrays = 6
+
+# at least this number of tasks per job, so the jobs finish at about the same time
+min_nr_of_tasks_per_job = 4
+
+
+# ########################################################################### #
+class FitTaskPlan:
+    '''
+        Column ranges of the fit tasks of one drs value type together with
+        the number of jobs, which fit into the memory budget.
+        Every task is one column range (start, stop) of a single temperature
+        sensor, the ranges are aligned with the chunks of the drs values.
+    '''
+
+    def __init__(self, jobs, blas_threads, task_width, tasks,
+                 task_bytes, memory_budget, nr_of_rows):
+        self.jobs = jobs
+        self.blas_threads = blas_threads
+        self.task_width = task_width
+        self.tasks = tasks
+        self.task_bytes = task_bytes
+        self.memory_budget = memory_budget
+        self.nr_of_rows = nr_of_rows
+
+    def report(self, drs_value_type):
+        '''Log the plan'''
+        info_str = (' Fit plan {}: {} jobs with {} BLAS thread(s), '.format(
+                        drs_value_type, self.jobs, self.blas_threads) +
+                    '{} tasks of up to {} values x {} rows, '.format(
+                        len(self.tasks), self.task_width, self.nr_of_rows) +
+                    '~{:.2f} GB per task, ~{:.2f} GB of the {:.2f} GB budget'.format(
+                        self.task_bytes/pow(2, 30), self.jobs*self.task_bytes/pow(2, 30),
+                        self.memory_budget/pow(2, 30)))
+        logging.info(info_str)
+
+
+# ########################################################################### #
+def get_fit_task_bytes(nr_of_rows, task_width, value_bytes, worker_reads=False):
+    '''
+        Estimated memory of one fit task: the drs values and the mask
+        in the worker (and in the parent waiting for dispatch,
+        if not worker_reads), the temporary arrays of the fit and the results
+    '''
+    data_copies = 1 if worker_reads else 2
+    data_bytes = nr_of_rows*task_width*(value_bytes+1)
+    fit_bytes = nr_of_rows*min(task_width, nr_of_cells_per_fit_block)*8*nr_of_fit_block_arrays
+    return data_copies*data_bytes+fit_bytes+task_width*3*8
+
+
+# ########################################################################### #
+def get_fit_task_plan(nr_of_rows, nr_of_values, chunk_width, value_bytes,
+                      memory_budget, jobs, blas_threads=1, worker_reads=False):
+    '''
+        Plan the fit tasks of one drs value type:
+        the widest tasks, which let 'jobs' tasks at once fit into
+        the memory_budget (fewer jobs, if not even the smallest tasks fit),
+        but enough tasks to keep all jobs busy.
+        The task width is a multiple of the chunk_width, if possible,
+        so every chunk is read by just one task.
+
+        Args:
+            nr_of_rows (int):
+                Number of rows (run series) of the interval
+            nr_of_values (int):
+                Number of drs values (columns)
+            chunk_width (int):
+                Number of columns of the chunks of the drs values
+            value_bytes (int):
+                Bytes of one read drs value (including a decoding)
+            memory_budget (int):
+                Memory in bytes for all jobs together
+            jobs (int):
+                Max number of worker processes
+            blas_threads (int):
+                Number of BLAS threads per worker
+            worker_reads (bool):
+                The workers read the drs values of their tasks themselves
+
+        Returns:
+            FitTaskPlan
+    '''
+    if(nr_of_values % NRTEMPSENSOR != 0):
+        raise Exception('Bad number of values: remaining cells')
+    values_per_sensor = nr_of_values//NRTEMPSENSOR
+    min_width = max(1, min(chunk_width, values_per_sensor))
+    min_task_bytes = get_fit_task_bytes(nr_of_rows, min_width, value_bytes, worker_reads)
+    if(min_task_bytes > memory_budget):
+        error_str = ('The memory budget of {:.2f} GB is too small ' +
+                     'for a fit task of {:.2f} GB').format(
+                        memory_budget/pow(2, 30), min_task_bytes/pow(2, 30))
+        raise Exception(error_str)
+    jobs = int(max(1, min(jobs, memory_budget//min_task_bytes)))
+
+    # largest width with a task in the budget of a job (see 'get_fit_task_bytes')
+    data_copies = 1 if worker_reads else 2
+    column_bytes = data_copies*nr_of_rows*(value_bytes+1)+3*8
+    fixed_bytes = nr_of_rows*nr_of_cells_per_fit_block*8*nr_of_fit_block_arrays
+    job_budget = memory_budget//jobs
+    task_width = int((job_budget-fixed_bytes)//column_bytes)
+    if(task_width < nr_of_cells_per_fit_block):
+        # the fit blocks of narrower tasks are just as wide as the task
+        task_width = int(job_budget//(column_bytes+nr_of_rows*8*nr_of_fit_block_arrays))
+    task_width = min(task_width, values_per_sensor,
+                     max(1, nr_of_values//(jobs*min_nr_of_tasks_per_job)))
+    if(task_width >= chunk_width):
+        task_width -= task_width % chunk_width
+    task_width = max(1, task_width)
+
+    tasks = []
+    for sensor in range(NRTEMPSENSOR):
+        sensor_start = sensor*values_per_sensor
+        sensor_stop = sensor_start+values_per_sensor
+        # borders on the grid of the task width, so the tasks are chunk aligned
+        borders = [sensor_start]
+        borders += list(range((sensor_start//task_width+1)*task_width, sensor_stop, task_width))
+        borders += [sensor_stop]
+        tasks += [(sensor, start, stop) for start, stop in zip(borders[:-1], borders[1:])]
+
+    return FitTaskPlan(jobs, blas_threads, task_width, tasks,
+                       get_fit_task_bytes(nr_of_rows, task_width, value_bytes, worker_reads),
+                       memory_budget, nr_of_rows)
+
+
+# ########################################################################### #
+class FitCheckpoint:
+    '''
+        Persistent record of the finished fit tasks of a run
+        in the scratch folder: the first line identifies the run (run_key),
+        every further line is the key of one finished task.
+        The lines are synced to disk, so a restarted run with the same run_key
+        skips all tasks, which are finished before the crash.
+        A checkpoint of an other run is discarded.
+    '''
+
+    def __init__(self, scratch_folder_path, run_key):
+        self.path = os.path.join(scratch_folder_path, 'fitCheckpoint.txt')
+        self.finished_tasks = set()
+        self.resumed = False
+        if os.path.isfile(self.path):
+            with open(self.path, 'r') as checkpoint_file:
+                lines = checkpoint_file.read().split('\n')
+            # a last line without line end can be left by a crash
+            if(lines[0] == run_key):
+                self.finished_tasks = set(lines[1:-1])
+                self.resumed = True
+            else:
+                logging.warning(' Discard the checkpoint of an other run')
+        if not self.resumed:
+            with open(self.path, 'w') as checkpoint_file:
+                checkpoint_file.write(run_key+'\n')
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+        else:
+            logging.info(' Resume with {} finished fit tasks'.format(len(self.finished_tasks)))
+
+    @staticmethod
+    def get_task_key(drs_value_type, interval_nr, start, stop):
+        return '{} {} {} {}'.format(drs_value_type, interval_nr, start, stop)
+
+    def is_finished(self, task_key):
+        return task_key in self.finished_tasks
+
+    def set_finished(self, task_keys):
+        with open(self.path, 'a') as checkpoint_file:
+            for task_key in task_keys:
+                checkpoint_file.write(task_key+'\n')
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        self.finished_tasks.update(task_keys)
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,309 @@
+import numpy as np
+import h5py
+import logging
+
+from tqdm import tqdm
+
+from drs4Calibration.linearFit import calculate_linear_fit_sums, linear_fit_sum_names
+from drs4Calibration.h5pyTools import get_nr_of_rows, read_h5py_rows, read_bit_packed_mask
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+
+
+# ########################################################################### #
+def update_fit_statistics_file(source_file_path, statistics_file_path,
+                               interval_limits, list_of_interval_indices,
+                               drs_value_types, cut_off_error_factor):
+    '''
+        Add all rows of the source, which are not yet in the statistics file,
+        to the per interval and per cell sums of the linear fit
+        (see 'calculate_linear_fit_sums'). A missing statistics file is created.
+        Together with the sums the sum and the number of the std values
+        are kept, the new values are selected like in 'get_indice_mask' with
+        the mean std of all values of the cell so far. Values of earlier updates
+        are not selected again, so just a new statistics file has the selection
+        of the interval masks.
+        Rows of the source, which are overwritten since the last update
+        (changed run series), can not be removed from the sums,
+        in this case an exception asks for a new statistics file.
+
+        Args:
+            source_file_path (str):
+                Full path to the sourceParameter file with the extension '.h5'
+            statistics_file_path (str):
+                Full path to the statistics file with the extension '.h5'
+            interval_limits (list):
+                Limits of the intervals of the source
+            list_of_interval_indices (list):
+                Source rows of every interval
+            drs_value_types (list):
+                Names of the drs values
+            cut_off_error_factor (dict):
+                'CutOffErrorFactor' of the drs values with std
+    '''
+
+    with h5py.File(source_file_path, 'r') as data_source, \
+         h5py.File(statistics_file_path, 'a') as statistics:
+
+        if not statistics.attrs.get('Complete', True):
+            error_str = ('The last update of the statistics file was interrupted, ' +
+                         'please remove it and create it again')
+            raise Exception(error_str)
+
+        nr_of_source_rows = get_nr_of_rows(data_source['Time'+drs_value_types[0]])
+        row_signatures = get_row_signatures(data_source, nr_of_source_rows)
+        nr_of_stored_rows = int(statistics.attrs.get('NrOfRows', 0))
+        if nr_of_stored_rows > nr_of_source_rows or (
+           nr_of_stored_rows > 0 and
+           not np.array_equal(statistics['RowSignature'][:],
+                              row_signatures[:nr_of_stored_rows], equal_nan=True)):
+            error_str = ('Rows of the source changed since the last update ' +
+                         'of the statistics file, please create it again')
+            raise Exception(error_str)
+
+        statistics.attrs['Complete'] = False
+        for interval_nr, interval_indices in enumerate(list_of_interval_indices, start=1):
+            statistics_group = statistics.require_group('Interval'+str(interval_nr))
+            statistics_group.attrs['LowLimit'] = interval_limits[interval_nr-1].strftime('%Y-%m-%d %H')
+            statistics_group.attrs['UppLimit'] = interval_limits[interval_nr].strftime('%Y-%m-%d %H')
+
+            new_row_indices = interval_indices[interval_indices >= nr_of_stored_rows]
+            logging.info(' Interval{}: add {} rows'.format(interval_nr, len(new_row_indices)))
+            for drs_value_type in drs_value_types:
+                init_fit_statistics(statistics_group, data_source, drs_value_type,
+                                    cut_off_error_factor.get(drs_value_type))
+                if(len(new_row_indices) > 0):
+                    add_rows_to_fit_statistics(statistics_group, data_source,
+                                               drs_value_type, new_row_indices)
+
+        if 'RowSignature' in statistics:
+            del statistics['RowSignature']
+        statistics.create_dataset('RowSignature', data=row_signatures)
+        statistics.attrs['NrOfRows'] = nr_of_source_rows
+        statistics.attrs['SCDate'] = data_source.attrs['CreationDate']
+        statistics.attrs['Complete'] = True
+
+
+# ########################################################################### #
+def get_row_signatures(data_source, nr_of_rows):
+    '''
+        Signature of the run serie of every source row
+        (see 'RunSerieManifest'), nan for sources without manifest
+    '''
+    row_signatures = np.full((nr_of_rows, 6), np.nan)
+    if 'RunSerieManifest' not in data_source:
+        return row_signatures
+
+    manifest = data_source['RunSerieManifest']
+    # without the padding rows of a not closed appender
+    nr_of_records = min(get_nr_of_rows(manifest['Row']), get_nr_of_rows(manifest['Signature']))
+    rows = manifest['Row'][:nr_of_records, 0]
+    signatures = manifest['Signature'][:nr_of_records]
+    # later records overwrite earlier ones
+    used = (rows >= 0) & (rows < nr_of_rows)
+    row_signatures[rows[used]] = signatures[used]
+    return row_signatures
+
+
+# ########################################################################### #
+def init_fit_statistics(statistics_group, data_source, drs_value_type, cut_off_error_factor):
+    '''Create the empty sums of the drs_value_type, if not existing'''
+    if drs_value_type+'Count' in statistics_group:
+        return
+
+    nr_of_cells = {sum_name: data_source[drs_value_type].shape[1]
+                   for sum_name in linear_fit_sum_names}
+    if(cut_off_error_factor is not None and drs_value_type+'Std' in data_source):
+        statistics_group.attrs['CutOff'+drs_value_type] = cut_off_error_factor
+        # one std value per start cell of the ROI-samples (Baseline)
+        nr_of_std_cells = data_source[drs_value_type+'Std'].shape[1]
+        nr_of_cells.update({'SumStd': nr_of_std_cells, 'CountStd': nr_of_std_cells})
+
+    for sum_name in nr_of_cells:
+        statistics_group.create_dataset(
+            name=drs_value_type+sum_name, dtype='float64',
+            shape=(nr_of_cells[sum_name],), fillvalue=0.,
+            compression='gzip', compression_opts=4,
+            fletcher32=True)
+
+
+# ########################################################################### #
+def add_rows_to_fit_statistics(statistics_group, data_source, drs_value_type,
+                               row_indices, max_block_bytes=pow(2, 27)):
+    '''
+        Add the given rows of the source to the sums of the drs_value_type,
+        blockwise over the cells, so never more than
+        a block of the values is in memory
+    '''
+    drs_value_source = data_source[drs_value_type]
+    nr_of_cells = drs_value_source.shape[1]
+    cells_per_temp_sensor = nr_of_cells//NRTEMPSENSOR
+    temperature = read_h5py_rows(data_source['Temp'+drs_value_type], row_indices)
+
+    with_std = drs_value_type+'SumStd' in statistics_group
+    cut_off_error_factor = statistics_group.attrs.get('CutOff'+drs_value_type)
+    values_per_std = 1
+    if with_std:
+        values_per_std = nr_of_cells//statistics_group[drs_value_type+'SumStd'].shape[0]
+
+    # blocks of whole source chunks and whole std cells
+    chunk_width = drs_value_source.chunks[1] if drs_value_source.chunks else 1
+    chunk_width = int(np.lcm(chunk_width, values_per_std))
+    column_bytes = len(row_indices)*8
+    block_width = max(1, max_block_bytes//(column_bytes*chunk_width))*chunk_width
+    for block_start in tqdm(range(0, nr_of_cells, block_width)):
+        block = slice(block_start, min(block_start+block_width, nr_of_cells))
+        drs_value_array = read_h5py_rows(drs_value_source, row_indices, block)
+
+        if with_std:
+            std_block = slice(block.start//values_per_std, block.stop//values_per_std)
+            drs_value_std_array = read_h5py_rows(data_source[drs_value_type+'Std'],
+                                                 row_indices, std_block)
+            without_std = np.isnan(drs_value_std_array)
+            sum_std = add_to_dataset(statistics_group[drs_value_type+'SumStd'], std_block,
+                                     np.nansum(drs_value_std_array, axis=0, dtype='float64'))
+            count_std = add_to_dataset(statistics_group[drs_value_type+'CountStd'], std_block,
+                                       np.count_nonzero(~without_std, axis=0))
+            # like 'get_indice_mask' with the float64 mean of the std values
+            with np.errstate(invalid='ignore', divide='ignore'):
+                drs_value_std_limit = np.multiply(sum_std/count_std, cut_off_error_factor)
+            mask = np.repeat(drs_value_std_array < drs_value_std_limit[None, :],
+                             values_per_std, axis=1)
+            mask |= (np.repeat(without_std, values_per_std, axis=1) &
+                     np.isfinite(drs_value_array))
+        else:
+            # without std, just ignore the zero values
+            mask = (drs_value_array != 0)
+
+        sensors = np.arange(block.start, block.stop)//cells_per_temp_sensor
+        sums = calculate_linear_fit_sums(temperature[:, sensors], drs_value_array, mask)
+        for sum_name in linear_fit_sum_names:
+            add_to_dataset(statistics_group[drs_value_type+sum_name], block, sums[sum_name])
+
+
+# ########################################################################### #
+def add_to_dataset(dataset, selection, values):
+    '''Add the values to the dataset[selection] and return the new values'''
+    values = dataset[selection]+values
+    dataset[selection] = values
+    return values
+
+
+# ########################################################################### #
+def read_fit_statistics(statistics_group, drs_value_type, selection=slice(None)):
+    '''Return the sums of the drs_value_type as dict for the given cells'''
+    return {sum_name: statistics_group[drs_value_type+sum_name][selection]
+            for sum_name in linear_fit_sum_names}
+
+
+# ########################################################################### #
+def get_cumulative_fit_sums_bytes(nr_of_rows, runs_per_step, nr_of_cells):
+    '''
+        Bytes of the (uncompressed) cumulative sums of a drs_value_type
+        with the given number of rows and cells (see 'store_cumulative_fit_sums')
+    '''
+    if(nr_of_rows == 0):
+        return 0
+    nr_of_steps = -(-nr_of_rows//runs_per_step)
+    return (nr_of_steps+1)*nr_of_cells*len(linear_fit_sum_names)*8
+
+
+# ########################################################################### #
+def store_cumulative_fit_sums(statistics_group, data_source, drs_value_type,
+                              row_indices, step_starts, mask_source=None, mask_row_order=None,
+                              max_block_bytes=pow(2, 27)):
+    '''
+        Store the cumulative sums of the linear fit (see 'calculate_linear_fit_sums')
+        over the steps of the time ordered rows. Row k of the datasets
+        '<drs_value_type>CumSum<sum name>' contains the sums of all values
+        of the steps before step k, so the sums of the steps i to j-1 are
+        just the difference of the rows j and i, for every cell.
+
+        Args:
+            statistics_group (h5py.Group):
+                Group to store the datasets
+            data_source (h5py.File):
+                The sourceParameter file
+            drs_value_type (str):
+                Name of the drs values
+            row_indices (array):
+                Source rows in time order
+            step_starts (array):
+                Position of the first row of every step in the row_indices
+            mask_source (h5py.Dataset):
+                Optional (bit-packed) interval mask, without mask
+                the zero values are ignored
+            mask_row_order (array):
+                Rows of the mask in the order of the row_indices
+    '''
+    drs_value_source = data_source[drs_value_type]
+    nr_of_cells = drs_value_source.shape[1]
+    cells_per_temp_sensor = nr_of_cells//NRTEMPSENSOR
+    nr_of_steps = len(step_starts)
+    temperature = read_h5py_rows(data_source['Temp'+drs_value_type], row_indices).astype('float64')
+
+    chunk_width = max(1, min(nr_of_cells, pow(2, 17)//(nr_of_steps+1)))
+    cumulative_sums = {}
+    for sum_name in linear_fit_sum_names:
+        cumulative_sums[sum_name] = statistics_group.create_dataset(
+            name=drs_value_type+'CumSum'+sum_name, dtype='float64',
+            shape=(nr_of_steps+1, nr_of_cells),
+            chunks=(nr_of_steps+1, chunk_width),
+            compression='gzip', compression_opts=4,
+            fletcher32=True)
+
+    # blocks of whole source chunks
+    source_chunk_width = drs_value_source.chunks[1] if drs_value_source.chunks else 1
+    column_bytes = max(len(row_indices), nr_of_steps+1)*8
+    block_width = max(1, max_block_bytes//(column_bytes*source_chunk_width))*source_chunk_width
+    for block_start in tqdm(range(0, nr_of_cells, block_width)):
+        block = slice(block_start, min(block_start+block_width, nr_of_cells))
+        value = read_h5py_rows(drs_value_source, row_indices, block).astype('float64')
+        if mask_source is None:
+            mask = (value != 0)
+        else:
+            mask = read_bit_packed_mask(mask_source, block)
+            if mask_row_order is not None:
+                mask = mask[mask_row_order]
+
+        sensors = np.arange(block.start, block.stop)//cells_per_temp_sensor
+        temp = np.where(mask, temperature[:, sensors], 0.)
+        value[~mask] = 0.
+        for sum_name in linear_fit_sum_names:
+            step_sums = np.add.reduceat(get_sum_term(sum_name, temp, value, mask),
+                                        step_starts, axis=0)
+            cumulative_sum = np.zeros((nr_of_steps+1, step_sums.shape[1]), dtype='float64')
+            np.cumsum(step_sums, axis=0, out=cumulative_sum[1:])
+            cumulative_sums[sum_name][:, block] = cumulative_sum
+
+
+# ########################################################################### #
+def get_sum_term(sum_name, temp, value, mask):
+    '''Per value term of the sum of the linear fit with the given name'''
+    if(sum_name == 'Count'):
+        return mask.astype('float64')
+    elif(sum_name == 'SumT'):
+        return temp
+    elif(sum_name == 'SumTT'):
+        return temp*temp
+    elif(sum_name == 'SumV'):
+        return value
+    elif(sum_name == 'SumTV'):
+        return temp*value
+    elif(sum_name == 'SumVV'):
+        return value*value
+    raise Exception('Unknown sum: '+sum_name)
+
+
+# ########################################################################### #
+def read_window_fit_sums(statistics_group, drs_value_type, first_steps, last_steps,
+                         selection=slice(None)):
+    '''
+        Return the sums of the steps first_steps[w] to last_steps[w]-1
+        of every window w as dict of arrays (nr_of_windows, nr_of_selected_cells)
+        from the with 'store_cumulative_fit_sums' stored cumulative sums
+    '''
+    window_sums = {}
+    for sum_name in linear_fit_sum_names:
+        cumulative_sum = statistics_group[drs_value_type+'CumSum'+sum_name][:, selection]
+        window_sums[sum_name] = cumulative_sum[last_steps]-cumulative_sum[first_steps]
+    return window_sums
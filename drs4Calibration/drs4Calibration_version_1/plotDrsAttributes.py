@@ -22,6 +22,8 @@ from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.colors as colors
 from matplotlib.cm import hot, seismic
 
+from drs4Calibration.h5pyTools import read_h5py_rows, read_bit_packed_mask
+
 import config as config
 from constants import NRCHID, NRCELL, ROI, PEAFACTOR, DACfactor, ADCCOUNTSTOMILIVOLT
 
@@ -149,7 +151,7 @@ def drs_value_std_hist_(data_collection_path, interval_file_path,
             interval_indices = np.array(data['IntervalIndices'])
         print('loading')
         with h5py.File(data_collection_path, 'r') as store:
-            drs_value_std = store[drs_value_type+'Std'][interval_indices, :].astype('float32')
+            drs_value_std = read_h5py_rows(store[drs_value_type+'Std'], interval_indices).astype('float32')
 
         useful_chids = get_useful_chids(interval_nr)
         drs_value_std = drs_value_std.reshape(-1, NRCHID, NRCELLSPERCHID)[:, useful_chids, :].flatten()
@@ -253,7 +255,7 @@ def drs_value_std_hist_per_chid_cell_(data_collection_path, interval_file_path,
             interval_indices = np.array(data['IntervalIndices'])
         print('loading')
         with h5py.File(data_collection_path, 'r') as store:
-            drs_value_std = store[drs_value_type+'Std'][interval_indices, value_index].astype('float32')
+            drs_value_std = read_h5py_rows(store[drs_value_type+'Std'], interval_indices, value_index).astype('float32')
 
         if(drs_value_type == 'Gain'):
             drs_value_std /= DACfactor/pow(10, 3)
@@ -372,11 +374,11 @@ def drs_value_cell_(data_collection_path, interval_file_path, fit_file_path_arra
             data = interval_source[groupname]
             interval_indices = np.array(data['IntervalIndices'])
             if(use_mask):
-                mask = np.array(data[drs_value_type+'Mask'])
+                mask = read_bit_packed_mask(data[drs_value_type+'Mask'], value_index)
                 mask_collection.append(mask)
         with h5py.File(data_collection_path, 'r') as store:
-            temp = np.array(store['Temp'+drs_value_type][interval_indices, int(chid/9)])
-            drs_value = np.array(store[drs_value_type][interval_indices, value_index_]).astype('float32')
+            temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9)))
+            drs_value = np.array(read_h5py_rows(store[drs_value_type], interval_indices, value_index_)).astype('float32')
 
         with fits.open(fit_file_path_array[0], ignoremissing=True, ignore_missing_end=True) as fit_value_tab:
             data = fit_value_tab['FitParameter'].data
@@ -427,7 +429,7 @@ def drs_value_cell_(data_collection_path, interval_file_path, fit_file_path_arra
         temp = temp_collection[interval_index]
         drs_value = drs_value_collection[interval_index]
         if(use_mask):
-            mask_u = mask_collection[interval_index][:, value_index]
+            mask_u = mask_collection[interval_index]
             mask_nu = np.logical_not(mask_u)
             img.scatter(temp[mask_u], drs_value[mask_u], marker='.', s=50, alpha=0.45,
                         c=color)
@@ -823,11 +825,11 @@ def worst_cell_collection_selected_by_residual_(
             value_index = chid*NRCELLSPERCHID+cell
 
             #print('Chid: ', chid, 'Cell: ', cell, 'Residual: ', residual)
-            mask = np.array(interval_source[drs_value_type+'Mask'][:, value_index])
+            mask = read_bit_packed_mask(interval_source[drs_value_type+'Mask'], value_index)
             with h5py.File(data_collection_path, 'r') as store:
-                time = np.array(store['Time'+drs_value_type][interval_indices, :]).flatten()
-                temp = store['Temp'+drs_value_type][interval_indices, int(chid/9)]
-                drs_value = store[drs_value_type][interval_indices, value_index]
+                time = np.array(read_h5py_rows(store['Time'+drs_value_type], interval_indices)).flatten()
+                temp = read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9))
+                drs_value = read_h5py_rows(store[drs_value_type], interval_indices, value_index)
 
             if(drs_value_type == 'Gain'):
                 drs_value = drs_value.astype('float64')/DACfactor
@@ -1468,12 +1470,12 @@ def chid_cell_drs_values_time(data_collection_path, interval_file_path,
             cut_off_error_factor = interval_source.attrs['CutOff'+drs_value_type]
             interval_indices = np.array(data['IntervalIndices'])
             if(use_mask):
-                mask = np.array(data[drs_value_type+'Mask'][:, value_index])
+                mask = read_bit_packed_mask(data[drs_value_type+'Mask'], value_index)
                 mask_collection.append(mask)
         with h5py.File(data_collection_path, 'r') as store:
-            temp = np.array(store['Temp'+drs_value_type][interval_indices, int(chid/9)])
-            drs_value = np.array(store[drs_value_type][interval_indices, value_index])
-            drs_value_var = np.array(store[drs_value_type+'Std'][interval_indices, value_index])
+            temp = np.array(read_h5py_rows(store['Temp'+drs_value_type], interval_indices, int(chid/9)))
+            drs_value = np.array(read_h5py_rows(store[drs_value_type], interval_indices, value_index))
+            drs_value_var = np.array(read_h5py_rows(store[drs_value_type+'Std'], interval_indices, value_index))
 
         time_interval = pd.to_datetime(time[interval_indices] * 24 * 3600 * 1e9)
         time_collection.append(time_interval)
@@ -0,0 +1,252 @@
+import numpy as np
+
+from collections import OrderedDict
+from astropy.io import fits
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRCELL, ADCCOUNTSTOMILIVOLT
+from drs4Calibration.drs4Calibration_version_1.fitParameterMap import FitParameterMap
+
+
+# ########################################################################### #
+def open_fit_parameter(fit_file_path, nr_of_cells=NRCELL):
+    '''
+        Return the fit values of a .fits File (see 'write_fit_value_table')
+        or of its memory-mappable export (see 'export_fit_parameter_map')
+        as dict of arrays with the shape (chid, cell, value of the cell).
+        The arrays of an export are memory-mapped, not read.
+    '''
+    if not str(fit_file_path).endswith('.fits'):
+        fit_map = FitParameterMap(fit_file_path)
+        return {name: fit_map[name] for name in fit_map.keys()}
+
+    with fits.open(fit_file_path) as hdu_list:
+        table = hdu_list['FitParameter'].data
+        return {name: np.array(table[name], dtype='float32').reshape(-1, nr_of_cells,
+                                                                     table[name][0].size)
+                for name in table.columns.names}
+
+
+# ########################################################################### #
+class ModelCache:
+    '''
+        LRU cache of evaluated models (tuples of arrays) with a bounded
+        memory footprint: the least recently used models are dropped,
+        before a new model would exceed max_bytes.
+        Models larger than max_bytes are evaluated, but not cached.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()
+        self.nr_of_bytes = 0
+        self.nr_of_hits = 0
+        self.nr_of_misses = 0
+
+    def get(self, key, evaluate, model_bytes):
+        '''
+            Return the cached model of the key or evaluate() it
+
+            Args:
+                key (hashable):
+                    Key of the model
+                evaluate (function):
+                    Returns the model (tuple of arrays)
+                model_bytes (int):
+                    Bytes of the model, to make room before its evaluation
+        '''
+        if key in self.models:
+            self.models.move_to_end(key)
+            self.nr_of_hits += 1
+            return self.models[key]
+
+        self.nr_of_misses += 1
+        if(model_bytes > self.max_bytes):
+            return evaluate()
+        while(self.nr_of_bytes+model_bytes > self.max_bytes):
+            self.drop_oldest()
+        model = evaluate()
+        self.models[key] = model
+        self.nr_of_bytes += sum(array.nbytes for array in model)
+        return model
+
+    def drop_oldest(self):
+        key, model = self.models.popitem(last=False)
+        self.nr_of_bytes -= sum(array.nbytes for array in model)
+
+    def clear(self):
+        self.models.clear()
+        self.nr_of_bytes = 0
+
+
+# ########################################################################### #
+class TemperatureCalibration:
+    '''
+        Apply the temperature based drs calibration of a fit product
+        to blocks of raw events (see 'calibrate'):
+
+            calibrated = (data - baseline(T)) / gain(T) * ADCCOUNTSTOMILIVOLT
+
+        with the linear models baseline(T) = slope*T + offset
+        of the baseline of the start cell and sample
+        [chid, start_cell, sample] (ROI-based like the 'Baseline'
+        of the data collection) and of the normed gain of the
+        physical cell [chid, (start_cell+sample) % NRCELL].
+        T is the temperature of the patch of the chid.
+        Only the model values of the read out cells are evaluated,
+        all events of a block together.
+        With a temperature_resolution the patch temperatures are rounded
+        to multiples of it and the models of all cells of a patch are evaluated
+        once per rounded temperature of the patch and kept in a 'ModelCache',
+        so a run with nearly constant temperatures costs one model evaluation
+        per temperature step of a patch.
+    '''
+
+    def __init__(self, fit_parameter, temperature_resolution=None,
+                 max_cache_bytes=pow(2, 32)):
+        '''
+            Args:
+                fit_parameter (str or dict):
+                    Full path to a fit value file (.fits or export)
+                    or the dict of 'open_fit_parameter'
+                temperature_resolution (float):
+                    Resolution in degree celsius of the cached models,
+                    None to evaluate the models of every event block
+                max_cache_bytes (int):
+                    Max memory of the cached models
+                    (the model of a patch needs about 11 MB)
+        '''
+        if isinstance(fit_parameter, str):
+            fit_parameter = open_fit_parameter(fit_parameter)
+
+        self.nr_of_chids, self.nr_of_cells, self.roi = fit_parameter['BaselineSlope'].shape
+        # flat (chid*nr_of_cells+cell) rows, without copy of memory-mapped arrays
+        self.baseline_slope = fit_parameter['BaselineSlope'].reshape(-1, self.roi)
+        self.baseline_offset = fit_parameter['BaselineOffset'].reshape(-1, self.roi)
+        self.gain_slope = fit_parameter['GainSlope'].reshape(-1)
+        self.gain_offset = fit_parameter['GainOffset'].reshape(-1)
+        self.chid_offset = (np.arange(self.nr_of_chids, dtype='int64')*self.nr_of_cells)
+
+        self.temperature_resolution = temperature_resolution
+        self.model_cache = None
+        if temperature_resolution is not None:
+            self.model_cache = ModelCache(max_cache_bytes)
+
+    def get_chid_temperature(self, patch_temperature):
+        '''
+            Temperature of every chid (the same for all chids of a patch),
+            with the shape (..., nr_of_chids)
+        '''
+        patch_temperature = np.asarray(patch_temperature, dtype='float32')
+        nr_of_chids_per_patch = self.nr_of_chids//patch_temperature.shape[-1]
+        return np.repeat(patch_temperature, nr_of_chids_per_patch, axis=-1)
+
+    def get_baseline(self, start_cells, chid_temperature, roi):
+        '''
+            Baseline model of the read out samples of the events,
+            with the shape (nr_of_events, nr_of_chids, roi)
+        '''
+        rows = start_cells+self.chid_offset
+        baseline = self.baseline_slope[rows, :roi]
+        baseline *= chid_temperature[..., None]
+        baseline += self.baseline_offset[rows, :roi]
+        return baseline
+
+    def get_gain(self, start_cells, chid_temperature, roi):
+        '''
+            Gain model of the read out cells of the events,
+            with the shape (nr_of_events, nr_of_chids, roi)
+        '''
+        cells = (start_cells[..., None]+np.arange(roi)) % self.nr_of_cells
+        cells += self.chid_offset[:, None]
+        gain = self.gain_slope[cells]
+        gain *= chid_temperature[..., None]
+        gain += self.gain_offset[cells]
+        return gain
+
+    def get_patch_model(self, patch_nr, nr_of_chids_per_patch, quantized_temperature):
+        '''
+            Baseline and gain models of all cells of the chids of the patch
+            for the temperature quantized_temperature*temperature_resolution,
+            with the shapes (nr_of_chids_per_patch*nr_of_cells, roi)
+            and (nr_of_chids_per_patch*nr_of_cells)
+        '''
+        rows = slice(patch_nr*nr_of_chids_per_patch*self.nr_of_cells,
+                     (patch_nr+1)*nr_of_chids_per_patch*self.nr_of_cells)
+
+        def evaluate():
+            temperature = np.float32(quantized_temperature*self.temperature_resolution)
+            baseline = np.multiply(self.baseline_slope[rows], temperature, dtype='float32')
+            baseline += self.baseline_offset[rows]
+            gain = np.multiply(self.gain_slope[rows], temperature, dtype='float32')
+            gain += self.gain_offset[rows]
+            return (baseline, gain)
+
+        model_bytes = nr_of_chids_per_patch*self.nr_of_cells*(self.roi+1)*4
+        return self.model_cache.get((patch_nr, quantized_temperature), evaluate, model_bytes)
+
+    def calibrate(self, data, start_cells, patch_temperature):
+        '''
+            Calibrated values in mV of a block of raw events,
+            samples of chids without valid start cell are nan.
+
+            Args:
+                data (array):
+                    ADC counts with the shape (nr_of_events, nr_of_chids, roi)
+                    or (nr_of_events, nr_of_chids*roi) like the 'Data' column
+                start_cells (array):
+                    'StartCellData' with the shape (nr_of_events, nr_of_chids)
+                patch_temperature (array):
+                    Temperature of every patch, with the shape (nr_of_patches)
+                    for all events or (nr_of_events, nr_of_patches)
+
+            Returns:
+                float32 array with the shape (nr_of_events, nr_of_chids, roi)
+        '''
+        start_cells = np.asarray(start_cells).reshape(-1, self.nr_of_chids).astype('int64')
+        data = np.asarray(data).reshape(len(start_cells), self.nr_of_chids, -1)
+        roi = data.shape[2]
+        if(roi > self.roi):
+            error_str = ('The roi of {} samples is larger than the {} samples '.format(
+                            roi, self.roi) + 'of the baseline')
+            raise Exception(error_str)
+
+        invalid = (start_cells < 0) | (start_cells >= self.nr_of_cells)
+        if invalid.any():
+            start_cells = np.where(invalid, 0, start_cells)
+
+        calibrated = data.astype('float32')
+        if self.model_cache is None:
+            chid_temperature = self.get_chid_temperature(patch_temperature)
+            chid_temperature = np.broadcast_to(chid_temperature, start_cells.shape)
+            calibrated -= self.get_baseline(start_cells, chid_temperature, roi)
+            calibrated /= self.get_gain(start_cells, chid_temperature, roi)
+        else:
+            # the chids of a patch are calibrated in groups of events
+            # with the same quantized temperature of the patch
+            patch_temperature = np.asarray(patch_temperature, dtype='float64')
+            patch_temperature = np.broadcast_to(
+                patch_temperature, (len(start_cells), patch_temperature.shape[-1]))
+            quantized_temperature = np.round(
+                patch_temperature/self.temperature_resolution).astype('int64')
+            nr_of_chids_per_patch = self.nr_of_chids//quantized_temperature.shape[1]
+            patch_chid_offset = self.chid_offset[:nr_of_chids_per_patch]
+            for patch_nr in range(quantized_temperature.shape[1]):
+                chids = slice(patch_nr*nr_of_chids_per_patch, (patch_nr+1)*nr_of_chids_per_patch)
+                list_of_temperatures, event_temperature_nr = np.unique(
+                    quantized_temperature[:, patch_nr], return_inverse=True)
+                for temperature_nr, temperature in enumerate(list_of_temperatures):
+                    events = np.flatnonzero(event_temperature_nr == temperature_nr)
+                    baseline, gain = self.get_patch_model(patch_nr, nr_of_chids_per_patch,
+                                                          int(temperature))
+                    patch_start_cells = start_cells[events, chids]
+                    rows = patch_start_cells+patch_chid_offset
+                    cells = (patch_start_cells[..., None]+np.arange(roi)) % self.nr_of_cells
+                    cells += patch_chid_offset[:, None]
+                    calibrated[events, chids] -= baseline[rows, :roi]
+                    calibrated[events, chids] /= gain[cells]
+
+        calibrated *= ADCCOUNTSTOMILIVOLT
+
+        if invalid.any():
+            calibrated[invalid] = np.nan
+        return calibrated
@@ -0,0 +1,197 @@
+import time
+import numpy as np
+
+from astropy.io import fits
+
+
+# size of the FITS blocks, header and data are padded to it
+fits_block_bytes = 2880
+
+# characters, which are not allowed in an encoded checksum
+checksum_exclude = [0x3a, 0x3b, 0x3c, 0x3d, 0x3e, 0x3f, 0x40,
+                    0x5b, 0x5c, 0x5d, 0x5e, 0x5f, 0x60]
+
+
+# ########################################################################### #
+def get_checksum(data_bytes, sum32=0):
+    '''
+        32-bit ones' complement sum of the big-endian 32-bit words
+        of the data_bytes (with a length multiple of 4),
+        added to the sum32 of the preceding bytes (FITS checksum convention)
+    '''
+    words = np.frombuffer(data_bytes, dtype='>u4')
+    hi = (sum32 >> 16) + int(np.sum(words >> 16, dtype='uint64'))
+    lo = (sum32 & 0xFFFF) + int(np.sum(words & 0xFFFF, dtype='uint64'))
+    hi_carry = hi >> 16
+    lo_carry = lo >> 16
+    while hi_carry or lo_carry:
+        hi = (hi & 0xFFFF) + lo_carry
+        lo = (lo & 0xFFFF) + hi_carry
+        hi_carry = hi >> 16
+        lo_carry = lo >> 16
+    return (hi << 16) + lo
+
+
+# ########################################################################### #
+def encode_checksum(value):
+    '''
+        16 character ASCII encoding of the 32-bit checksum value
+        for the CHECKSUM keyword (FITS checksum convention)
+    '''
+    ascii_value = [0]*16
+    for byte_nr in range(4):
+        byte = (value >> ((3-byte_nr)*8)) & 0xFF
+        quotient = byte//4+0x30
+        remainder = byte % 4
+        characters = [quotient+remainder, quotient, quotient, quotient]
+
+        check = True
+        while check:
+            check = False
+            for exclude in checksum_exclude:
+                for char_nr in [0, 2]:
+                    if(characters[char_nr] == exclude or characters[char_nr+1] == exclude):
+                        characters[char_nr] += 1
+                        characters[char_nr+1] -= 1
+                        check = True
+
+        for char_nr in range(4):
+            ascii_value[4*char_nr+byte_nr] = characters[char_nr]
+
+    # rotate the characters one to the right
+    return ''.join(chr(ascii_value[(char_nr+15) % 16]) for char_nr in range(16))
+
+
+# ########################################################################### #
+def set_checksum_cards(header, data_sum):
+    '''
+        Set the DATASUM and CHECKSUM of the header for
+        the data with the checksum data_sum (see 'get_checksum')
+    '''
+    comment_time = time.strftime('%Y-%m-%dT%H:%M:%S')
+    header['CHECKSUM'] = ('0'*16, 'HDU checksum updated '+comment_time)
+    header['DATASUM'] = (str(data_sum), 'data unit checksum updated '+comment_time)
+    header_sum = get_checksum(header.tostring().encode('ascii'), data_sum)
+    header['CHECKSUM'] = encode_checksum(~header_sum & 0xFFFFFFFF)
+
+
+# ########################################################################### #
+class StreamingBinTableWriter:
+    '''
+        Write a .fits File with an empty primary HDU and one binary table,
+        whose rows are written block by block (see 'write_rows').
+        The table is preallocated from the known number of rows and
+        the checksums are calculated while the rows are written,
+        so the table is never completely in memory.
+        Used as context manager the file is closed with 'close'.
+    '''
+
+    def __init__(self, store_file_path, primary_header, columns, nr_of_rows, extname=None):
+        '''
+            Args:
+                store_file_path (str):
+                    Full path to the storeFile
+                primary_header (fits.Header):
+                    Header of the primary HDU (without data)
+                columns (list):
+                    fits.Column of the table (the arrays are not used)
+                nr_of_rows (int):
+                    Number of rows of the table
+                extname (str):
+                    Name of the table HDU
+        '''
+        table = fits.BinTableHDU.from_columns(
+                    fits.ColDefs([fits.Column(name=column.name, format=column.format,
+                                              unit=column.unit, dim=column.dim)
+                                  for column in columns]),
+                    nrows=0)
+        self.header = table.header
+        self.header['NAXIS2'] = nr_of_rows
+        if extname is not None:
+            self.header['EXTNAME'] = extname
+        self.row_dtype = table.columns.dtype.newbyteorder('>')
+        self.nr_of_rows = nr_of_rows
+        self.nr_of_written_rows = 0
+        self.data_sum = 0
+
+        primary_header = primary_header.copy()
+        set_checksum_cards(primary_header, 0)
+        # the table header is rewritten with the checksums by 'close'
+        set_checksum_cards(self.header, 0)
+
+        self.store_file = open(store_file_path, 'wb')
+        self.store_file.write(primary_header.tostring().encode('ascii'))
+        self.header_offset = self.store_file.tell()
+        self.store_file.write(self.header.tostring().encode('ascii'))
+
+        # preallocate the table (data padded to full blocks)
+        data_bytes = nr_of_rows*self.row_dtype.itemsize
+        data_bytes += -data_bytes % fits_block_bytes
+        self.store_file.truncate(self.store_file.tell()+data_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.store_file.close()
+
+    def get_empty_rows(self, nr_of_rows):
+        '''Empty (big-endian) records for the given number of rows'''
+        return np.empty(nr_of_rows, dtype=self.row_dtype)
+
+    def write_rows(self, rows):
+        '''Write the next records (see 'get_empty_rows')'''
+        if(self.nr_of_written_rows+len(rows) > self.nr_of_rows):
+            raise Exception('More rows than the preallocated table')
+        rows = np.ascontiguousarray(rows, dtype=self.row_dtype)
+        data_bytes = rows.tobytes()
+        if(len(data_bytes) % 4 != 0):
+            error_str = ('Only rows with a length multiple of 4 bytes are supported')
+            raise Exception(error_str)
+        self.data_sum = get_checksum(data_bytes, self.data_sum)
+        self.store_file.write(data_bytes)
+        self.nr_of_written_rows += len(rows)
+
+    def close(self):
+        '''Rewrite the table header with the checksums and close the file'''
+        if(self.nr_of_written_rows != self.nr_of_rows):
+            error_str = ('Only {} of {} rows written').format(self.nr_of_written_rows,
+                                                              self.nr_of_rows)
+            raise Exception(error_str)
+        set_checksum_cards(self.header, self.data_sum)
+        self.store_file.seek(self.header_offset)
+        self.store_file.write(self.header.tostring().encode('ascii'))
+        self.store_file.close()
+
+
+# ########################################################################### #
+def verify_checksums(file_path, max_block_bytes=pow(2, 26)):
+    '''
+        Verify the CHECKSUM and DATASUM of all HDUs of the .fits File,
+        the file is read in blocks of at most max_block_bytes
+    '''
+    max_block_bytes -= max_block_bytes % fits_block_bytes
+    with fits.open(file_path) as hdu_list:
+        hdu_infos = [(hdu.header.copy(), hdu.fileinfo()) for hdu in hdu_list]
+
+    with open(file_path, 'rb') as fits_file:
+        for header, file_info in hdu_infos:
+            if('CHECKSUM' not in header or 'DATASUM' not in header):
+                raise Exception('HDU without checksum')
+            fits_file.seek(file_info['datLoc'])
+            data_sum = 0
+            data_span = file_info['datSpan']
+            while data_span > 0:
+                data_bytes = fits_file.read(min(data_span, max_block_bytes))
+                data_sum = get_checksum(data_bytes, data_sum)
+                data_span -= len(data_bytes)
+            if(str(data_sum) != header['DATASUM']):
+                raise Exception('Wrong DATASUM')
+
+            fits_file.seek(file_info['hdrLoc'])
+            header_bytes = fits_file.read(file_info['datLoc']-file_info['hdrLoc'])
+            if(get_checksum(header_bytes, data_sum) != 0xFFFFFFFF):
+                raise Exception('Wrong CHECKSUM')
@@ -0,0 +1,639 @@
+import numpy as np
+import h5py
+import zlib
+import itertools
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ########################################################################### #
+def get_nr_of_rows(dataset):
+    '''
+        Number of valid rows of a (with the H5pyTableAppender written) dataset.
+        While the appender is open the datasets can be larger than
+        the number of written rows, this is marked with the 'NrOfRows' attribute.
+    '''
+    return int(dataset.attrs.get('NrOfRows', len(dataset)))
+
+
+# ########################################################################### #
+class H5pyTableAppender:
+    '''
+        Append rows to extendible datasets of an open h5py file.
+        The rows are buffered per column and written blockwise as whole
+        chunk rows (limited by max_buffer_bytes), so the compressed chunks
+        are not decompressed and rewritten for every single row.
+        The datasets grow geometrically, the 'NrOfRows' attribute marks
+        the number of valid rows until 'close' trims the datasets.
+        Datasets still marked on opening (left by a not closed appender,
+        for example after a crash) are trimmed to their valid rows first.
+        The rows of an optional 'flush_before' appender are always written
+        before the rows of this one, so for example a manifest never
+        records rows which are not yet stored.
+    '''
+
+    def __init__(self, h5py_table, column_names,
+                 max_buffer_bytes=128*pow(2, 20), max_nr_of_buffered_rows=None,
+                 growth_factor=2, flush_before=None):
+        self.h5py_table = h5py_table
+        self.column_names = list(column_names)
+        self.growth_factor = growth_factor
+        self.flush_before = flush_before
+
+        self.buffers = {}
+        self.nr_of_rows = {}
+        self.max_nr_of_buffered_rows = {}
+        for column_name in self.column_names:
+            dataset = h5py_table[column_name]
+            if 'NrOfRows' in dataset.attrs:
+                trim_h5py_dataset(dataset, get_nr_of_rows(dataset))
+            chunk_rows = dataset.chunks[0] if dataset.chunks else 1
+            if max_nr_of_buffered_rows is not None:
+                chunk_rows = min(chunk_rows, max_nr_of_buffered_rows)
+            row_bytes = dataset.dtype.itemsize*int(np.prod(dataset.shape[1:]))
+            self.buffers[column_name] = []
+            self.nr_of_rows[column_name] = get_nr_of_rows(dataset)
+            self.max_nr_of_buffered_rows[column_name] = max(
+                1, min(chunk_rows, max_buffer_bytes//max(row_bytes, 1)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_nr_of_rows(self, column_name):
+        '''Number of rows of the column including the buffered ones'''
+        return self.nr_of_rows[column_name]+len(self.buffers[column_name])
+
+    def append(self, column_values):
+        '''
+            Add one row to every column of the given dict column_name -> value
+        '''
+        full_column_names = []
+        for column_name, value in column_values.items():
+            self.buffers[column_name].append(value)
+            if(len(self.buffers[column_name]) >= self.max_nr_of_buffered_rows[column_name]):
+                full_column_names.append(column_name)
+
+        if(len(full_column_names) > 0):
+            if self.flush_before is not None:
+                self.flush_before.flush()
+            for column_name in full_column_names:
+                self.write_buffer(column_name)
+            self.h5py_table.file.flush()
+
+    def flush(self):
+        if self.flush_before is not None:
+            self.flush_before.flush()
+        for column_name in self.column_names:
+            self.write_buffer(column_name)
+        self.h5py_table.file.flush()
+
+    def write_buffer(self, column_name):
+        buffer = self.buffers[column_name]
+        if(len(buffer) == 0):
+            return
+
+        dataset = self.h5py_table[column_name]
+        start = self.nr_of_rows[column_name]
+        stop = start+len(buffer)
+        if(stop > len(dataset)):
+            chunk_rows = dataset.chunks[0] if dataset.chunks else 1
+            new_length = max(stop, int(len(dataset)*self.growth_factor))
+            new_length = -(-new_length//chunk_rows)*chunk_rows
+            if dataset.maxshape[0] is not None:
+                new_length = min(new_length, dataset.maxshape[0])
+            dataset.resize(new_length, axis=0)
+
+        if isinstance(buffer[0], CompressedRow):
+            # chunks already encoded by another process
+            for row_nr, compressed_row in enumerate(buffer):
+                write_compressed_row(dataset, start+row_nr, compressed_row)
+        else:
+            if h5py.check_string_dtype(dataset.dtype) is not None:
+                rows = np.array(buffer, dtype=object)
+            elif(len(buffer) == 1):
+                # no copy of large single rows
+                rows = np.asarray(buffer[0], dtype=dataset.dtype)
+            else:
+                rows = np.array(buffer, dtype=dataset.dtype)
+            dataset[start:stop] = rows.reshape((len(buffer),)+dataset.shape[1:])
+
+        self.nr_of_rows[column_name] = stop
+        if(len(dataset) != stop):
+            dataset.attrs['NrOfRows'] = stop
+        del buffer[:]
+
+    def close(self):
+        '''Write the remaining rows and trim the datasets to their rows'''
+        self.flush()
+        for column_name in self.column_names:
+            trim_h5py_dataset(self.h5py_table[column_name], self.nr_of_rows[column_name])
+
+
+# ########################################################################### #
+def trim_h5py_dataset(dataset, nr_of_rows):
+    '''Resize the dataset to nr_of_rows and remove the 'NrOfRows' mark'''
+    if(len(dataset) != nr_of_rows):
+        dataset.resize(nr_of_rows, axis=0)
+    if 'NrOfRows' in dataset.attrs:
+        del dataset.attrs['NrOfRows']
+
+
+# ########################################################################### #
+def get_row_runs(row_indices, max_gap=0):
+    '''
+        Split the row_indices into runs of increasing rows
+        with at most max_gap not selected rows between two neighbours.
+        Returns the (first, last+1) positions in row_indices of every run.
+    '''
+    row_indices = np.asarray(row_indices, dtype='int64').reshape(-1)
+    if(len(row_indices) == 0):
+        return (np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'))
+
+    steps = np.diff(row_indices)
+    breaks = np.flatnonzero((steps < 1) | (steps > max_gap+1))+1
+    run_starts = np.concatenate(([0], breaks))
+    run_stops = np.concatenate((breaks, [len(row_indices)]))
+    return (run_starts, run_stops)
+
+
+# ########################################################################### #
+def read_h5py_rows(dataset, row_indices, column_selection=slice(None), decode=True):
+    '''
+        Same as dataset[row_indices, column_selection], but instead of
+        the slow h5py point selection every run of neighbouring rows
+        is read with one hyperslab (slice) read. Small gaps inside
+        a chunk are read too and dropped afterwards, so no chunk has to be
+        decompressed twice. The rows are returned in the given order,
+        the row_indices dont need to be sorted.
+        h5py datasets are read with the 'ParallelChunkReader'
+        and with 'encode_values' encoded datasets are decoded.
+
+        Args:
+            dataset (h5py.Dataset):
+                Dataset with the rows in the first dimension
+            row_indices (array):
+                Indices of the rows to read
+            column_selection (slice or int):
+                Selection of the second dimension
+            decode (bool):
+                Return the stored values of encoded datasets
+    '''
+    if isinstance(dataset, h5py.Dataset):
+        if(decode and 'Encoding' in dataset.attrs):
+            rows = read_h5py_rows(dataset, row_indices, column_selection, decode=False)
+            return decode_values(dataset, rows, row_indices, column_selection)
+        dataset = ParallelChunkReader(dataset)
+
+    row_indices = np.asarray(row_indices, dtype='int64').reshape(-1)
+    max_gap = dataset.chunks[0]-1 if dataset.chunks else 0
+    run_starts, run_stops = get_row_runs(row_indices, max_gap)
+
+    empty_rows = dataset[0:0, column_selection]
+    rows = np.empty((len(row_indices),)+empty_rows.shape[1:], dtype=empty_rows.dtype)
+    for run_start, run_stop in zip(run_starts, run_stops):
+        first_row = row_indices[run_start]
+        last_row = row_indices[run_stop-1]
+        slab = dataset[first_row:last_row+1, column_selection]
+        if(last_row-first_row+1 == run_stop-run_start):
+            rows[run_start:run_stop] = slab
+        else:
+            rows[run_start:run_stop] = slab[row_indices[run_start:run_stop]-first_row]
+
+    return rows
+
+
+# ########################################################################### #
+def get_encoded_dtype(dtype, encoding):
+    '''Dtype of the stored values of the given encoding (see 'encode_values')'''
+    if encoding is None or encoding[0] == 'quantized':
+        return dtype
+    elif(encoding[0] == 'float16'):
+        return 'float16'
+    elif(encoding[0] == 'scaled_int16'):
+        return 'int16'
+    raise Exception('Unknown encoding: '+str(encoding[0]))
+
+
+# ########################################################################### #
+def set_encoding_attrs(dataset, encoding, dtype, reference_name=None,
+                       values_per_reference=1):
+    '''Mark the dataset as encoded, 'read_h5py_rows' decodes it then'''
+    dataset.attrs['Encoding'] = encoding[0]
+    dataset.attrs['EncodingParameter'] = encoding[1] if len(encoding) > 1 else np.nan
+    dataset.attrs['DecodedDtype'] = np.dtype(dtype).str
+    if reference_name is not None:
+        dataset.attrs['Reference'] = reference_name
+        dataset.attrs['ValuesPerReference'] = values_per_reference
+
+
+# ########################################################################### #
+int16_nan = np.iinfo('int16').min
+
+
+def encode_values(values, encoding, values_per_reference=1):
+    '''
+        Encode a row of values into the compact representation of the encoding.
+        Returns the stored values and the reference
+        (just for 'scaled_int16', else None).
+
+        Args:
+            values (array):
+                Row of (float) values
+            encoding (tuple):
+                ('float16',): stored as float16,
+                    relative error of at most 2^-11 in the range of +-65504
+                ('scaled_int16', scale): int16 offsets in units of scale from
+                    the reference, the mean of every 'values_per_reference'
+                    neighbouring values (for example all samples of a cell).
+                    Max error scale/2, offsets beyond +-32767*scale are clipped,
+                    nan is stored as -32768
+                ('quantized', max_error): rounded to the multiples of the largest
+                    power of two not larger than 2*max_error, so the max error is
+                    at most max_error. The dtype is kept, but the zeroed low bits
+                    compress much better
+            values_per_reference (int):
+                Number of neighbouring values with the same reference
+    '''
+    if(encoding[0] == 'float16'):
+        return (np.asarray(values).astype('float16'), None)
+
+    elif(encoding[0] == 'quantized'):
+        step = pow(2., np.floor(np.log2(2*encoding[1])))
+        values = np.asarray(values)
+        return ((np.round(values/step)*step).astype(values.dtype), None)
+
+    elif(encoding[0] == 'scaled_int16'):
+        scale = encoding[1]
+        values = np.asarray(values, dtype='float32').reshape(-1, values_per_reference)
+        with np.errstate(invalid='ignore'):
+            reference = np.nanmean(values, axis=1, dtype='float64').astype('float32')
+            offsets = np.round((values-reference[:, None])/scale)
+            stored_values = np.clip(offsets, -32767, 32767).astype('int16')
+        stored_values[np.isnan(offsets)] = int16_nan
+        return (stored_values.reshape(-1), reference)
+
+    raise Exception('Unknown encoding: '+str(encoding[0]))
+
+
+# ########################################################################### #
+def decode_values(dataset, values, row_indices, column_selection=slice(None)):
+    '''
+        Decode the values = dataset[row_indices, column_selection]
+        of a with 'set_encoding_attrs' marked dataset
+    '''
+    encoding = dataset.attrs['Encoding']
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+    decoded_dtype = dataset.attrs['DecodedDtype']
+    if(encoding != 'scaled_int16'):
+        return values.astype(decoded_dtype, copy=False)
+
+    reference_dataset = dataset.parent[dataset.attrs['Reference']]
+    values_per_reference = int(dataset.attrs['ValuesPerReference'])
+    if isinstance(column_selection, slice):
+        columns = np.arange(*column_selection.indices(dataset.shape[1]))
+    else:
+        columns = np.array(column_selection)
+    references = columns//values_per_reference
+    first_reference = int(references.min()) if references.size > 0 else 0
+    last_reference = int(references.max()) if references.size > 0 else 0
+    reference = read_h5py_rows(reference_dataset, row_indices,
+                               slice(first_reference, last_reference+1))
+    reference = reference[:, references-first_reference]
+
+    decoded_values = values*np.float32(dataset.attrs['EncodingParameter'])+reference
+    decoded_values[values == int16_nan] = np.nan
+    return decoded_values.astype(decoded_dtype, copy=False)
+
+
+# ########################################################################### #
+def create_bit_packed_mask(h5py_group, name, nr_of_rows, nr_of_columns,
+                           max_chunk_bytes=pow(2, 20)):
+    '''
+        Create the dataset of a bool mask with the shape (nr_of_rows, nr_of_columns),
+        which is stored with 'np.packbits' along the rows (8 rows per byte),
+        so every column range can be read and written on its own.
+        Use 'write_bit_packed_mask' and 'read_bit_packed_mask' to access it.
+    '''
+    nr_of_packed_rows = max(1, -(-nr_of_rows//8))
+    chunk_width = max(1, min(nr_of_columns, max_chunk_bytes//nr_of_packed_rows))
+    dataset = h5py_group.create_dataset(
+                name=name, dtype='uint8',
+                shape=(nr_of_packed_rows, nr_of_columns),
+                chunks=(nr_of_packed_rows, chunk_width),
+                compression='gzip', compression_opts=4,
+                fletcher32=True)
+    dataset.attrs['NrOfPackedRows'] = nr_of_rows
+    return dataset
+
+
+# ########################################################################### #
+def write_bit_packed_mask(dataset, mask, column_selection=slice(None)):
+    dataset[:, column_selection] = np.packbits(mask, axis=0)
+
+
+# ########################################################################### #
+def read_bit_packed_mask(dataset, column_selection=slice(None)):
+    '''
+        Return the bool mask[:, column_selection] of a
+        with 'create_bit_packed_mask' created dataset.
+        Dense bool masks (of older files) are just read.
+    '''
+    if 'NrOfPackedRows' not in dataset.attrs:
+        return np.array(dataset[:, column_selection], dtype=bool)
+
+    packed_mask = dataset[:, column_selection]
+    return np.unpackbits(packed_mask, axis=0,
+                         count=int(dataset.attrs['NrOfPackedRows'])).view(bool)
+
+
+# ########################################################################### #
+def get_fletcher32(data):
+    '''
+        HDF5 fletcher32 checksum of the given bytes.
+        Like the HDF5 implementation the 16 bit words are read big-endian,
+        an odd last byte is the high byte of an additional word.
+    '''
+    data = np.frombuffer(data, dtype='uint8')
+    if(len(data) % 2 == 1):
+        data = np.append(data, np.uint8(0))
+    words = data.view('>u2').astype('uint64')
+    if not words.any():
+        return 0
+
+    # sum2 adds the running sum1 after every word: sum(word_i*(n-i))
+    weights = np.arange(len(words), 0, -1, dtype='uint64') % 65535
+    sum1 = int(np.sum(words % 65535))
+    sum2 = int(np.sum((words*weights) % 65535))
+    # the folding of HDF5 returns 65535 instead of 0 for non zero sums
+    sum1 = (sum1-1) % 65535+1
+    sum2 = (sum2-1) % 65535+1
+    return (sum2 << 16) | sum1
+
+
+# ########################################################################### #
+decompression_pool = None
+
+
+def get_decompression_pool():
+    '''Thread pool shared by all readers, zlib releases the GIL'''
+    global decompression_pool
+    if decompression_pool is None:
+        decompression_pool = ThreadPoolExecutor(max_workers=multiprocessing.cpu_count())
+    return decompression_pool
+
+
+# ########################################################################### #
+class ParallelChunkReader:
+    '''
+        Read access to a chunked h5py dataset like dataset[selection],
+        but the raw chunks are read with 'read_direct_chunk' and the
+        filters (shuffle, gzip and fletcher32) are undone in a thread pool.
+        The chunks are copied into one preallocated array.
+        Selections of ints and slices with step 1 are supported,
+        other selections and datasets with other filters
+        are read by h5py itself.
+    '''
+
+    supported_filters = [h5py.h5z.FILTER_SHUFFLE,
+                         h5py.h5z.FILTER_DEFLATE,
+                         h5py.h5z.FILTER_FLETCHER32]
+
+    def __init__(self, dataset, verify_checksum=True, max_nr_of_pending_chunks=64):
+        self.dataset = dataset
+        self.verify_checksum = verify_checksum
+        self.max_nr_of_pending_chunks = max_nr_of_pending_chunks
+
+        self.filters = []
+        self.is_supported = (dataset.chunks is not None and
+                             dataset.dtype.kind in 'biuf')
+        if self.is_supported:
+            create_plist = dataset.id.get_create_plist()
+            for filter_index in range(create_plist.get_nfilters()):
+                filter_code = create_plist.get_filter(filter_index)[0]
+                self.filters.append(filter_code)
+                if filter_code not in self.supported_filters:
+                    self.is_supported = False
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def chunks(self):
+        return self.dataset.chunks
+
+    @property
+    def attrs(self):
+        return self.dataset.attrs
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, selection):
+        ranges = self.get_ranges(selection)
+        if not self.is_supported or ranges is None:
+            return self.dataset[selection]
+
+        values = np.empty([stop-start for start, stop, is_int in ranges],
+                          dtype=self.dataset.dtype)
+        if(values.size > 0):
+            self.read_into(values, ranges)
+
+        return values.reshape([stop-start for start, stop, is_int in ranges if not is_int])
+
+    def get_ranges(self, selection):
+        '''(start, stop, is_int) per dimension or None for other selections'''
+        if not isinstance(selection, tuple):
+            selection = (selection,)
+        if(len(selection) > len(self.dataset.shape)):
+            return None
+        selection = selection+(slice(None),)*(len(self.dataset.shape)-len(selection))
+
+        ranges = []
+        for dimension_selection, length in zip(selection, self.dataset.shape):
+            if isinstance(dimension_selection, (int, np.integer)):
+                index = int(dimension_selection)
+                if(index < 0):
+                    index += length
+                if(index < 0 or index >= length):
+                    return None
+                ranges.append((index, index+1, True))
+            elif isinstance(dimension_selection, slice):
+                start, stop, step = dimension_selection.indices(length)
+                if(step != 1):
+                    return None
+                ranges.append((start, max(start, stop), False))
+            else:
+                return None
+        return ranges
+
+    def read_into(self, values, ranges):
+        chunk_shape = self.dataset.chunks
+        chunk_offsets = itertools.product(*[
+            range(start//chunk_length*chunk_length, stop, chunk_length)
+            for (start, stop, is_int), chunk_length in zip(ranges, chunk_shape)])
+
+        pool = get_decompression_pool()
+        pending = []
+        for chunk_offset in chunk_offsets:
+            chunk_selection = []
+            values_selection = []
+            for (start, stop, is_int), offset, chunk_length in zip(ranges, chunk_offset, chunk_shape):
+                first = max(start, offset)
+                last = min(stop, offset+chunk_length)
+                chunk_selection.append(slice(first-offset, last-offset))
+                values_selection.append(slice(first-start, last-start))
+
+            # the reads are serial, the decoding parallel
+            chunk_info = self.dataset.id.get_chunk_info_by_coord(chunk_offset)
+            if chunk_info.byte_offset is None:
+                values[tuple(values_selection)] = self.dataset.fillvalue
+                continue
+            filter_mask, raw_chunk = self.dataset.id.read_direct_chunk(chunk_offset)
+            pending.append(pool.submit(self.decode_chunk_into, raw_chunk, filter_mask, values,
+                                       tuple(values_selection), tuple(chunk_selection)))
+            if(len(pending) >= self.max_nr_of_pending_chunks):
+                pending.pop(0).result()
+
+        for future in pending:
+            future.result()
+
+    def decode_chunk_into(self, raw_chunk, filter_mask, values, values_selection, chunk_selection):
+        data = raw_chunk
+        # undo the filters in reverse order, skipped filters are marked in the filter_mask
+        for filter_index in reversed(range(len(self.filters))):
+            if(filter_mask & (1 << filter_index)):
+                continue
+            filter_code = self.filters[filter_index]
+            if(filter_code == h5py.h5z.FILTER_FLETCHER32):
+                data, checksum = data[:-4], data[-4:]
+                if self.verify_checksum:
+                    self.check_fletcher32(data, checksum)
+            elif(filter_code == h5py.h5z.FILTER_DEFLATE):
+                data = zlib.decompress(data)
+            elif(filter_code == h5py.h5z.FILTER_SHUFFLE):
+                itemsize = self.dataset.dtype.itemsize
+                data = np.frombuffer(data, dtype='uint8').reshape(itemsize, -1).T.tobytes()
+
+        chunk = np.frombuffer(data, dtype=self.dataset.dtype).reshape(self.dataset.chunks)
+        values[values_selection] = chunk[chunk_selection]
+
+    def check_fletcher32(self, data, checksum):
+        # older HDF5 versions stored the checksum byte swapped
+        fletcher32 = get_fletcher32(data)
+        if(fletcher32 != int.from_bytes(checksum, 'little') and
+           fletcher32 != int.from_bytes(checksum, 'big')):
+            error_str = ('Fletcher32 checksum mismatch in dataset ' +
+                         str(self.dataset.name))
+            raise Exception(error_str)
+
+
+# ########################################################################### #
+class CompressedRow:
+    '''
+        One row of a dataset with one row per chunk, which is already
+        split into its chunks and encoded with the filters of the dataset
+        (see 'compress_h5py_row'). The chunks are written with
+        'write_direct_chunk', so the writing process does no compression.
+    '''
+
+    def __init__(self, chunks):
+        # list of (column offset, encoded chunk bytes)
+        self.chunks = chunks
+
+
+# ########################################################################### #
+def get_chunk_encoding(dataset):
+    '''
+        Return the picklable (chunks, dtype, fillvalue, filters) of a
+        2 dimensional dataset with one row per chunk and just
+        shuffle, gzip and fletcher32 filters, else None.
+        The filters are the (filter_code, filter_values) in pipeline order.
+    '''
+    if(dataset.chunks is None or len(dataset.shape) != 2 or
+       dataset.chunks[0] != 1 or dataset.dtype.kind not in 'biuf'):
+        return None
+
+    filters = []
+    create_plist = dataset.id.get_create_plist()
+    for filter_index in range(create_plist.get_nfilters()):
+        filter_code, flags, filter_values, name = create_plist.get_filter(filter_index)
+        if filter_code not in ParallelChunkReader.supported_filters:
+            return None
+        filters.append((filter_code, tuple(filter_values)))
+
+    return (dataset.chunks, dataset.dtype.str, dataset.fillvalue, filters)
+
+
+# ########################################################################### #
+def encode_chunk(chunk, filters):
+    '''Apply the (filter_code, filter_values) filters like HDF5 to the chunk'''
+    data = np.ascontiguousarray(chunk).tobytes()
+    for filter_code, filter_values in filters:
+        if(filter_code == h5py.h5z.FILTER_SHUFFLE):
+            itemsize = chunk.dtype.itemsize
+            data = np.frombuffer(data, dtype='uint8').reshape(-1, itemsize).T.tobytes()
+        elif(filter_code == h5py.h5z.FILTER_DEFLATE):
+            level = filter_values[0] if filter_values else 6
+            data = zlib.compress(data, level)
+        elif(filter_code == h5py.h5z.FILTER_FLETCHER32):
+            data += get_fletcher32(data).to_bytes(4, 'little')
+    return data
+
+
+# ########################################################################### #
+def compress_h5py_row(row, chunk_encoding):
+    '''
+        Split the row into the chunks of a dataset with the given
+        chunk_encoding (see 'get_chunk_encoding') and encode them.
+        Meant to be called in the worker processes, the returned
+        'CompressedRow' can be appended with the H5pyTableAppender.
+    '''
+    return compress_h5py_row_pieces([row], chunk_encoding)
+
+
+# ########################################################################### #
+def compress_h5py_row_pieces(row_pieces, chunk_encoding):
+    '''
+        Like 'compress_h5py_row' for a row given as iterable of
+        consecutive pieces, the chunks are encoded as soon as they are
+        complete, so the full row never has to be in memory.
+    '''
+    chunks, dtype, fillvalue, filters = chunk_encoding
+    chunk_width = chunks[1]
+
+    encoded_chunks = []
+    column_offset = 0
+    rest = np.empty(0, dtype=dtype)
+    for row_piece in row_pieces:
+        row_piece = np.asarray(row_piece, dtype=dtype).reshape(-1)
+        if(len(rest) > 0):
+            row_piece = np.concatenate((rest, row_piece))
+        nr_of_full_columns = len(row_piece)//chunk_width*chunk_width
+        for chunk_start in range(0, nr_of_full_columns, chunk_width):
+            chunk = row_piece[chunk_start:chunk_start+chunk_width]
+            encoded_chunks.append((column_offset, encode_chunk(chunk, filters)))
+            column_offset += chunk_width
+        rest = row_piece[nr_of_full_columns:].copy()
+
+    if(len(rest) > 0):
+        # edge chunks are stored in full size
+        chunk = np.concatenate((rest, np.full(chunk_width-len(rest), fillvalue, dtype=dtype)))
+        encoded_chunks.append((column_offset, encode_chunk(chunk, filters)))
+
+    return CompressedRow(encoded_chunks)
+
+
+# ########################################################################### #
+def write_compressed_row(dataset, row_index, compressed_row):
+    for column_offset, data in compressed_row.chunks:
+        dataset.id.write_direct_chunk((row_index, column_offset), data)
@@ -0,0 +1,166 @@
+import numpy as np
+
+
+# ########################################################################### #
+def calculate_linear_fit_values(temperature, drs_value_array, mask=None,
+                                nr_of_cells_per_block=512):
+    '''
+        Calculate for every cell (column) of the given drs_value_array
+        the linear fit values drs_value = slope*temperature + offset
+        and the mean of the absolute residuals.
+        All cells of the chunk share the same temperature vector,
+        so the fit is done for a block of cells at once with masked sums
+        instead of one 'scipy.stats.linregress' call per cell.
+        Like 'linregress' the sums are build around the mean values,
+        so the results are the same within the float64 precision.
+        Cells with less than two used values or without any
+        temperature variation will get the fit values nan.
+
+        Args:
+            temperature (array):
+                Temperature per drs value row, shape (nr_of_values,)
+            drs_value_array (array):
+                Drs values, shape (nr_of_values, nr_of_cells)
+            mask (array):
+                Optional boolean mask of the same shape as the drs_value_array,
+                only the values with a True entry will used for the fit
+            nr_of_cells_per_block (int):
+                Number of cells processed at once, limits the used memory
+
+        Returns:
+            (slope, offset, residual_mean) as float64 arrays
+            of the shape (nr_of_cells,)
+    '''
+
+    temperature = np.asarray(temperature, dtype='float64').reshape(-1)
+    nr_of_values, nr_of_cells = drs_value_array.shape
+    if(temperature.shape[0] != nr_of_values):
+        error_str = ('Got {} temperature values for {} drs value rows'
+                     ).format(temperature.shape[0], nr_of_values)
+        raise ValueError(error_str)
+    if(mask is not None and mask.shape != drs_value_array.shape):
+        error_str = ('Mask shape {} does not match the drs value shape {}'
+                     ).format(mask.shape, drs_value_array.shape)
+        raise ValueError(error_str)
+
+    slope = np.full(nr_of_cells, np.nan, dtype='float64')
+    offset = np.full(nr_of_cells, np.nan, dtype='float64')
+    residual_mean = np.full(nr_of_cells, np.nan, dtype='float64')
+
+    temp = temperature[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for block_start in range(0, nr_of_cells, nr_of_cells_per_block):
+            block = slice(block_start, min(block_start+nr_of_cells_per_block, nr_of_cells))
+            value = np.asarray(drs_value_array[:, block], dtype='float64')
+
+            if(mask is None):
+                nr_of_used_values = np.full(value.shape[1], nr_of_values, dtype='float64')
+                temp_mean = np.full(value.shape[1], np.mean(temperature), dtype='float64')
+                value_mean = np.sum(value, axis=0)/nr_of_used_values
+                delta_temp = np.broadcast_to(temp - temp_mean, value.shape)
+                delta_value = value - value_mean
+            else:
+                sub_mask = np.asarray(mask[:, block], dtype=bool)
+                nr_of_used_values = np.count_nonzero(sub_mask, axis=0).astype('float64')
+                temp_mean = np.dot(temperature, sub_mask)/nr_of_used_values
+                value = np.where(sub_mask, value, 0.)
+                value_mean = np.sum(value, axis=0)/nr_of_used_values
+                delta_temp = np.where(sub_mask, temp - temp_mean, 0.)
+                delta_value = np.where(sub_mask, value - value_mean, 0.)
+
+            s_xx = np.einsum('ij,ij->j', delta_temp, delta_temp)
+            s_xy = np.einsum('ij,ij->j', delta_temp, delta_value)
+            block_slope = s_xy/s_xx
+
+            # v - (slope*t + offset) = delta_value - slope*delta_temp
+            residual = np.abs(delta_value - block_slope*delta_temp)
+            if(mask is not None):
+                residual[~sub_mask] = 0.
+            block_residual_mean = np.sum(residual, axis=0)/nr_of_used_values
+
+            valid = (nr_of_used_values >= 2) & (s_xx > 0)
+            slope[block] = np.where(valid, block_slope, np.nan)
+            offset[block] = np.where(valid, value_mean - block_slope*temp_mean, np.nan)
+            residual_mean[block] = np.where(valid, block_residual_mean, np.nan)
+
+    return (slope, offset, residual_mean)
+
+
+# ########################################################################### #
+linear_fit_sum_names = ['Count', 'SumT', 'SumTT', 'SumV', 'SumTV', 'SumVV']
+
+
+def calculate_linear_fit_sums(temperature, drs_value_array, mask=None):
+    '''
+        Calculate for every cell (column) of the given drs_value_array
+        the sufficient statistics of the linear fit: the number of used values
+        and the sums of t, t*t, v, t*v and v*v.
+        The sums of disjoint sets of values just add up,
+        'calculate_linear_fit_values_from_sums' returns the fit values.
+
+        Args:
+            temperature (array):
+                Temperature per drs value row, shape (nr_of_values,),
+                or per drs value like the drs_value_array
+            drs_value_array (array):
+                Drs values, shape (nr_of_values, nr_of_cells)
+            mask (array):
+                Optional boolean mask of the same shape as the drs_value_array,
+                only the values with a True entry will used
+
+        Returns:
+            dict of the linear_fit_sum_names -> float64 arrays
+            of the shape (nr_of_cells,)
+    '''
+
+    value = np.asarray(drs_value_array, dtype='float64')
+    temperature = np.asarray(temperature, dtype='float64')
+    if(temperature.ndim == 1):
+        temperature = temperature[:, None]
+    temp = np.array(np.broadcast_to(temperature, value.shape))
+    if(mask is None):
+        count = np.full(value.shape[1], value.shape[0], dtype='float64')
+    else:
+        mask = np.asarray(mask, dtype=bool)
+        count = np.count_nonzero(mask, axis=0).astype('float64')
+        value = np.where(mask, value, 0.)
+        temp[~mask] = 0.
+
+    return {'Count': count,
+            'SumT': np.sum(temp, axis=0),
+            'SumTT': np.einsum('ij,ij->j', temp, temp),
+            'SumV': np.sum(value, axis=0),
+            'SumTV': np.einsum('ij,ij->j', temp, value),
+            'SumVV': np.einsum('ij,ij->j', value, value)}
+
+
+# ########################################################################### #
+def calculate_linear_fit_values_from_sums(sums):
+    '''
+        Fit values of the sums of 'calculate_linear_fit_sums'.
+        Slope and offset are the same as of 'calculate_linear_fit_values',
+        but the mean of the absolute residuals can not be build from sums,
+        instead the root mean square of the residuals
+        sqrt(sum((v - slope*t - offset)^2)/n) is returned,
+        which is not smaller than the mean of the absolute residuals.
+
+        Returns:
+            (slope, offset, residual_rms) as float64 arrays
+    '''
+
+    count = np.asarray(sums['Count'], dtype='float64')
+    sum_t = np.asarray(sums['SumT'], dtype='float64')
+    sum_v = np.asarray(sums['SumV'], dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s_xx = sums['SumTT'] - sum_t*sum_t/count
+        s_xy = sums['SumTV'] - sum_t*sum_v/count
+        s_yy = sums['SumVV'] - sum_v*sum_v/count
+
+        slope = s_xy/s_xx
+        offset = (sum_v - slope*sum_t)/count
+        residual_rms = np.sqrt(np.maximum(s_yy - slope*s_xy, 0.)/count)
+
+    valid = (count >= 2) & (s_xx > 0)
+    return (np.where(valid, slope, np.nan),
+            np.where(valid, offset, np.nan),
+            np.where(valid, residual_rms, np.nan))
@@ -13,6 +13,7 @@ from astropy.table import Table
 from tqdm import tqdm
 from fact.factdb import connect_database, RunInfo
 from astropy.io import fits
+from drs4Calibration.temperatureArchive import TemperatureArchive
 
 
 ###############################################################################
@@ -151,25 +152,36 @@ def plot_camera_video(drs_file_path, interval_file_path, store_file_path):
                 default=10)
 @click.argument('store_file_path',
                 default='temperatureTrendOf2016_patch10.png')
+@click.option('--temperature_archive_path', '-t',
+              default=None,
+              type=click.Path(exists=True),
+              help='Temperature archive used instead of the nightly temperature files')
 ###############################################################################
 def temperature_trend_per_patch(data_file_path, start_date_str, end_date_str,
-                                patch_nr, store_file_path):
+                                patch_nr, store_file_path, temperature_archive_path):
 
     time = np.array([])
     temp = np.array([])
 
-    month_before = 0
-    for date in tqdm(pd.date_range(start=start_date_str, end=end_date_str, freq='D')):
-        if(month_before < date.month):
-            month_before = date.month
-
-        filename = (data_file_path + '{}/{:02d}/{:02d}/'.format(date.year, date.month, date.day) +
-                    '{}{:02d}{:02d}.FAD_CONTROL_TEMPERATURE.fits'.format(date.year, date.month, date.day))
-        if(os.path.isfile(filename)):
-            #print("found: ", filename)
-            with fits.open(filename) as tab_temp:
-                time = np.append(time, tab_temp[1].data['Time'])
-                temp = np.append(temp, tab_temp[1].data['temp'][::, patch_nr])
+    if temperature_archive_path is not None:
+        with TemperatureArchive(temperature_archive_path) as temperature_archive:
+            time, temp = temperature_archive.get_values(
+                            pd.to_datetime(start_date_str),
+                            pd.to_datetime(end_date_str)+pd.DateOffset(days=1),
+                            patch_nr)
+    else:
+        month_before = 0
+        for date in tqdm(pd.date_range(start=start_date_str, end=end_date_str, freq='D')):
+            if(month_before < date.month):
+                month_before = date.month
+
+            filename = (data_file_path + '{}/{:02d}/{:02d}/'.format(date.year, date.month, date.day) +
+                        '{}{:02d}{:02d}.FAD_CONTROL_TEMPERATURE.fits'.format(date.year, date.month, date.day))
+            if(os.path.isfile(filename)):
+                #print("found: ", filename)
+                with fits.open(filename) as tab_temp:
+                    time = np.append(time, tab_temp[1].data['Time'])
+                    temp = np.append(temp, tab_temp[1].data['temp'][::, patch_nr])
 
     datetime = pd.to_datetime(time * 24 * 3600 * 1e9)
 
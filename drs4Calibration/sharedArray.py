@@ -0,0 +1,124 @@
+import os
+import numpy as np
+
+from multiprocessing import shared_memory
+
+
+# ########################################################################### #
+class SharedArray:
+    '''
+        1D numpy array in a multiprocessing.shared_memory block.
+        Worker processes write their results directly into slices
+        of the array (see 'get_slice'), so neither temporary files
+        nor a copy of the whole array are needed.
+        The block has to be freed with 'release'.
+    '''
+
+    def __init__(self, size, dtype, fill_value=None):
+        self.dtype = np.dtype(dtype)
+        self.shared_memory = shared_memory.SharedMemory(
+                                create=True, size=max(1, size*self.dtype.itemsize))
+        self.array = np.ndarray(size, dtype=self.dtype, buffer=self.shared_memory.buf)
+        if fill_value is not None:
+            self.array[:] = fill_value
+
+    def get_slice(self, start, stop):
+        '''Picklable handle of the elements [start, stop) of the array'''
+        return SharedArraySlice(self.shared_memory.name, self.dtype.str, start, stop)
+
+    def release(self):
+        '''
+            Free the shared memory block, the memory of still used views
+            of the array is freed together with the last view
+        '''
+        self.array = None
+        self.shared_memory.unlink()
+        try:
+            self.shared_memory.close()
+        except BufferError:
+            pass
+
+
+# ########################################################################### #
+class SharedArraySlice:
+    '''Slice of a 'SharedArray', which can be written in any process'''
+
+    def __init__(self, name, dtype, start, stop):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.start = start
+        self.stop = stop
+
+    def write(self, values):
+        # the joblib workers share the resource tracker of the main process,
+        # so the block stays registered just once and is unlinked by its owner
+        block = shared_memory.SharedMemory(name=self.name)
+        try:
+            array = np.ndarray(self.stop-self.start, dtype=self.dtype, buffer=block.buf,
+                               offset=self.start*self.dtype.itemsize)
+            array[:] = values
+            del array
+        finally:
+            block.close()
+
+
+# ########################################################################### #
+class ScratchArray:
+    '''
+        Same as 'SharedArray', but the array is a file in a durable
+        scratch folder, so the written slices survive a crash.
+        An existing file of the right size is reused (resume),
+        the file is only removed by 'release(remove=True)'.
+    '''
+
+    def __init__(self, path, size, dtype, fill_value=None, resume=False):
+        self.path = path
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        self.resumed = (resume and os.path.isfile(path) and
+                        os.path.getsize(path) == max(1, size*self.dtype.itemsize))
+        if not self.resumed:
+            array = np.memmap(path, mode='w+', shape=max(1, size), dtype=self.dtype)
+            if fill_value is not None:
+                array[:] = fill_value
+            array.flush()
+            del array
+        self._array = None
+
+    @property
+    def array(self):
+        '''
+            Copy-on-write view of the file, changes of the array
+            (like the normalisation of the gain) are not written back
+        '''
+        if self._array is None:
+            self._array = np.memmap(self.path, mode='c', shape=self.size, dtype=self.dtype)
+        return self._array
+
+    def get_slice(self, start, stop):
+        '''Picklable handle of the elements [start, stop) of the array'''
+        return ScratchArraySlice(self.path, self.dtype.str, start, stop)
+
+    def release(self, remove=False):
+        self._array = None
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+# ########################################################################### #
+class ScratchArraySlice:
+    '''Slice of a 'ScratchArray', which can be written in any process'''
+
+    def __init__(self, path, dtype, start, stop):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.start = start
+        self.stop = stop
+
+    def write(self, values):
+        array = np.memmap(self.path, mode='r+', shape=self.stop-self.start, dtype=self.dtype,
+                          offset=self.start*self.dtype.itemsize)
+        array[:] = values
+        # the values are on disk, before the task is marked as done
+        array.flush()
+        del array
@@ -0,0 +1,253 @@
+import pandas as pd
+import numpy as np
+import click
+import h5py
+import os
+import logging
+
+from tqdm import tqdm
+from astropy.io import fits
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+
+
+temperature_file_extension = '.FAD_CONTROL_TEMPERATURE.fits'
+
+
+###############################################################################
+###############################################################################
+@click.command()
+@click.argument('aux_folder_path',
+                default='/net/big-tank/POOL/projects/fact/drs4_calibration_data/aux/',
+                type=click.Path(exists=True))
+@click.argument('store_file_path',
+                default='/net/big-tank/POOL/' +
+                        'projects/fact/drs4_calibration_data/' +
+                        'calibration/calculation/temperatureArchive.h5',
+                type=click.Path(exists=False))
+###############################################################################
+def store_temperature_archive(aux_folder_path: str, store_file_path: str):
+    '''
+        Collect the temperatures of all nightly FAD_CONTROL_TEMPERATURE files
+        under the given aux folder into one .h5 archive.
+        The archive contains the time sorted 'Time' (float64, in the
+        days since 1970 of the aux files), the 'Temperature' (float32)
+        of all temperature sensors and per night the 'Night' (yyyymmdd) and
+        the 'NightOffset', the index of its first entry.
+        Files with a wrong number of temperature sensors or
+        overlapping the previous night are not used.
+
+        Args:
+            aux_folder_path (str):
+                Path to the aux-folder containing the temperature-files
+            store_file_path (str):
+                Full path to the store-file with the extension '.h5'
+    '''
+
+    logging.basicConfig(
+        filename=store_file_path.split('.')[0]+".log", filemode='w',
+        format='%(levelname)s:%(message)s', level=logging.DEBUG)
+
+    temperature_file_paths = []
+    for folder_path, folder_names, file_names in os.walk(aux_folder_path):
+        for file_name in file_names:
+            if file_name.endswith(temperature_file_extension):
+                temperature_file_paths.append(os.path.join(folder_path, file_name))
+    temperature_file_paths.sort(key=os.path.basename)
+
+    with h5py.File(store_file_path, 'w') as store:
+        store.attrs['Info'] = ('Temperature of all nights, ' +
+                               'Time in days since 1970-01-01')
+        store.create_dataset(
+            name='Time', dtype='float64',
+            shape=(0,), maxshape=(None,), chunks=(65536,),
+            compression='gzip', compression_opts=4,
+            fletcher32=True)
+        store.create_dataset(
+            name='Temperature', dtype='float32',
+            shape=(0, NRTEMPSENSOR), maxshape=(None, NRTEMPSENSOR),
+            chunks=(1024, NRTEMPSENSOR),
+            compression='gzip', compression_opts=4,
+            fletcher32=True)
+
+        nights = []
+        night_offsets = [0]
+        last_time = -np.inf
+        for temperature_file_path in tqdm(temperature_file_paths):
+            temp_filename = os.path.basename(temperature_file_path)
+            try:
+                table_time, table_temperature = read_temperature_file(temperature_file_path)
+            except Exception as error:
+                logging.info(' '+str(error))
+                continue
+
+            if(len(table_time) == 0):
+                continue
+            if(table_time[0] <= last_time):
+                logging.info(" File not used: Overlapping with the previous night '" +
+                             temp_filename+"'")
+                continue
+
+            add_rows_to_h5py_table(store, 'Time', table_time)
+            add_rows_to_h5py_table(store, 'Temperature', table_temperature)
+            nights.append(int(temp_filename[:8]))
+            night_offsets.append(night_offsets[-1]+len(table_time))
+            last_time = table_time[-1]
+
+        store.create_dataset('Night', data=np.array(nights, dtype='uint32'))
+        store.create_dataset('NightOffset', data=np.array(night_offsets, dtype='uint64'))
+        store.attrs['CreationDate'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ########################################################################### #
+def read_temperature_file(temperature_file_path):
+    with fits.open(temperature_file_path,
+                   mmap=True,
+                   mode='denywrite',
+                   ignoremissing=True,
+                   ignore_missing_end=True) as table:
+
+        table_time = np.array(table[1].data['Time'], dtype='float64')
+        table_temperature = np.array(table[1].data['temp'], dtype='float32')
+
+    if table_temperature.shape[1] != NRTEMPSENSOR:
+        temp_filename = temperature_file_path.split('/')[-1]
+        message = (
+            " File not used: Just "+str(table_temperature.shape[1]) +
+            " Temperature Values in File '"+temp_filename+"'")
+        raise Exception(message)
+
+    order = np.argsort(table_time, kind='stable')
+    return (table_time[order], table_temperature[order])
+
+
+# ########################################################################### #
+def add_rows_to_h5py_table(h5py_table, column_name, values):
+    data = h5py_table[column_name]
+    nr_of_rows = len(data)
+    data.resize(nr_of_rows+len(values), axis=0)
+    data[nr_of_rows:] = values
+
+
+# ########################################################################### #
+def datetime_to_aux_time(datetime):
+    '''Convert datetime(s) into the days since 1970 of the aux files'''
+    return pd.to_datetime(datetime).values.astype('datetime64[ns]').astype('int64')/(24 * 3600 * 1e9)
+
+
+# ########################################################################### #
+class TemperatureArchive:
+    '''
+        Read access to a with 'store_temperature_archive' created archive.
+        'Time' and the night offsets are hold in memory,
+        the temperatures are read per query.
+    '''
+
+    def __init__(self, archive_file_path):
+        self.archive_file = h5py.File(archive_file_path, 'r')
+        self.time = self.archive_file['Time'][:]
+        self.temperature = self.archive_file['Temperature']
+        self.night = self.archive_file['Night'][:]
+        self.night_offset = self.archive_file['NightOffset'][:].astype('int64')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.archive_file.close()
+
+    def get_window_indices(self, time_windows):
+        '''
+            Like the per night search with 'np.where' take all entries
+            after the begin and before the end of every (begin, end) window
+            and extend them by the neighbouring entry on both sides,
+            without crossing the borders of the night.
+            Returns the first and last index of every window.
+        '''
+        time_windows = np.asarray(time_windows)
+        begin = datetime_to_aux_time(time_windows[:, 0])
+        end = datetime_to_aux_time(time_windows[:, 1])
+
+        lower_index = np.searchsorted(self.time, begin, side='right')
+        upper_index = np.searchsorted(self.time, end, side='left')-1
+
+        out_of_range = (lower_index >= len(self.time)) | (upper_index < 0)
+        night_index = np.searchsorted(self.night_offset, lower_index, side='right')-1
+        upper_night_index = np.searchsorted(self.night_offset, upper_index, side='right')-1
+        out_of_range |= (night_index != upper_night_index)
+        if(out_of_range.any()):
+            raise Exception('Cant use drs file,' +
+                            ' runs out of range of temperature data taking')
+
+        lower_index = np.maximum(lower_index-1, self.night_offset[night_index])
+        upper_index = np.minimum(upper_index+1, self.night_offset[night_index+1]-1)
+
+        return (lower_index, upper_index)
+
+    def get_window_means(self, time_windows, max_read_bytes=pow(2, 27)):
+        '''
+            Return for every (begin, end) of the given time_windows the mean
+            of the time (float64) and the mean of all temperature sensors (float32).
+            The temperatures covering neighbouring windows are read at once
+            (up to max_read_bytes) and the means are build from their
+            cumulative sums, so a batch of windows costs one read.
+        '''
+        lower_index, upper_index = self.get_window_indices(time_windows)
+
+        time_mean = np.empty(len(lower_index), dtype='float64')
+        temperature_mean = np.empty((len(lower_index), NRTEMPSENSOR), dtype='float32')
+        max_nr_of_rows = max(1, max_read_bytes//(NRTEMPSENSOR*self.temperature.dtype.itemsize))
+        order = np.argsort(lower_index, kind='stable')
+        group_begin = 0
+        while(group_begin < len(order)):
+            first = lower_index[order[group_begin]]
+            last = upper_index[order[group_begin]]
+            group_end = group_begin+1
+            while(group_end < len(order) and
+                  max(last, upper_index[order[group_end]])-first < max_nr_of_rows):
+                last = max(last, upper_index[order[group_end]])
+                group_end += 1
+            windows = order[group_begin:group_end]
+            lower = lower_index[windows]-first
+            upper = upper_index[windows]-first+1
+            nr_of_rows = (upper-lower).astype('float64')
+
+            # relative to the first time, so the cumulative sums keep the precision
+            cumulative_time = np.zeros(last-first+2, dtype='float64')
+            np.cumsum(self.time[first:last+1]-self.time[first], out=cumulative_time[1:])
+            time_mean[windows] = (self.time[first] +
+                                  (cumulative_time[upper]-cumulative_time[lower])/nr_of_rows)
+
+            cumulative_temperature = np.zeros((last-first+2, NRTEMPSENSOR), dtype='float64')
+            np.cumsum(self.temperature[first:last+1], axis=0, dtype='float64',
+                      out=cumulative_temperature[1:])
+            temperature_mean[windows] = ((cumulative_temperature[upper]-cumulative_temperature[lower]) /
+                                         nr_of_rows[:, None])
+            group_begin = group_end
+
+        return (time_mean, temperature_mean)
+
+    def get_values(self, begin, end, sensor=None):
+        '''
+            Return all times and temperatures (all or just of the given sensor)
+            between begin and end
+        '''
+        lower = np.searchsorted(self.time, datetime_to_aux_time([begin])[0], side='left')
+        upper = np.searchsorted(self.time, datetime_to_aux_time([end])[0], side='right')
+        if sensor is None:
+            return (self.time[lower:upper], self.temperature[lower:upper])
+        return (self.time[lower:upper], self.temperature[lower:upper, sensor])
+
+
+# ########################################################################### #
+opened_temperature_archives = {}
+
+
+def open_temperature_archive(archive_file_path):
+    '''Open every archive just once per process'''
+    if archive_file_path not in opened_temperature_archives:
+        opened_temperature_archives[archive_file_path] = TemperatureArchive(archive_file_path)
+    return opened_temperature_archives[archive_file_path]
@@ -18,6 +18,7 @@ from joblib import Parallel, delayed
 import drs4Calibration.config as config
 from drs4Calibration.constants import NRCHID, NRCELL, NRTEMPSENSOR, ROI, ADCCOUNTSTOMILIVOLT
 from drs4Calibration.tools import safety_stuff
+from drs4Calibration.h5pyTools import H5pyTableAppender
 
 import matplotlib.pyplot as plt
 from time import time
@@ -123,155 +124,143 @@ def store_drs_values(drs_file_list_doc_path, store_file_path, source_folder_path
 
 
     source_data_set = SourceDataSet()
-    drs_file_list = open(drs_file_list_doc_path).read().splitlines()
-    for drs_fits_file_path in tqdm(drs_file_list):
-        drs_fits_file_path = drs_file_list[700] # care!!
-        date_path_part = drs_fits_file_path.split('_')[0]
-
-        drs_fits_file_path = (source_folder_path+"raw/" +
-                              drs_fits_file_path.strip("\n"))
-        drs_file_path = (drs_fits_file_path.strip("fits.fz") +
-                         ".drs.fits.gz")
-        temp_file_path = (source_folder_path+"aux/" +
-                          date_path_part+".FAD_CONTROL_TEMPERATURE.fits")
-
-        if(os.path.isfile(drs_fits_file_path) and os.path.isfile(temp_file_path)):
-            time_marker1 = time()
-            with fits.open(drs_file_path,
-                           ignoremissing=True,
-                           ignore_missing_end=True) as drs_table:
-
-                source_data_set.run_begin = pd.to_datetime(drs_table[1].header["RUN2-BEG"])
-                source_data_set.run_end = pd.to_datetime(drs_table[1].header["RUN2-END"])
-
-            print(type(source_data_set.run_begin), type(source_data_set.run_end))
-            time_marker2 = time()
-            print_delta_time(time_marker2 - time_marker1, "open drs_file_path")
-            time_marker3 = time()
-            with fits.open(temp_file_path,
-                           mmap=True,
-                           mode='denywrite',
-                           ignoremissing=True,
-                           ignore_missing_end=True) as table:
-
-                table_time = table[1].data["Time"]
-                table_temperature = table[1].data["temp"]
-            time_marker4 = time()
-            print_delta_time(time_marker4 - time_marker3, "open temp_file_path")
-            print(type(table_time), table_time.shape, type(table_temperature), table_temperature.shape)
-            time_marker5 = time()
-            if table_temperature.shape[1] != NRTEMPSENSOR:
-                temp_filename = temp_file_path.split('/')[-1]
-                message = (
-                    " File not used: Just "+str(table_temperature.shape[1]) +
-                    " Temperature Values in File '"+temp_filename+"'")
-                raise Exception(message)
-
-            table_datetime = pd.to_datetime(table_time * 24 * 3600 * 1e9)
-            data_len = len(table_datetime)
-
-            lower_mask = np.where(table_datetime > source_data_set.run_begin)[0]
-            upper_mask = np.where(table_datetime < source_data_set.run_end)[0]
-
-            mask = []
-            if(len(lower_mask) is not 0 and
-               len(upper_mask) is not 0):
-
-                lower_boundarie_idx = lower_mask[0]
-                upper_boundarie_idx = upper_mask[-1]
-
-                if(lower_boundarie_idx > 0):
-                    lower_boundarie_idx = lower_boundarie_idx - 1
-                if(upper_boundarie_idx < data_len):
-                    upper_boundarie_idx = upper_boundarie_idx + 1
-
-                mask = np.arange(lower_boundarie_idx, upper_boundarie_idx+1, 1, dtype="int")
-
-            if len(mask) == 0:
-                message = ("Cant use drs file," +
-                           " runs out of range of temperature data taking")
-                raise Exception(message)
-            timestamps_during_run = np.array(table_time[mask])
-            temperature_during_run = np.array(table_temperature[mask])
-
-            if timestamps_during_run.shape[0] > 1:
-                time_mean = np.mean(timestamps_during_run, dtype="float32")
+    # the store-file stays open and the rows are written chunkwise,
+    # the appender trims the datasets to the written rows also after a return
+    with h5py.File(store_file_path, 'r+') as h5pyTable, \
+            H5pyTableAppender(h5pyTable, ["Time", "Temperature", "NewBaseline"]) as table_appender:
+        drs_file_list = open(drs_file_list_doc_path).read().splitlines()
+        for drs_fits_file_path in tqdm(drs_file_list):
+            drs_fits_file_path = drs_file_list[700] # care!!
+            date_path_part = drs_fits_file_path.split('_')[0]
+
+            drs_fits_file_path = (source_folder_path+"raw/" +
+                                  drs_fits_file_path.strip("\n"))
+            drs_file_path = (drs_fits_file_path.strip("fits.fz") +
+                             ".drs.fits.gz")
+            temp_file_path = (source_folder_path+"aux/" +
+                              date_path_part+".FAD_CONTROL_TEMPERATURE.fits")
+
+            if(os.path.isfile(drs_fits_file_path) and os.path.isfile(temp_file_path)):
+                time_marker1 = time()
+                with fits.open(drs_file_path,
+                               ignoremissing=True,
+                               ignore_missing_end=True) as drs_table:
+
+                    source_data_set.run_begin = pd.to_datetime(drs_table[1].header["RUN2-BEG"])
+                    source_data_set.run_end = pd.to_datetime(drs_table[1].header["RUN2-END"])
+
+                print(type(source_data_set.run_begin), type(source_data_set.run_end))
+                time_marker2 = time()
+                print_delta_time(time_marker2 - time_marker1, "open drs_file_path")
+                time_marker3 = time()
+                with fits.open(temp_file_path,
+                               mmap=True,
+                               mode='denywrite',
+                               ignoremissing=True,
+                               ignore_missing_end=True) as table:
+
+                    table_time = table[1].data["Time"]
+                    table_temperature = table[1].data["temp"]
+                time_marker4 = time()
+                print_delta_time(time_marker4 - time_marker3, "open temp_file_path")
+                print(type(table_time), table_time.shape, type(table_temperature), table_temperature.shape)
+                time_marker5 = time()
+                if table_temperature.shape[1] != NRTEMPSENSOR:
+                    temp_filename = temp_file_path.split('/')[-1]
+                    message = (
+                        " File not used: Just "+str(table_temperature.shape[1]) +
+                        " Temperature Values in File '"+temp_filename+"'")
+                    raise Exception(message)
+
+                table_datetime = pd.to_datetime(table_time * 24 * 3600 * 1e9)
+                data_len = len(table_datetime)
+
+                lower_mask = np.where(table_datetime > source_data_set.run_begin)[0]
+                upper_mask = np.where(table_datetime < source_data_set.run_end)[0]
+
+                mask = []
+                if(len(lower_mask) is not 0 and
+                   len(upper_mask) is not 0):
+
+                    lower_boundarie_idx = lower_mask[0]
+                    upper_boundarie_idx = upper_mask[-1]
+
+                    if(lower_boundarie_idx > 0):
+                        lower_boundarie_idx = lower_boundarie_idx - 1
+                    if(upper_boundarie_idx < data_len):
+                        upper_boundarie_idx = upper_boundarie_idx + 1
+
+                    mask = np.arange(lower_boundarie_idx, upper_boundarie_idx+1, 1, dtype="int")
+
+                if len(mask) == 0:
+                    message = ("Cant use drs file," +
+                               " runs out of range of temperature data taking")
+                    raise Exception(message)
+                timestamps_during_run = np.array(table_time[mask])
+                temperature_during_run = np.array(table_temperature[mask])
+
+                if timestamps_during_run.shape[0] > 1:
+                    time_mean = np.mean(timestamps_during_run, dtype="float32")
+                else:
+                    time_mean = timestamps_during_run
+
+                if temperature_during_run.shape[0] > 1:
+                    temp_mean = np.mean(temperature_during_run, dtype="float32",
+                                        axis=0)
+                else:
+                    temp_mean = temperature_during_run
+                time_marker6 = time()
+                print_delta_time(time_marker6 - time_marker5, "calc temp/time")
+                print_delta_time(time_marker6 - time_marker1, "complete")
+
+                time_marker7 = time()
+                fits_stream = FactFits(drs_fits_file_path)
+                time_marker8 = time()
+                print_delta_time(time_marker8 - time_marker7, "load  fits_stream")
+
+                cell_sample_value_mean_default = array("f", [np.NaN] * (NRCELL*ROI))
+                chid_cell_sample_value_mean_default = array("f", [np.NaN] * (NRCHID*NRCELL*ROI))
+                chid_cell_sample_value_mean = deepcopy(chid_cell_sample_value_mean_default)
+                for chid in tqdm(range(NRCHID)):
+                    #time_marker9 = time()
+                    cell_sample_values = [x[:] for x in [[]] * (1024*300)]
+                    #time_marker10 = time()
+                    #print_delta_time(time_marker10 - time_marker9, "init  cell_sample_values")
+                    fits_stream = FactFits(drs_fits_file_path)
+                    for event in tqdm(fits_stream):
+                        start_cell = event["StartCellData"][chid]
+                        data = event["Data"]
+                        for sample in range(ROI):
+                            cell = (start_cell + sample) % NRCELL
+                            value = data[chid][sample]
+                            cell_sample_values[cell*ROI+sample].append(value)
+                            #print(type(event["Data"]), event["Data"].shape)
+
+                    # print(cell_sample_values[5*300+150])
+                    # print(cell_sample_values[15*300+150])
+                    # print(cell_sample_values[100*300+150])
+                    cell_sample_value_mean = deepcopy(cell_sample_value_mean_default)
+                    for index in tqdm(range(len(cell_sample_values))):
+                        #print(type(cell_sample_values[index]), cell_sample_values[index])
+                        values = cell_sample_values[index]
+                        if(len(values) == 1):
+                            cell_sample_value_mean[index] = values[0]
+                        elif (len(values) > 1):
+                            cell_sample_value_mean[index] = np.mean(values)
+
+                    chid_cell_sample_value_mean[chid*NRCELL*ROI:(chid+1)*NRCELL*ROI] = cell_sample_value_mean
+                    #print(cell_sample_value_mean)
+                return
+                #fits_stream.close()
+                table_appender.append({"Time": time_mean,
+                                       "Temperature": temp_mean,
+                                       "NewBaseline": chid_cell_sample_value_mean})
             else:
-                time_mean = timestamps_during_run
+                drs_filename = drs_fits_file_path.split('/')[-1]
+                temp_filename = temp_file_path.split('/')[-1]
+                print(" Pair of drs file '"+drs_filename+"'" +
+                      " and temp file '"+temp_filename+"' does not exist")
 
-            if temperature_during_run.shape[0] > 1:
-                temp_mean = np.mean(temperature_during_run, dtype="float32",
-                                    axis=0)
-            else:
-                temp_mean = temperature_during_run
-            time_marker6 = time()
-            print_delta_time(time_marker6 - time_marker5, "calc temp/time")
-            print_delta_time(time_marker6 - time_marker1, "complete")
-
-            time_marker7 = time()
-            fits_stream = FactFits(drs_fits_file_path)
-            time_marker8 = time()
-            print_delta_time(time_marker8 - time_marker7, "load  fits_stream")
-
-            cell_sample_value_mean_default = array("f", [np.NaN] * (NRCELL*ROI))
-            chid_cell_sample_value_mean_default = array("f", [np.NaN] * (NRCHID*NRCELL*ROI))
-            chid_cell_sample_value_mean = deepcopy(chid_cell_sample_value_mean_default)
-            for chid in tqdm(range(NRCHID)):
-                #time_marker9 = time()
-                cell_sample_values = [x[:] for x in [[]] * (1024*300)]
-                #time_marker10 = time()
-                #print_delta_time(time_marker10 - time_marker9, "init  cell_sample_values")
-                fits_stream = FactFits(drs_fits_file_path)
-                for event in tqdm(fits_stream):
-                    start_cell = event["StartCellData"][chid]
-                    data = event["Data"]
-                    for sample in range(ROI):
-                        cell = (start_cell + sample) % NRCELL
-                        value = data[chid][sample]
-                        cell_sample_values[cell*ROI+sample].append(value)
-                        #print(type(event["Data"]), event["Data"].shape)
-
-                # print(cell_sample_values[5*300+150])
-                # print(cell_sample_values[15*300+150])
-                # print(cell_sample_values[100*300+150])
-                cell_sample_value_mean = deepcopy(cell_sample_value_mean_default)
-                for index in tqdm(range(len(cell_sample_values))):
-                    #print(type(cell_sample_values[index]), cell_sample_values[index])
-                    values = cell_sample_values[index]
-                    if(len(values) == 1):
-                        cell_sample_value_mean[index] = values[0]
-                    elif (len(values) > 1):
-                        cell_sample_value_mean[index] = np.mean(values)
-
-                chid_cell_sample_value_mean[chid*NRCELL*ROI:(chid+1)*NRCELL*ROI] = cell_sample_value_mean
-                #print(cell_sample_value_mean)
-            return
-            #fits_stream.close()
-            with h5py.File(store_file_path) as h5pyTable:
-                add_value_to_h5py_table(
-                    h5pyTable,
-                    "Time",
-                    time_mean)
-                add_value_to_h5py_table(
-                    h5pyTable,
-                    "Temperature",
-                    temp_mean)
-                add_value_to_h5py_table(
-                    h5pyTable,
-                    "NewBaseline",
-                    chid_cell_sample_value_mean)
-        else:
-            drs_filename = drs_fits_file_path.split('/')[-1]
-            temp_filename = temp_file_path.split('/')[-1]
-            print(" Pair of drs file '"+drs_filename+"'" +
-                  " and temp file '"+temp_filename+"' does not exist")
-
-
-
-def add_value_to_h5py_table(h5pyTable, columnName, value):
-    data = h5pyTable[columnName]
-    data.resize((len(data)+1, data.maxshape[1]))
-    data[len(data)-1, :] = value
 
 
 @click.command()
@@ -50,9 +50,32 @@ setup(
         ('drsCalib_v2_store_interval_indices =' +
             'drs4Calibration.drs4Calibration_version_1.' +
             'drs4Calibration_rawDataBased:store_source_based_interval_indices'),
+        ('drsCalib_v2_store_interval_sorted_data =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:store_interval_sorted_data_collection'),
         ('drsCalib_v2_save_fit_values =' +
             'drs4Calibration.drs4Calibration_version_1.' +
-            'drs4Calibration_rawDataBased:calculate_fit_values')
+            'drs4Calibration_rawDataBased:calculate_fit_values'),
+        ('drsCalib_v2_save_fit_values_of_intervals =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:calculate_fit_values_of_intervals'),
+        ('drsCalib_v2_update_fit_statistics =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:update_fit_statistics'),
+        ('drsCalib_v2_save_fit_values_from_statistics =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:calculate_fit_values_from_statistics'),
+        ('drsCalib_v2_store_cumulative_fit_sums =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:store_cumulative_fit_sums_of_intervals'),
+        ('drsCalib_v2_save_rolling_fit_values =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:calculate_rolling_fit_values'),
+        ('drsCalib_v2_store_fit_parameter_map =' +
+            'drs4Calibration.drs4Calibration_version_1.' +
+            'drs4Calibration_rawDataBased:store_fit_parameter_map'),
+        ('drsCalib_store_temperature_archive = ' +
+            'drs4Calibration.temperatureArchive:store_temperature_archive')
     ]},
     zip_safe=False,
 )
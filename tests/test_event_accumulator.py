@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import drs4Calibration.drs4Calibration_version_1.eventAccumulator as eventAccumulator
+from drs4Calibration.drs4Calibration_version_1.eventAccumulator import (
+    StartCellSumAccumulator, RolledMeanVarAccumulator)
+
+NRCHID = 6
+NRCELL = 16
+
+
+@pytest.fixture(autouse=True)
+def small_camera(monkeypatch):
+    monkeypatch.setattr(eventAccumulator, 'NRCHID', NRCHID)
+    monkeypatch.setattr(eventAccumulator, 'NRCELL', NRCELL)
+
+
+def get_events(nr_of_events, roi, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    start_cells = rng.integers(0, NRCELL, (nr_of_events, NRCHID))
+    offsets = rng.integers(200, 4000, NRCHID)
+    data = (offsets[None, :, None]+rng.normal(0, noise, (nr_of_events, NRCHID, roi)))
+    return start_cells, np.round(data).astype('int16')
+
+
+def get_reference_mean_and_std(start_cells, data):
+    '''The mean and std of the mean per chid, start cell and sample, event by event'''
+    roi = data.shape[2]
+    value_sum = np.zeros((NRCHID*NRCELL, roi))
+    square_sum = np.zeros((NRCHID*NRCELL, roi))
+    count = np.zeros(NRCHID*NRCELL)
+    for event_start_cells, event_data in zip(start_cells, data):
+        for chid in range(NRCHID):
+            key = chid*NRCELL+event_start_cells[chid]
+            value_sum[key] += event_data[chid]
+            square_sum[key] += np.square(event_data[chid].astype('float64'))
+            count[key] += 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = value_sum/count[:, None]
+        m2 = square_sum-value_sum*mean
+        std = np.sqrt(np.mean(m2, axis=1))/(count-1)
+    std[count < 2] = np.nan
+    return mean, std
+
+
+def add_blockwise(accumulator, start_cells, data, nr_of_events_per_block):
+    for block_start in range(0, len(data), nr_of_events_per_block):
+        block = slice(block_start, block_start+nr_of_events_per_block)
+        accumulator.add_events(start_cells[block], data[block])
+
+
+def test_start_cell_sums_equal_the_event_loop():
+    start_cells, data = get_events(200, 5, 6.)
+    accumulator = StartCellSumAccumulator(5, with_std=True)
+    add_blockwise(accumulator, start_cells, data, 32)
+
+    mean, std = get_reference_mean_and_std(start_cells, data)
+    accumulator_std = accumulator.get_std()
+    accumulator_mean = np.concatenate(list(accumulator.iterate_mean()))
+
+    assert accumulator_mean.dtype == 'float32'
+    assert np.allclose(accumulator_mean, mean.reshape(-1), rtol=1e-6, equal_nan=True)
+    assert accumulator_std.dtype == 'float16'
+    assert accumulator_std.shape == (NRCHID*NRCELL,)
+    assert np.array_equal(np.isnan(accumulator_std), np.isnan(std))
+    assert np.allclose(accumulator_std, std, rtol=2e-3, equal_nan=True)
+
+
+def test_unsampled_start_cells_are_nan():
+    start_cells, data = get_events(3, 4, 2.)
+    accumulator = StartCellSumAccumulator(4, with_std=True)
+    accumulator.add_events(start_cells, data)
+
+    mean, std = get_reference_mean_and_std(start_cells, data)
+
+    assert np.isnan(mean).any()
+    for chid in range(NRCHID):
+        rows = slice(chid*NRCELL*4, (chid+1)*NRCELL*4)
+        assert np.array_equal(np.isnan(accumulator.get_mean(chid)), np.isnan(mean.reshape(-1)[rows]))
+    assert np.array_equal(np.isnan(accumulator.get_std()), np.isnan(std))
+
+
+def test_sums_beyond_int16_are_promoted():
+    # the offsets from the reference of the chid do not fit into int16
+    start_cells, data = get_events(400, 3, 20., seed=1)
+    start_cells[:] = 0
+    data[200:, 2] += 1500
+    accumulator = StartCellSumAccumulator(3)
+    add_blockwise(accumulator, start_cells, data, 100)
+
+    mean, std = get_reference_mean_and_std(start_cells, data)
+    accumulator_mean = np.concatenate([accumulator.get_mean(chid) for chid in range(NRCHID)])
+
+    assert accumulator.value_sum[2].dtype == 'int32'
+    assert accumulator.value_sum[0].dtype == 'int16'
+    assert np.allclose(accumulator_mean, mean.reshape(-1), rtol=1e-6, equal_nan=True)
+
+
+def test_rolled_mean_and_std_equal_the_event_loop():
+    rng = np.random.default_rng(2)
+    nr_of_events = 40
+    start_cells = rng.integers(0, NRCELL, (nr_of_events, NRCHID))
+    data = rng.normal(100., 5., (nr_of_events, NRCHID, NRCELL))
+    accumulator = RolledMeanVarAccumulator()
+    add_blockwise(accumulator, start_cells, data, 8)
+
+    values = [[] for cell in range(NRCHID*NRCELL)]
+    for event_start_cells, event_data in zip(start_cells, data):
+        for chid in range(NRCHID):
+            cells = (event_start_cells[chid]+np.arange(NRCELL)) % NRCELL
+            for sample, cell in enumerate(cells):
+                values[chid*NRCELL+cell].append(event_data[chid, sample])
+    mean, std = accumulator.get_mean_and_std()
+
+    assert np.allclose(mean, [np.mean(cell_values) for cell_values in values])
+    assert np.allclose(std, [np.sqrt(np.sum(np.square(np.subtract(cell_values, np.mean(cell_values)))))
+                             / (len(cell_values)-1) for cell_values in values])
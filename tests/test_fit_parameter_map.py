@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from drs4Calibration.drs4Calibration_version_1.fitParameterMap import (
+    export_fit_parameter_map, FitParameterMap, fit_parameter_map_alignment)
+
+nr_of_chids = 3
+nr_of_cells = 8
+
+
+def write_fit_values(file_path, columns):
+    primary = fits.PrimaryHDU()
+    primary.header['IntNR'] = 2
+    primary.header['LowLimit'] = '2016-01-01 12'
+    table = fits.BinTableHDU.from_columns(columns, name='FitParameter')
+    fits.HDUList([primary, table]).writeto(file_path)
+
+
+def test_exported_map_contains_the_fit_values(tmp_path):
+    rng = np.random.default_rng(0)
+    nr_of_rows = nr_of_chids*nr_of_cells
+    baseline_slope = rng.normal(size=(nr_of_rows, 5)).astype('float32')
+    gain_offset = rng.normal(size=nr_of_rows).astype('float32')
+    write_fit_values(str(tmp_path/'fitValues.fits'), [
+        fits.Column(name='BaselineSlope', format='5E', unit='mV/celsius', array=baseline_slope),
+        fits.Column(name='GainOffset', format='E', unit='mV', array=gain_offset)])
+
+    map_file_path = str(tmp_path/'fitValues.map')
+    # copied in blocks of a few rows
+    export_fit_parameter_map(str(tmp_path/'fitValues.fits'), map_file_path,
+                             nr_of_cells=nr_of_cells, max_block_bytes=100)
+    fit_map = FitParameterMap(map_file_path)
+
+    assert set(fit_map.keys()) == {'BaselineSlope', 'GainOffset'}
+    assert fit_map.header['IntNR'] == 2
+    assert fit_map.header['LowLimit'] == '2016-01-01 12'
+    assert fit_map['BaselineSlope'].shape == (nr_of_chids, nr_of_cells, 5)
+    for array_info in fit_map.header['Arrays']:
+        assert array_info['Offset'] % fit_parameter_map_alignment == 0
+    assert np.array_equal(fit_map['BaselineSlope'].reshape(nr_of_rows, 5), baseline_slope)
+    assert np.array_equal(fit_map['GainOffset'].reshape(-1), gain_offset)
+    assert fit_map.get_values('BaselineSlope', 2, 5, 3) == baseline_slope[2*nr_of_cells+5, 3]
+    assert np.array_equal(fit_map.get_values('GainOffset', [0, 1], [7, 0]),
+                          gain_offset[[7, nr_of_cells]])
+
+
+def test_tables_not_matching_the_cells_are_rejected(tmp_path):
+    write_fit_values(str(tmp_path/'fitValues.fits'), [
+        fits.Column(name='GainOffset', format='E', array=np.zeros(nr_of_cells+1))])
+    with pytest.raises(Exception):
+        export_fit_parameter_map(str(tmp_path/'fitValues.fits'), str(tmp_path/'fitValues.map'),
+                                 nr_of_cells=nr_of_cells)
+
+    with open(str(tmp_path/'other.map'), 'wb') as other_file:
+        other_file.write(b'NOMAP'*10)
+    with pytest.raises(Exception):
+        FitParameterMap(str(tmp_path/'other.map'))
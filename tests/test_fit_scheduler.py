@@ -0,0 +1,83 @@
+import logging
+import pytest
+
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+from drs4Calibration.drs4Calibration_version_1.fitScheduler import (
+    get_fit_task_plan, get_fit_task_bytes, FitCheckpoint)
+
+
+@pytest.mark.parametrize('nr_of_values, chunk_width', [(NRTEMPSENSOR*9*300, 1200),
+                                                       (NRTEMPSENSOR*9*300, 1000),
+                                                       (NRTEMPSENSOR*9, 64)])
+def test_tasks_cover_the_values_of_every_sensor(nr_of_values, chunk_width):
+    plan = get_fit_task_plan(500, nr_of_values, chunk_width, 4, pow(2, 31), jobs=8)
+    values_per_sensor = nr_of_values//NRTEMPSENSOR
+
+    stop = 0
+    for sensor, start, task_stop in plan.tasks:
+        assert start == stop
+        assert sensor == start//values_per_sensor == (task_stop-1)//values_per_sensor
+        assert task_stop-start <= plan.task_width
+        # on the grid of the task width
+        assert start % plan.task_width == 0 or start % values_per_sensor == 0
+        stop = task_stop
+    assert stop == nr_of_values
+
+    if(plan.task_width >= chunk_width):
+        assert plan.task_width % chunk_width == 0
+    assert plan.jobs*plan.task_bytes <= plan.memory_budget
+    assert len(plan.tasks) >= plan.jobs
+
+
+def test_fewer_jobs_in_a_small_budget():
+    task_bytes = get_fit_task_bytes(1000, 100, 4)
+    plan = get_fit_task_plan(1000, NRTEMPSENSOR*100, 100, 4, 3*task_bytes, jobs=8)
+    assert plan.jobs == 3
+    assert plan.task_width == 100
+    assert plan.jobs*plan.task_bytes <= plan.memory_budget
+
+    with pytest.raises(Exception):
+        get_fit_task_plan(1000, NRTEMPSENSOR*100, 100, 4, task_bytes-1, jobs=8)
+    with pytest.raises(Exception):
+        get_fit_task_plan(1000, NRTEMPSENSOR*100+1, 100, 4, pow(2, 31), jobs=8)
+
+
+def test_workers_reading_their_values_need_less_memory():
+    assert get_fit_task_bytes(1000, 100, 4, worker_reads=True) < get_fit_task_bytes(1000, 100, 4)
+    plan = get_fit_task_plan(2000, NRTEMPSENSOR*2700, 1200, 4, pow(2, 28), jobs=4)
+    worker_plan = get_fit_task_plan(2000, NRTEMPSENSOR*2700, 1200, 4, pow(2, 28),
+                                    jobs=4, worker_reads=True)
+    assert worker_plan.task_width >= plan.task_width
+
+
+def test_checkpoint_resumes_the_finished_tasks_of_the_same_run(tmp_path):
+    checkpoint = FitCheckpoint(str(tmp_path), 'run 1')
+    assert not checkpoint.resumed
+    task_keys = [FitCheckpoint.get_task_key('Baseline', 1, start, start+10) for start in [0, 10]]
+    checkpoint.set_finished(task_keys)
+    # a crash while writing the next task key
+    with open(checkpoint.path, 'a') as checkpoint_file:
+        checkpoint_file.write('Baseline 1 20')
+
+    checkpoint = FitCheckpoint(str(tmp_path), 'run 1')
+    assert checkpoint.resumed
+    assert checkpoint.finished_tasks == set(task_keys)
+    assert checkpoint.is_finished(task_keys[1])
+    assert not checkpoint.is_finished('Baseline 1 20 30')
+
+    checkpoint = FitCheckpoint(str(tmp_path), 'run 2')
+    assert not checkpoint.resumed
+    assert not checkpoint.is_finished(task_keys[0])
+    checkpoint.remove()
+    assert not (tmp_path/'fitCheckpoint.txt').exists()
+
+
+def test_plan_and_resume_are_logged_not_printed(tmp_path, capsys, caplog):
+    caplog.set_level(logging.INFO)
+    get_fit_task_plan(500, NRTEMPSENSOR*9, 64, 4, pow(2, 31), jobs=2).report('Gain')
+    FitCheckpoint(str(tmp_path), 'run 1')
+    FitCheckpoint(str(tmp_path), 'run 1')
+
+    assert capsys.readouterr().out == ''
+    assert 'Fit plan Gain' in caplog.text
+    assert 'Resume with 0 finished fit tasks' in caplog.text
@@ -0,0 +1,121 @@
+import numpy as np
+import h5py
+import pytest
+
+from drs4Calibration.linearFit import calculate_linear_fit_sums, linear_fit_sum_names
+from drs4Calibration.h5pyTools import create_bit_packed_mask, write_bit_packed_mask
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+from drs4Calibration.drs4Calibration_version_1.fitStatistics import (
+    init_fit_statistics, add_rows_to_fit_statistics, read_fit_statistics,
+    store_cumulative_fit_sums, read_window_fit_sums, get_cumulative_fit_sums_bytes)
+
+nr_of_rows = 20
+nr_of_cells = 2*NRTEMPSENSOR
+values_per_std = 10
+cut_off_error_factor = 1.2
+
+
+@pytest.fixture
+def data_source(tmp_path):
+    rng = np.random.default_rng(0)
+    temperature = rng.uniform(15., 40., (nr_of_rows, NRTEMPSENSOR)).astype('float32')
+    sensors = np.arange(nr_of_cells)//2
+    baseline = (-0.5*temperature[:, sensors]+1000. +
+                rng.normal(0., 2., (nr_of_rows, nr_of_cells))).astype('float32')
+    baseline_std = rng.uniform(0.5, 1.5, (nr_of_rows, nr_of_cells//values_per_std)).astype('float16')
+    baseline_std[3, 5] = np.nan
+    gain = baseline.copy()
+    gain[rng.uniform(size=gain.shape) < 0.1] = 0.
+
+    with h5py.File(str(tmp_path/'source.h5'), 'w') as data_source:
+        data_source.create_dataset('Baseline', data=baseline, chunks=(1, 20))
+        data_source.create_dataset('BaselineStd', data=baseline_std)
+        data_source.create_dataset('TempBaseline', data=temperature)
+        data_source.create_dataset('Gain', data=gain, chunks=(1, 20))
+        data_source.create_dataset('TempGain', data=temperature)
+    with h5py.File(str(tmp_path/'source.h5'), 'r') as data_source:
+        yield data_source
+
+
+def get_statistics(tmp_path, data_source, drs_value_type, list_of_row_indices):
+    statistics_group = h5py.File(str(tmp_path/'statistics.h5'), 'w').create_group('Interval1')
+    init_fit_statistics(statistics_group, data_source, drs_value_type, cut_off_error_factor)
+    for row_indices in list_of_row_indices:
+        # small blocks over the cells
+        add_rows_to_fit_statistics(statistics_group, data_source, drs_value_type,
+                                   row_indices, max_block_bytes=len(row_indices)*8*60)
+    return statistics_group
+
+
+def test_statistics_equal_the_sums_of_the_selected_values(tmp_path, data_source):
+    row_indices = np.arange(nr_of_rows)
+    statistics_group = get_statistics(tmp_path, data_source, 'Baseline', [row_indices])
+
+    baseline = data_source['Baseline'][:]
+    baseline_std = data_source['BaselineStd'][:]
+    # like 'get_indice_mask'
+    std_limit = np.nanmean(baseline_std, axis=0, dtype='float64')*cut_off_error_factor
+    mask = np.repeat((baseline_std < std_limit) | np.isnan(baseline_std), values_per_std, axis=1)
+    sensors = np.arange(nr_of_cells)//(nr_of_cells//NRTEMPSENSOR)
+    sums = calculate_linear_fit_sums(data_source['TempBaseline'][:][:, sensors], baseline, mask)
+
+    assert not mask.all()
+    statistics = read_fit_statistics(statistics_group, 'Baseline')
+    for sum_name in linear_fit_sum_names:
+        assert np.allclose(statistics[sum_name], sums[sum_name], rtol=1e-10)
+    assert np.allclose(statistics_group['BaselineSumStd'][:],
+                       np.nansum(baseline_std, axis=0, dtype='float64'))
+    assert statistics_group['BaselineCountStd'][:].sum() == baseline_std.size-1
+
+
+def test_statistics_without_std_add_up(tmp_path, data_source):
+    statistics_group = get_statistics(tmp_path, data_source, 'Gain',
+                                      [np.arange(7), np.arange(7, nr_of_rows)])
+
+    gain = data_source['Gain'][:]
+    sensors = np.arange(nr_of_cells)//(nr_of_cells//NRTEMPSENSOR)
+    sums = calculate_linear_fit_sums(data_source['TempGain'][:][:, sensors], gain, gain != 0)
+
+    assert 'GainSumStd' not in statistics_group
+    statistics = read_fit_statistics(statistics_group, 'Gain')
+    for sum_name in linear_fit_sum_names:
+        assert np.allclose(statistics[sum_name], sums[sum_name], rtol=1e-10)
+
+
+@pytest.mark.parametrize('with_mask', [False, True])
+def test_window_sums_equal_the_sums_of_the_window_rows(tmp_path, data_source, with_mask):
+    rng = np.random.default_rng(1)
+    # source rows in time order, steps of 3 rows
+    row_indices = rng.permutation(nr_of_rows)
+    step_starts = np.arange(0, nr_of_rows, 3)
+    gain = data_source['Gain'][:]
+    temperature = data_source['TempGain'][:]
+    sensors = np.arange(nr_of_cells)//(nr_of_cells//NRTEMPSENSOR)
+
+    statistics_group = h5py.File(str(tmp_path/'statistics.h5'), 'w').create_group('Interval1')
+    mask = gain != 0
+    mask_source = None
+    mask_row_order = None
+    if with_mask:
+        # the mask rows in source row order
+        mask = rng.uniform(size=gain.shape) > 0.3
+        mask_source = create_bit_packed_mask(statistics_group, 'Mask', nr_of_rows, nr_of_cells)
+        write_bit_packed_mask(mask_source, mask)
+        mask_row_order = row_indices
+    store_cumulative_fit_sums(statistics_group, data_source, 'Gain', row_indices, step_starts,
+                              mask_source, mask_row_order, max_block_bytes=nr_of_rows*8*40)
+
+    first_steps = np.array([0, 2, 1, 6])
+    last_steps = np.array([7, 5, 2, 7])
+    window_sums = read_window_fit_sums(statistics_group, 'Gain', first_steps, last_steps)
+    step_stops = np.append(step_starts, nr_of_rows)
+    for window_nr, (first_step, last_step) in enumerate(zip(first_steps, last_steps)):
+        window_rows = row_indices[step_stops[first_step]:step_stops[last_step]]
+        sums = calculate_linear_fit_sums(temperature[window_rows][:, sensors],
+                                         gain[window_rows], mask[window_rows])
+        for sum_name in linear_fit_sum_names:
+            assert np.allclose(window_sums[sum_name][window_nr], sums[sum_name],
+                               rtol=1e-9, atol=1e-6)
+
+    assert get_cumulative_fit_sums_bytes(nr_of_rows, 3, nr_of_cells) == \
+        (len(step_starts)+1)*nr_of_cells*len(linear_fit_sum_names)*8
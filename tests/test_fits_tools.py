@@ -0,0 +1,67 @@
+import warnings
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from drs4Calibration.fitsTools import StreamingBinTableWriter, verify_checksums
+
+
+def get_columns(nr_of_rows):
+    rng = np.random.default_rng(0)
+    return [fits.Column(name='Slope', format='6E', unit='mV/celsius', dim='(3,2)',
+                        array=rng.normal(size=(nr_of_rows, 2, 3)).astype('float32')),
+            fits.Column(name='Offset', format='D', unit='mV',
+                        array=rng.normal(size=nr_of_rows)),
+            fits.Column(name='Cell', format='J', array=np.arange(nr_of_rows))]
+
+
+def write_table(file_path, columns, nr_of_rows, nr_of_rows_per_block):
+    primary = fits.PrimaryHDU()
+    primary.header['TELESCOP'] = 'FACT'
+    with StreamingBinTableWriter(file_path, primary.header, columns,
+                                 nr_of_rows, extname='FitParameter') as writer:
+        for block_start in range(0, nr_of_rows, nr_of_rows_per_block):
+            block = slice(block_start, min(block_start+nr_of_rows_per_block, nr_of_rows))
+            rows = writer.get_empty_rows(block.stop-block.start)
+            for column in columns:
+                rows[column.name] = column.array[block]
+            writer.write_rows(rows)
+
+
+def test_streamed_table_equals_the_astropy_table(tmp_path):
+    file_path = str(tmp_path/'fitValues.fits')
+    nr_of_rows = 1001
+    columns = get_columns(nr_of_rows)
+    write_table(file_path, columns, nr_of_rows, 300)
+
+    verify_checksums(file_path, max_block_bytes=3*2880)
+    with warnings.catch_warnings():
+        # astropy warns about wrong checksums
+        warnings.simplefilter('error')
+        with fits.open(file_path, checksum=True) as hdu_list:
+            assert hdu_list[0].header['TELESCOP'] == 'FACT'
+            table = hdu_list['FitParameter']
+            assert table.columns['Slope'].unit == 'mV/celsius'
+            for column in columns:
+                assert np.array_equal(table.data[column.name], column.array)
+
+    astropy_table = fits.BinTableHDU.from_columns(columns)
+    astropy_table.add_checksum()
+    with fits.open(file_path) as hdu_list:
+        assert hdu_list[1].header['DATASUM'] == astropy_table.header['DATASUM']
+
+
+def test_missing_rows_and_corrupted_files_are_rejected(tmp_path):
+    file_path = str(tmp_path/'fitValues.fits')
+    columns = get_columns(10)
+    with pytest.raises(Exception):
+        with StreamingBinTableWriter(file_path, fits.Header(), columns, 10) as writer:
+            writer.write_rows(writer.get_empty_rows(9))
+            writer.close()
+
+    write_table(file_path, columns, 10, 4)
+    with open(file_path, 'r+b') as fits_file:
+        fits_file.seek(2*2880+10)
+        fits_file.write(b'\x01')
+    with pytest.raises(Exception):
+        verify_checksums(file_path)
@@ -0,0 +1,169 @@
+import numpy as np
+import h5py
+import pytest
+
+from drs4Calibration.h5pyTools import (
+    H5pyTableAppender, get_nr_of_rows, read_h5py_rows,
+    get_encoded_dtype, set_encoding_attrs, encode_values,
+    create_bit_packed_mask, write_bit_packed_mask, read_bit_packed_mask,
+    ParallelChunkReader, get_chunk_encoding, compress_h5py_row,
+    compress_h5py_row_pieces, write_compressed_row)
+
+
+def create_table(file_path, nr_of_columns=3, chunk_rows=4):
+    with h5py.File(file_path, 'w') as h5py_table:
+        h5py_table.create_dataset('Values', shape=(0, nr_of_columns),
+                                  maxshape=(None, nr_of_columns),
+                                  dtype='float32', chunks=(chunk_rows, nr_of_columns))
+
+
+def test_appender_trims_the_datasets_on_close(tmp_path):
+    file_path = str(tmp_path/'table.h5')
+    create_table(file_path)
+
+    with h5py.File(file_path, 'r+') as h5py_table:
+        with H5pyTableAppender(h5py_table, ['Values'], max_nr_of_buffered_rows=1) as appender:
+            for row_nr in range(5):
+                appender.append({'Values': np.full(3, row_nr)})
+            assert len(h5py_table['Values']) == 8
+            assert get_nr_of_rows(h5py_table['Values']) == 5
+
+    with h5py.File(file_path, 'r') as h5py_table:
+        assert h5py_table['Values'].shape == (5, 3)
+        assert 'NrOfRows' not in h5py_table['Values'].attrs
+        assert h5py_table['Values'][:, 0].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_appender_trims_the_padding_of_a_not_closed_appender(tmp_path):
+    file_path = str(tmp_path/'table.h5')
+    create_table(file_path)
+
+    with h5py.File(file_path, 'r+') as h5py_table:
+        appender = H5pyTableAppender(h5py_table, ['Values'], max_nr_of_buffered_rows=1)
+        for row_nr in range(5):
+            appender.append({'Values': np.full(3, row_nr)})
+        # crash, the appender is not closed
+
+    with h5py.File(file_path, 'r+') as h5py_table:
+        assert len(h5py_table['Values']) == 8
+        assert get_nr_of_rows(h5py_table['Values']) == 5
+        with H5pyTableAppender(h5py_table, ['Values']) as appender:
+            assert len(h5py_table['Values']) == 5
+            appender.append({'Values': np.full(3, 5)})
+
+    with h5py.File(file_path, 'r') as h5py_table:
+        assert h5py_table['Values'][:, 0].tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_read_rows_equal_the_point_selection(tmp_path):
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(100, 30)).astype('float32')
+    with h5py.File(str(tmp_path/'table.h5'), 'w') as h5py_table:
+        dataset = h5py_table.create_dataset('Values', data=values, chunks=(8, 10),
+                                            compression='gzip', shuffle=True, fletcher32=True)
+        # unsorted, with gaps inside and between the chunks
+        row_indices = np.array([57, 3, 4, 5, 99, 10, 0, 31, 32, 58, 80])
+
+        assert np.array_equal(read_h5py_rows(dataset, row_indices), values[row_indices])
+        assert np.array_equal(read_h5py_rows(dataset, row_indices, slice(5, 17)),
+                              values[row_indices, 5:17])
+        assert np.array_equal(read_h5py_rows(dataset, row_indices, 12), values[row_indices, 12])
+        assert read_h5py_rows(dataset, []).shape == (0, 30)
+
+
+def test_encoded_columns_are_decoded_on_read(tmp_path):
+    rng = np.random.default_rng(1)
+    values_per_reference = 6
+    values = rng.normal(2000., 20., (10, 60)).astype('float32')
+    values[2, 7] = np.nan
+    encodings = [('float16',), ('quantized', 0.01), ('scaled_int16', 1/64)]
+    max_errors = [2100.*pow(2, -11), 0.01, 1/128]
+
+    with h5py.File(str(tmp_path/'table.h5'), 'w') as h5py_table:
+        for encoding, max_error in zip(encodings, max_errors):
+            reference_name = None
+            rows = [encode_values(row, encoding, values_per_reference) for row in values]
+            dataset = h5py_table.create_dataset(
+                        encoding[0], data=np.array([stored for stored, reference in rows]),
+                        dtype=get_encoded_dtype('float32', encoding))
+            if(encoding[0] == 'scaled_int16'):
+                reference_name = encoding[0]+'Reference'
+                h5py_table.create_dataset(reference_name,
+                                          data=np.array([reference for stored, reference in rows]))
+            set_encoding_attrs(dataset, encoding, 'float32', reference_name, values_per_reference)
+
+            row_indices = [7, 2, 3]
+            decoded_values = read_h5py_rows(dataset, row_indices)
+            assert decoded_values.dtype == 'float32'
+            assert np.array_equal(np.isnan(decoded_values), np.isnan(values[row_indices]))
+            assert np.nanmax(np.abs(decoded_values-values[row_indices])) <= max_error*(1+1e-3)
+            assert np.allclose(read_h5py_rows(dataset, row_indices, slice(10, 25)),
+                               decoded_values[:, 10:25], equal_nan=True)
+
+
+def test_bit_packed_mask_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    mask = rng.uniform(size=(13, 50)) > 0.5
+    with h5py.File(str(tmp_path/'mask.h5'), 'w') as h5py_group:
+        dataset = create_bit_packed_mask(h5py_group, 'Mask', 13, 50, max_chunk_bytes=32)
+        assert dataset.shape == (2, 50)
+        # written and read in column blocks
+        for block_start in range(0, 50, 16):
+            block = slice(block_start, min(block_start+16, 50))
+            write_bit_packed_mask(dataset, mask[:, block], block)
+
+        assert np.array_equal(read_bit_packed_mask(dataset), mask)
+        assert np.array_equal(read_bit_packed_mask(dataset, slice(20, 30)), mask[:, 20:30])
+        assert np.array_equal(read_bit_packed_mask(dataset, 7), mask[:, 7])
+
+
+def create_row_table(h5py_table, nr_of_columns=1000, chunk_width=128):
+    return h5py_table.create_dataset('Values', shape=(0, nr_of_columns),
+                                     maxshape=(None, nr_of_columns), dtype='float32',
+                                     chunks=(1, chunk_width), compression='gzip',
+                                     shuffle=True, fletcher32=True, fillvalue=np.nan)
+
+
+def test_compressed_rows_are_read_like_written_rows(tmp_path):
+    rng = np.random.default_rng(3)
+    values = rng.normal(500., 10., (3, 1000)).astype('float32')
+    with h5py.File(str(tmp_path/'table.h5'), 'w') as h5py_table:
+        dataset = create_row_table(h5py_table)
+        chunk_encoding = get_chunk_encoding(dataset)
+        assert chunk_encoding is not None
+
+        # pieces not aligned to the chunk width
+        piece_bounds = [0, 50, 51, 300, 999, 1000]
+        row_pieces = [values[1, start:stop] for start, stop in zip(piece_bounds, piece_bounds[1:])]
+        with H5pyTableAppender(h5py_table, ['Values']) as appender:
+            appender.append({'Values': compress_h5py_row(values[0], chunk_encoding)})
+            appender.append({'Values': compress_h5py_row_pieces(row_pieces, chunk_encoding)})
+            appender.append({'Values': values[2]})
+
+        assert np.array_equal(dataset[:], values)
+        reader = ParallelChunkReader(dataset)
+        assert reader.is_supported
+        assert np.array_equal(reader[:], values)
+        assert np.array_equal(reader[1, 100:900], values[1, 100:900])
+
+        # overwrite a row in place
+        write_compressed_row(dataset, 2, compress_h5py_row(values[0], chunk_encoding))
+        assert np.array_equal(dataset[2], values[0])
+
+
+def test_corrupted_chunks_fail_the_checksum(tmp_path):
+    values = np.arange(1000, dtype='float32')
+    with h5py.File(str(tmp_path/'table.h5'), 'w') as h5py_table:
+        dataset = create_row_table(h5py_table)
+        dataset.resize(1, axis=0)
+        compressed_row = compress_h5py_row(values, get_chunk_encoding(dataset))
+        column_offset, data = compressed_row.chunks[1]
+        corrupted_data = bytearray(data)
+        corrupted_data[5] ^= 0xff
+        compressed_row.chunks[1] = (column_offset, bytes(corrupted_data))
+        write_compressed_row(dataset, 0, compressed_row)
+
+        reader = ParallelChunkReader(dataset)
+        assert np.array_equal(reader[0, :128], values[:128])
+        with pytest.raises(Exception):
+            reader[0, 128:256]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from drs4Calibration.linearFit import calculate_linear_fit_values
+from drs4Calibration.drs4Calibration_version_1.drs4Calibration_rawDataBased import get_indice_mask
+
+
+def test_unsampled_start_cell_is_masked_out():
+    temperature = np.linspace(20., 30., 10)
+    # two cells with the baseline 2*T + 100
+    baseline = np.repeat((2*temperature+100.)[:, None], 2, axis=1).astype('float32')
+    baseline_std = np.full(baseline.shape, 0.5, dtype='float16')
+
+    # start cell of the first cell not sampled in one run: neither mean nor std
+    baseline[3, 0] = np.nan
+    baseline_std[3, 0] = np.nan
+    # start cell of the second cell sampled just once: mean, but no std
+    baseline_std[5, 1] = np.nan
+
+    mask = get_indice_mask(baseline, baseline_std, 2.)
+
+    assert not mask[3, 0]
+    assert mask[5, 1]
+    assert np.count_nonzero(mask) == baseline.size-1
+
+    slope, offset, residual_mean = calculate_linear_fit_values(temperature, baseline, mask)
+    assert np.allclose(slope, 2., atol=1e-4)
+    assert np.allclose(offset, 100., atol=1e-2)
+    assert np.all(np.isfinite(residual_mean))
+
+
+def test_values_with_large_std_are_masked_out():
+    baseline = np.full((4, 1), 100., dtype='float32')
+    baseline_std = np.array([[1.], [1.], [1.], [9.]], dtype='float16')
+
+    mask = get_indice_mask(baseline, baseline_std, 2.)
+
+    assert mask[:, 0].tolist() == [True, True, True, False]
+
+
+def test_mean_std_of_long_intervals_does_not_overflow():
+    # the float16 sum of 3000 std values of 20 is larger than 65504
+    baseline = np.full((3000, 2), 100., dtype='float32')
+    baseline_std = np.full(baseline.shape, 20., dtype='float16')
+    baseline_std[0, :] = 100.
+    baseline_std[1, 1] = np.nan
+
+    mask = get_indice_mask(baseline, baseline_std, 2.)
+
+    assert not mask[0].any()
+    assert np.count_nonzero(mask) == baseline.size-2
+
+
+def test_mean_std_of_long_intervals_with_missing_std():
+    # a block of cells, the float16 sums over the rows are about 5 % too low
+    rng = np.random.default_rng(0)
+    baseline_std = rng.normal(12., 3., (5000, 300)).astype('float16')
+    baseline_std[rng.uniform(size=baseline_std.shape) < 0.4] = np.nan
+    baseline = np.full(baseline_std.shape, 100., dtype='float32')
+
+    mask = get_indice_mask(baseline, baseline_std, 1.)
+
+    limit = np.nanmean(baseline_std.astype('float64'), axis=0)
+    expected_mask = np.isnan(baseline_std) | (baseline_std < limit[None, :])
+    assert np.array_equal(mask, expected_mask)
+
+
+def test_one_std_per_start_cell_masks_all_its_samples():
+    # two start cells with three ROI-samples each
+    baseline = np.full((4, 6), 100., dtype='float32')
+    baseline_std = np.array([[1., 1.], [1., 1.], [1., np.nan], [9., 1.]], dtype='float16')
+    baseline[1, 3:] = np.nan
+    baseline_std[1, 1] = np.nan
+
+    mask = get_indice_mask(baseline, baseline_std, 2.)
+
+    assert mask.shape == baseline.shape
+    assert not mask[3, :3].any()
+    assert mask[2, 3:].all()
+    assert not mask[1, 3:].any()
+    assert np.count_nonzero(mask) == baseline.size-6
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.stats import linregress
+
+from drs4Calibration.linearFit import (
+    calculate_linear_fit_values, calculate_linear_fit_sums,
+    calculate_linear_fit_values_from_sums)
+
+
+def get_drs_values(nr_of_values=50, nr_of_cells=700, seed=0):
+    rng = np.random.default_rng(seed)
+    temperature = rng.uniform(15., 40., nr_of_values)
+    slope = rng.normal(-0.5, 0.2, nr_of_cells)
+    offset = rng.normal(1000., 50., nr_of_cells)
+    drs_value_array = (slope*temperature[:, None]+offset +
+                       rng.normal(0., 2., (nr_of_values, nr_of_cells))).astype('float32')
+    mask = rng.uniform(size=drs_value_array.shape) > 0.2
+    return temperature, drs_value_array, mask
+
+
+def test_fit_values_equal_linregress_per_cell():
+    temperature, drs_value_array, mask = get_drs_values()
+
+    slope, offset, residual_mean = calculate_linear_fit_values(
+                                        temperature, drs_value_array, mask,
+                                        nr_of_cells_per_block=128)
+
+    for cell in range(drs_value_array.shape[1]):
+        cell_mask = mask[:, cell]
+        cell_temperature = temperature[cell_mask]
+        cell_values = drs_value_array[cell_mask, cell].astype('float64')
+        fit = linregress(cell_temperature, cell_values)
+        residual = np.abs(cell_values-(fit.slope*cell_temperature+fit.intercept))
+        assert np.isclose(slope[cell], fit.slope, rtol=1e-10)
+        assert np.isclose(offset[cell], fit.intercept, rtol=1e-10)
+        assert np.isclose(residual_mean[cell], np.mean(residual), rtol=1e-8)
+
+
+def test_fit_values_without_mask_equal_linregress():
+    temperature, drs_value_array, mask = get_drs_values(nr_of_cells=20)
+
+    slope, offset, residual_mean = calculate_linear_fit_values(temperature, drs_value_array)
+
+    for cell in range(drs_value_array.shape[1]):
+        fit = linregress(temperature, drs_value_array[:, cell].astype('float64'))
+        assert np.isclose(slope[cell], fit.slope, rtol=1e-10)
+        assert np.isclose(offset[cell], fit.intercept, rtol=1e-10)
+
+
+def test_cells_without_enough_values_are_nan():
+    temperature = np.array([20., 25., 30.])
+    drs_value_array = np.ones((3, 3), dtype='float32')
+    mask = np.array([[True, True, True],
+                     [False, True, True],
+                     [False, False, True]])
+    drs_value_array[:, 1] = [1., 2., 3.]
+    temperature_without_variation = np.full(3, 20.)
+
+    slope, offset, residual_mean = calculate_linear_fit_values(temperature, drs_value_array, mask)
+    assert np.isnan(slope[0]) and np.isnan(offset[0]) and np.isnan(residual_mean[0])
+    assert np.isclose(slope[1], 0.2) and np.isclose(residual_mean[1], 0.)
+    assert np.isclose(slope[2], 0.) and np.isclose(offset[2], 1.)
+
+    slope, offset, residual_mean = calculate_linear_fit_values(
+                                        temperature_without_variation, drs_value_array)
+    assert np.isnan(slope).all()
+
+
+def test_added_sums_give_the_fit_values():
+    temperature, drs_value_array, mask = get_drs_values()
+    slope, offset, residual_mean = calculate_linear_fit_values(temperature, drs_value_array, mask)
+
+    # the sums of disjoint row sets just add up
+    first_sums = calculate_linear_fit_sums(temperature[:20], drs_value_array[:20], mask[:20])
+    second_sums = calculate_linear_fit_sums(temperature[20:], drs_value_array[20:], mask[20:])
+    sums = {sum_name: first_sums[sum_name]+second_sums[sum_name] for sum_name in first_sums}
+    sums_slope, sums_offset, residual_rms = calculate_linear_fit_values_from_sums(sums)
+
+    assert np.allclose(sums_slope, slope, rtol=1e-8)
+    assert np.allclose(sums_offset, offset, rtol=1e-8)
+    assert np.all(residual_rms >= residual_mean*(1-1e-8))
@@ -0,0 +1,52 @@
+import numpy as np
+import h5py
+
+from drs4Calibration.drs4Calibration_version_1.config import data_collection_config
+from drs4Calibration.drs4Calibration_version_1.drs4Calibration_rawDataBased import (
+    init_empty_h5_table, get_run_serie_appenders, store_run_serie_result,
+    load_run_serie_manifest)
+
+column_names = data_collection_config.column_names
+column_length = {column_name: 4 for column_name in column_names}
+
+
+def get_result(value):
+    return {column_name: np.full(column_length[column_name], value)
+            for column_name in column_names}
+
+
+def store_results(store_file_path, run_serie_results):
+    with h5py.File(store_file_path, 'r+') as h5py_table:
+        table_appender, manifest_appender = get_run_serie_appenders(h5py_table, column_names)
+        for run_serie, signature, row, result in run_serie_results:
+            store_run_serie_result(table_appender, manifest_appender, column_names,
+                                   run_serie, signature, row, result)
+        manifest_appender.close()
+        table_appender.close()
+
+
+def test_failed_rehandle_invalidates_the_stored_row(tmp_path):
+    store_file_path = str(tmp_path/'dataCollection.h5')
+    init_empty_h5_table(store_file_path, column_names,
+                        data_collection_config.column_dtype, column_length)
+    run_series = [['a0', 'a1', 'a2'], ['b0', 'b1', 'b2']]
+    store_results(store_file_path, [(run_serie, np.zeros(6), -1, get_result(value))
+                                    for value, run_serie in enumerate(run_series, start=1)])
+
+    run_serie_manifest = load_run_serie_manifest(store_file_path, column_names)
+    row, signature = run_serie_manifest['a0,a1,a2']
+    # the files of the first run serie changed, but can not be handled anymore
+    store_results(store_file_path, [(run_series[0], np.ones(6), row, {})])
+
+    with h5py.File(store_file_path, 'r') as store:
+        assert np.isnan(store['TimeBaseline'][row]).all()
+        assert np.isnan(store['TimeGain'][row]).all()
+        assert store['TimeGain'][1].tolist() == [2., 2., 2., 2.]
+    run_serie_manifest = load_run_serie_manifest(store_file_path, column_names)
+    assert run_serie_manifest['a0,a1,a2'][0] == row
+
+    # a later result overwrites the invalidated row
+    store_results(store_file_path, [(run_series[0], np.full(6, 2.), row, get_result(3))])
+    with h5py.File(store_file_path, 'r') as store:
+        assert len(store['TimeGain']) == 2
+        assert store['TimeGain'][row].tolist() == [3., 3., 3., 3.]
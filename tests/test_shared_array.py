@@ -0,0 +1,50 @@
+import numpy as np
+from joblib import Parallel, delayed
+
+from drs4Calibration.sharedArray import SharedArray, ScratchArray
+
+
+def write_slice(array_slice, value):
+    array_slice.write(np.full(array_slice.stop-array_slice.start, value))
+
+
+def write_in_workers(array, bounds):
+    Parallel(n_jobs=2)(delayed(write_slice)(array.get_slice(start, stop), slice_nr)
+                       for slice_nr, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])))
+
+
+def test_shared_array_slices_are_written_by_the_workers():
+    array = SharedArray(100, 'float32', np.nan)
+    try:
+        write_in_workers(array, [0, 10, 55, 90])
+        assert array.array.dtype == 'float32'
+        assert np.array_equal(array.array, np.concatenate([np.full(10, 0.), np.full(45, 1.),
+                                                           np.full(35, 2.), np.full(10, np.nan)]),
+                              equal_nan=True)
+    finally:
+        array.release()
+
+
+def test_scratch_array_is_resumed(tmp_path):
+    path = str(tmp_path/'result.dat')
+    array = ScratchArray(path, 100, 'float32', np.nan)
+    write_in_workers(array, [0, 10, 55])
+    array.release()
+
+    array = ScratchArray(path, 100, 'float32', np.nan, resume=True)
+    assert array.resumed
+    assert np.array_equal(array.array[:55], np.repeat([0., 1.], [10, 45]))
+    assert np.isnan(array.array[55:]).all()
+    # changes of the array are not written back
+    array.array[:] = 5.
+    array.release()
+
+    array = ScratchArray(path, 100, 'float32', resume=True)
+    assert array.array[0] == 0.
+    array.release(remove=True)
+
+    # other size, a new array
+    array = ScratchArray(path, 50, 'float32', 0., resume=True)
+    assert not array.resumed
+    assert np.array_equal(array.array, np.zeros(50))
+    array.release(remove=True)
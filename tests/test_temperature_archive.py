@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+from astropy.io import fits
+from click.testing import CliRunner
+
+from drs4Calibration.temperatureArchive import (
+    store_temperature_archive, TemperatureArchive, datetime_to_aux_time)
+from drs4Calibration.drs4Calibration_version_1.constants import NRTEMPSENSOR
+from drs4Calibration.drs4Calibration_version_1.drs4Calibration_rawDataBased import (
+    get_mean_of_temp_and_time, get_mean_of_temp_and_time_from_archive)
+
+nights = ['20160101', '20160102']
+
+
+def write_temperature_file(file_path, night, nr_of_entries, seed):
+    rng = np.random.default_rng(seed)
+    night_begin = datetime_to_aux_time([pd.Timestamp(night)+pd.Timedelta(hours=20)])[0]
+    # one entry about every minute, not sorted
+    table_time = night_begin+np.sort(rng.uniform(0., 0.4, nr_of_entries))
+    table_time[[3, 4]] = table_time[[4, 3]]
+    table_temperature = rng.normal(25., 3., (nr_of_entries, NRTEMPSENSOR))
+    fits.BinTableHDU.from_columns([
+        fits.Column(name='Time', format='D', array=table_time),
+        fits.Column(name='temp', format=str(NRTEMPSENSOR)+'E', array=table_temperature)
+    ]).writeto(file_path)
+
+
+@pytest.fixture
+def aux_folder(tmp_path):
+    aux_folder_path = tmp_path/'aux'
+    aux_folder_path.mkdir()
+    for night_nr, night in enumerate(nights):
+        write_temperature_file(str(aux_folder_path/(night+'.FAD_CONTROL_TEMPERATURE.fits')),
+                               night, 500, night_nr)
+    return aux_folder_path
+
+
+@pytest.fixture
+def archive_path(tmp_path, aux_folder):
+    archive_path = str(tmp_path/'temperatureArchive.h5')
+    result = CliRunner().invoke(store_temperature_archive, [str(aux_folder), archive_path])
+    assert result.exit_code == 0, result.output
+    return archive_path
+
+
+def get_run_duration(night, begin_minutes, duration_minutes):
+    run_begin = pd.Timestamp(night)+pd.Timedelta(hours=20, minutes=begin_minutes)
+    return [run_begin, run_begin+pd.Timedelta(minutes=duration_minutes)]
+
+
+def test_archive_contains_all_nights_sorted(archive_path):
+    with TemperatureArchive(archive_path) as temperature_archive:
+        assert temperature_archive.night.tolist() == [int(night) for night in nights]
+        assert temperature_archive.night_offset.tolist() == [0, 500, 1000]
+        assert np.all(np.diff(temperature_archive.time) > 0)
+        assert temperature_archive.temperature.shape == (1000, NRTEMPSENSOR)
+
+
+@pytest.mark.parametrize('night_nr', [0, 1])
+def test_window_means_equal_the_search_in_the_temperature_file(aux_folder, archive_path, night_nr):
+    night = nights[night_nr]
+    temperature_file_path = str(aux_folder/(night+'.FAD_CONTROL_TEMPERATURE.fits'))
+    run_duration = [get_run_duration(night, 30, 5), get_run_duration(night, 100, 12),
+                     get_run_duration(night, 101, 0.5)]
+
+    expected = get_mean_of_temp_and_time(temperature_file_path, run_duration)
+    temp_time_collection = get_mean_of_temp_and_time_from_archive(archive_path, run_duration)
+
+    for run_name in expected:
+        assert np.allclose(temp_time_collection[run_name]['temperature'],
+                           expected[run_name]['temperature'], rtol=1e-5)
+        # the file search sums up the times in float32, a few float32 steps apart
+        assert np.isclose(temp_time_collection[run_name]['time'],
+                          expected[run_name]['time'], rtol=0., atol=4*np.spacing(np.float32(17000.)))
+
+
+def test_windows_crossing_the_night_are_rejected(archive_path):
+    with TemperatureArchive(archive_path) as temperature_archive:
+        with pytest.raises(Exception):
+            temperature_archive.get_window_means([[pd.Timestamp(nights[0]),
+                                                   pd.Timestamp(nights[1])+pd.Timedelta(hours=21)]])
+        with pytest.raises(Exception):
+            temperature_archive.get_window_means([get_run_duration('20150101', 0, 5)])
+
+
+class CountingDataset:
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.dtype = dataset.dtype
+        self.nr_of_reads = 0
+
+    def __getitem__(self, selection):
+        self.nr_of_reads += 1
+        return self.dataset[selection]
+
+
+def test_a_batch_of_windows_is_read_at_once(archive_path):
+    time_windows = [get_run_duration(nights[0], begin_minutes, 3)
+                    for begin_minutes in [200, 10, 100, 20, 300]]
+    with TemperatureArchive(archive_path) as temperature_archive:
+        lower_index, upper_index = temperature_archive.get_window_indices(time_windows)
+        temperature = temperature_archive.temperature[:]
+        temperature_archive.temperature = CountingDataset(temperature_archive.temperature)
+
+        time_mean, temperature_mean = temperature_archive.get_window_means(time_windows)
+        assert temperature_archive.temperature.nr_of_reads == 1
+
+        # smaller reads of the neighbouring windows give the same means
+        small_time_mean, small_temperature_mean = temperature_archive.get_window_means(
+                                                    time_windows, max_read_bytes=200*NRTEMPSENSOR*4)
+        assert temperature_archive.temperature.nr_of_reads > 2
+
+    for window_nr, (lower, upper) in enumerate(zip(lower_index, upper_index)):
+        assert np.allclose(temperature_mean[window_nr],
+                           np.mean(temperature[lower:upper+1], axis=0, dtype='float64'), rtol=1e-6)
+    assert np.allclose(small_temperature_mean, temperature_mean, rtol=1e-6)
+    assert np.allclose(small_time_mean, time_mean, rtol=0., atol=1e-9)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from drs4Calibration.drs4Calibration_version_1.constants import ADCCOUNTSTOMILIVOLT
+from drs4Calibration.drs4Calibration_version_1.temperatureCalibration import (
+    TemperatureCalibration, ModelCache)
+
+nr_of_chids = 8
+nr_of_cells = 16
+nr_of_patches = 4
+roi = 10
+
+
+def get_fit_parameter(seed=0):
+    rng = np.random.default_rng(seed)
+    return {'BaselineSlope': rng.normal(-0.5, 0.1, (nr_of_chids, nr_of_cells, roi)).astype('float32'),
+            'BaselineOffset': rng.normal(1000., 20., (nr_of_chids, nr_of_cells, roi)).astype('float32'),
+            'GainSlope': rng.normal(0.001, 0.0002, (nr_of_chids, nr_of_cells, 1)).astype('float32'),
+            'GainOffset': rng.normal(1., 0.05, (nr_of_chids, nr_of_cells, 1)).astype('float32')}
+
+
+def get_events(nr_of_events, event_roi, seed=1):
+    rng = np.random.default_rng(seed)
+    data = rng.integers(500, 1500, (nr_of_events, nr_of_chids*event_roi)).astype('int16')
+    start_cells = rng.integers(0, nr_of_cells, (nr_of_events, nr_of_chids)).astype('int16')
+    patch_temperature = rng.uniform(20., 30., (nr_of_events, nr_of_patches))
+    return data, start_cells, patch_temperature
+
+
+def calibrate_per_sample(fit_parameter, data, start_cells, patch_temperature):
+    nr_of_events = len(start_cells)
+    data = data.reshape(nr_of_events, nr_of_chids, -1)
+    calibrated = np.empty(data.shape)
+    for event in range(nr_of_events):
+        for chid in range(nr_of_chids):
+            temperature = patch_temperature[event, chid//(nr_of_chids//nr_of_patches)]
+            start_cell = start_cells[event, chid]
+            for sample in range(data.shape[2]):
+                cell = (start_cell+sample) % nr_of_cells
+                baseline = (fit_parameter['BaselineSlope'][chid, start_cell, sample]*temperature +
+                            fit_parameter['BaselineOffset'][chid, start_cell, sample])
+                gain = (fit_parameter['GainSlope'][chid, cell, 0]*temperature +
+                        fit_parameter['GainOffset'][chid, cell, 0])
+                calibrated[event, chid, sample] = ((data[event, chid, sample]-baseline) /
+                                                   gain*ADCCOUNTSTOMILIVOLT)
+    return calibrated
+
+
+@pytest.mark.parametrize('event_roi', [roi, 7])
+def test_calibration_equals_the_sample_loop(event_roi):
+    fit_parameter = get_fit_parameter()
+    data, start_cells, patch_temperature = get_events(5, event_roi)
+    temperature_calibration = TemperatureCalibration(fit_parameter)
+
+    calibrated = temperature_calibration.calibrate(data, start_cells, patch_temperature)
+    assert calibrated.dtype == 'float32'
+    assert calibrated.shape == (5, nr_of_chids, event_roi)
+    assert np.allclose(calibrated, calibrate_per_sample(fit_parameter, data, start_cells,
+                                                        patch_temperature), rtol=1e-4, atol=1e-2)
+
+    # one temperature for all events
+    calibrated = temperature_calibration.calibrate(data, start_cells, patch_temperature[0])
+    assert np.allclose(calibrated, calibrate_per_sample(
+                                        fit_parameter, data, start_cells,
+                                        np.tile(patch_temperature[0], (5, 1))),
+                       rtol=1e-4, atol=1e-2)
+
+
+def test_invalid_start_cells_and_long_rois_are_rejected():
+    fit_parameter = get_fit_parameter()
+    data, start_cells, patch_temperature = get_events(3, roi)
+    start_cells[1, 2] = -1
+    temperature_calibration = TemperatureCalibration(fit_parameter)
+
+    calibrated = temperature_calibration.calibrate(data, start_cells, patch_temperature)
+    assert np.isnan(calibrated[1, 2]).all()
+    assert np.isfinite(np.delete(calibrated.reshape(-1, roi), 1*nr_of_chids+2, axis=0)).all()
+
+    data, start_cells, patch_temperature = get_events(3, roi+1)
+    with pytest.raises(Exception):
+        temperature_calibration.calibrate(data, start_cells, patch_temperature)
+
+
+def test_cached_patch_models_equal_the_quantized_temperatures():
+    fit_parameter = get_fit_parameter()
+    data, start_cells, patch_temperature = get_events(20, roi)
+    # a few temperature steps per patch
+    rng = np.random.default_rng(2)
+    patch_temperature = np.round(patch_temperature)+rng.uniform(-0.1, 0.1, (20, 1))
+    temperature_calibration = TemperatureCalibration(fit_parameter, temperature_resolution=0.5)
+
+    calibrated = temperature_calibration.calibrate(data, start_cells, patch_temperature)
+    quantized_temperature = np.round(patch_temperature/0.5)*0.5
+    assert np.allclose(calibrated, calibrate_per_sample(fit_parameter, data, start_cells,
+                                                        quantized_temperature), rtol=1e-4, atol=1e-2)
+
+    model_cache = temperature_calibration.model_cache
+    nr_of_models = sum(len(np.unique(quantized_temperature[:, patch_nr]))
+                       for patch_nr in range(nr_of_patches))
+    assert model_cache.nr_of_misses == len(model_cache.models) == nr_of_models
+    assert model_cache.nr_of_hits == 0
+
+    # the next block uses the cached models
+    temperature_calibration.calibrate(data[:5], start_cells[:5], patch_temperature[:5])
+    assert model_cache.nr_of_misses == nr_of_models
+    assert model_cache.nr_of_hits > 0
+
+
+def test_model_cache_drops_the_least_recently_used_models():
+    model_cache = ModelCache(max_bytes=3*400)
+    for key in [0, 1, 2, 0, 3]:
+        model_cache.get(key, lambda: (np.zeros(100, dtype='float32'),), 400)
+    assert list(model_cache.models) == [2, 0, 3]
+    assert model_cache.nr_of_bytes == 3*400
+    assert model_cache.nr_of_hits == 1
+
+    # too large models are not cached
+    model = model_cache.get(4, lambda: (np.zeros(1000, dtype='float32'),), 4000)
+    assert len(model[0]) == 1000
+    assert 4 not in model_cache.models